@@ -0,0 +1,73 @@
+"""
+Compares the memory held per turn by the ways gptty materialises the output file: the list of raw lines split
+into fields (as `get_context` used to), a pandas df of object columns (as the chat loop used to) and the
+columnar `History`.
+
+Usage:
+    python benchmarks/history_memory.py [--turns 1000000] [--tags 200]
+"""
+
+import argparse
+import gc
+import os
+import random
+import tempfile
+import tracemalloc
+
+import pandas as pd
+
+from gptty.history import History
+
+
+def write_log(path, turns, tags):
+    random.seed(0)
+    words = ['context', 'capital', 'australia', 'canberra', 'founded', 'population', 'river', 'mayor', 'city', 'history']
+    with open(path, 'w') as f:
+        for i in range(turns):
+            question = ' '.join(random.choices(words, k=8))
+            response = ' '.join(random.choices(words, k=30))
+            f.write(f"2023-03-29 17:{(i // 60) % 60:02d}:{i % 60:02d}|tag{i % tags}|{question}|{response}\n")
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--turns', type=int, default=1000000)
+    parser.add_argument('--tags', type=int, default=200)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        write_log(path, args.turns, args.tags)
+
+        def split_lines():
+            with open(path, 'r') as f:
+                return [[item.strip() for item in row.split('|')] for row in f.read().strip().split('\n')]
+
+        def dataframe():
+            df = pd.read_csv(path, header=None, sep='|').fillna('')
+            df.columns = ['timestamp','tag','question','response']
+            return df
+
+        for name, build in [('split lines', split_lines), ('pandas df', dataframe), ('History', lambda: History.from_file(path))]:
+            obj, size = measure(build)
+            if isinstance(obj, pd.DataFrame):
+                size = max(size, obj.memory_usage(deep=True).sum())
+            print(f"{name:>12}: {size / args.turns:8.1f} bytes per turn ({size / 2**20:.1f} MiB for {args.turns} turns)")
+            del obj
+
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
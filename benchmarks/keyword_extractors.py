@@ -0,0 +1,41 @@
+"""
+Compares the keyword extractors in `gptty.context.KEYWORD_EXTRACTORS` on the tags of an output file: the time
+taken to rank each tag's phrases, and the overlap of the top phrases with those of the default 'textblob' extractor.
+
+Usage:
+    python benchmarks/keyword_extractors.py [--output_file output.txt] [--top 20]
+"""
+
+import argparse
+import time
+
+from gptty.context import KEYWORD_EXTRACTORS, get_tag_turns, join_turns, return_most_common_phrases
+from gptty.history import History
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output_file', default='output.txt')
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    tags = [tag for tag in History.from_file(args.output_file).tags if len(tag) > 0]
+    texts = [join_turns(get_tag_turns(tag, args.output_file)) for tag in tags]
+    print(f"{len(tags)} tags, {sum(len(text.split()) for text in texts)} words")
+
+    # warm up the TextBlob tagger and the stopword cache so they aren't counted against the first extractor
+    return_most_common_phrases("The quick brown fox jumps over the lazy dog.")
+
+    rankings = {}
+    for extractor in KEYWORD_EXTRACTORS:
+        return_most_common_phrases.cache_clear()
+        start_time = time.perf_counter()
+        rankings[extractor] = [return_most_common_phrases(text, extractor=extractor)[:args.top] for text in texts]
+        elapsed = time.perf_counter() - start_time
+
+        overlaps = [len(set(a) & set(b)) / max(1, len(set(a) | set(b))) for a, b in zip(rankings[extractor], rankings['textblob'])]
+        print(f"{extractor:>10}: {elapsed:8.3f}s, mean top-{args.top} overlap with textblob {sum(overlaps) / max(1, len(overlaps)):.2f}")
+
+
+if __name__ == '__main__':
+    main()
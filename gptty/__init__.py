@@ -7,10 +7,18 @@ __maintainer__ = "Sig Janoska-Bedi"
 __email__ = "signe@atreeus.com"
 
 from gptty import (
+    coalescing,
     config, 
     context, 
+    export,
     gptty, 
-    tagging
+    hedging,
+    history,
+    scheduling,
+    search,
+    summary,
+    tagging,
+    usage,
 )
 
 import openai
@@ -19,6 +27,7 @@ import pandas as pd
 import json
 import asyncio
 import click
+import functools
 from typing import Tuple, List, Dict, Optional, Union
 
 class UniversalCompletion:
@@ -34,6 +43,9 @@ class UniversalCompletion:
                     max_context_length: int = 150,
                     context_keywords_only: bool = True,
                     preserve_new_lines: bool = False,
+                    hedge_policy: Optional[hedging.HedgePolicy] = None,
+                    singleflight: Optional[coalescing.SingleFlight] = None,
+                    scheduler: Optional[scheduling.FairScheduler] = None,
                 ) -> None:
 
         """
@@ -51,6 +63,9 @@ class UniversalCompletion:
             max_context_length (int): The maximum number of tokens in the input text.
             context_keywords_only (bool): If True, only keywords from the input text are taken into account in the generation process.
             preserve_new_lines (bool): If True, new lines in the output text are preserved.
+            hedge_policy (Optional[hedging.HedgePolicy]): If passed, slow asynchronous requests are hedged with a duplicate request.
+            singleflight (Optional[coalescing.SingleFlight]): If passed, identical in-flight asynchronous requests are coalesced into one.
+            scheduler (Optional[scheduling.FairScheduler]): If passed, asynchronous requests wait their turn in the scheduler, which can be shared by several instances.
             
         Returns:
             None
@@ -67,6 +82,9 @@ class UniversalCompletion:
         self.max_context_length = max_context_length
         self.context_keywords_only = context_keywords_only
         self.preserve_new_lines = preserve_new_lines
+        self.hedge_policy = hedge_policy
+        self.singleflight = singleflight
+        self.scheduler = scheduler
         
     def connect(self, api_key=None, org_id=None) -> None:
         """
@@ -104,16 +122,10 @@ class UniversalCompletion:
         try:
             r = openai.api_requestor.APIRequestor(self.api_key)
             resp = r.request("GET", f'/usage?date={datetime.now().strftime("%Y-%m-%d")}')
-            resp_object = resp[0].data
+            return gptty.parse_usage_stats(resp[0].data)
         except:
             return None
 
-        requests_today = sum(item["n_requests"] for item in resp_object['data'])
-        query_tokens_today = sum(item["n_context_tokens_total"] for item in resp_object['data'])
-        response_tokens_today = sum(item["n_generated_tokens_total"] for item in resp_object['data'])
-
-        return requests_today, query_tokens_today, response_tokens_today
-
     def get_available_models(self) -> List[str]:
         """
         Retrieves a list of available models from the OpenAI API.
@@ -178,7 +190,7 @@ class UniversalCompletion:
         raise Exception(f"Model {model_name} is not recognized or is not a valid or available model.")
 
 
-    async def a_fetch_response(self, prompt: Union[str, List[Dict[str, str]]], max_tokens: Optional[int] = None, temperature: Optional[float] = None, model_type: Optional[str] = None) -> Optional[Union[openai.Completion, openai.ChatCompletion]]:
+    async def a_fetch_response(self, prompt: Union[str, List[Dict[str, str]]], max_tokens: Optional[int] = None, temperature: Optional[float] = None, model_type: Optional[str] = None, priority: str = 'interactive', key: str = '') -> Optional[Union[openai.Completion, openai.ChatCompletion]]:
         """
         Asynchronously fetches a response from the model based on the provided prompt.
 
@@ -187,10 +199,15 @@ class UniversalCompletion:
             max_tokens (Optional[int]): The maximum number of tokens for the model to generate. Defaults to None, in which case it uses the instance's default.
             temperature (Optional[float]): The randomness factor for the model's output. Defaults to None, in which case it uses the instance's default.
             model_type (Optional[str]): The type of the model. Defaults to None, in which case it uses the instance's default.
+            priority (str): The scheduler priority class of the request, 'interactive' or 'batch'. Only used with a scheduler. Defaults to 'interactive'.
+            key (str): The key the request is queued fairly under, eg. a tag or caller. Only used with a scheduler. Defaults to ''.
 
         Returns:
             Optional[Union[openai.Completion, openai.ChatCompletion]]: The model's response as a Completion or ChatCompletion object, or None if the model type is not recognized.
 
+        Raises:
+            scheduling.QueueFullError: If a scheduler is in use and its queue for the priority class is full.
+
         Example usage:
             >>> g = UniversalCompletion(api_key="your-api-key", org_id="your-org-id")
             >>> g.connect()
@@ -205,7 +222,7 @@ class UniversalCompletion:
         model_type = model_type if model_type is not None else self.validate_model_type(self.model)
 
         if model_type == 'v1/completions':
-            return await openai.Completion.acreate(
+            make_call = lambda: openai.Completion.acreate(
                 engine=self.model,
                 prompt=prompt,
                 max_tokens=max_tokens,
@@ -214,8 +231,8 @@ class UniversalCompletion:
                 stop=None,
                 timeout=15,
             )
-        if model_type == 'v1/chat/completions':
-            return await openai.ChatCompletion.acreate( 
+        elif model_type == 'v1/chat/completions':
+            make_call = lambda: openai.ChatCompletion.acreate( 
                 model = self.model,
                 messages = prompt,
                 max_tokens=max_tokens,
@@ -224,8 +241,54 @@ class UniversalCompletion:
                 stop=None,
                 timeout=15,
             )
+        else:
+            return None
 
-        return None
+        if self.scheduler is not None:
+            make_call = functools.partial(self.scheduler.run, make_call, priority=priority, key=key)
+
+        if self.hedge_policy is not None:
+            make_call = functools.partial(self.hedge_policy.run, make_call)
+
+        if self.singleflight is not None:
+            key = coalescing.request_key(self.model, model_type, prompt, temperature, max_tokens)
+            return await self.singleflight.do(key, make_call)
+
+        return await make_call()
+
+    async def a_fetch_many(self, prompts: List[Union[str, List[Dict[str, str]]]], concurrency: int = 4, max_tokens: Optional[int] = None, temperature: Optional[float] = None, model_type: Optional[str] = None, return_exceptions: bool = False, priority: str = 'batch', key: str = '') -> List[Optional[Union[openai.Completion, openai.ChatCompletion]]]:
+        """
+        Asynchronously fetches responses for several prompts, with at most `concurrency` requests in flight at once.
+
+        Parameters:
+            prompts (List[Union[str, List[Dict[str, str]]]]): The input prompts, see `a_fetch_response`.
+            concurrency (int): The maximum number of requests in flight at any one time. Defaults to 4.
+            max_tokens (Optional[int]): See `a_fetch_response`.
+            temperature (Optional[float]): See `a_fetch_response`.
+            model_type (Optional[str]): See `a_fetch_response`. The model is only validated once for the whole batch.
+            return_exceptions (bool): If True, a failed request's exception is returned in place of its response, 
+                                      rather than raised. Defaults to False.
+            priority (str): See `a_fetch_response`. Defaults to 'batch'.
+            key (str): See `a_fetch_response`. Defaults to ''.
+
+        Returns:
+            List[Optional[Union[openai.Completion, openai.ChatCompletion]]]: The responses, in the same order as `prompts`.
+
+        Example usage:
+            >>> g = UniversalCompletion(api_key="your-api-key", org_id="your-org-id", model='gpt-3.5-turbo')
+            >>> g.connect()
+            >>> prompts = [[{"role": "user", "content": question}] for question in ["What is an abstraction?", "What is a closure?"]]
+            >>> responses = asyncio.run(g.a_fetch_many(prompts, concurrency=2))
+        """
+
+        model_type = model_type if model_type is not None else self.validate_model_type(self.model)
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def fetch(prompt):
+            async with semaphore:
+                return await self.a_fetch_response(prompt, max_tokens=max_tokens, temperature=temperature, model_type=model_type, priority=priority, key=key)
+
+        return await asyncio.gather(*[fetch(prompt) for prompt in prompts], return_exceptions=return_exceptions)
 
     def fetch_response(self, prompt: Union[str, List[Dict[str, str]]], max_tokens: Optional[int] = None, temperature: Optional[float] = None, model_type: Optional[str] = None) -> Optional[Union[openai.Completion, openai.ChatCompletion]]:
         """
@@ -280,7 +343,7 @@ class UniversalCompletion:
     def build_context(self, 
                       prompt: str, 
                       tag: str = "",
-                      context: List[Dict[str, str]] = "", 
+                      turns: Optional[List[Tuple[str, str]]] = None, 
                       max_context_length: int = None, 
                       model_type: Optional[str] = None, 
                       context_keywords_only: bool = None, 
@@ -291,7 +354,10 @@ class UniversalCompletion:
 
         Parameters:
             prompt (str): The main prompt to build the context around.
-            context (List[Dict[str, str]]): List of past prompts and responses.
+            tag (str): If passed and `turns` is None, the past prompts and responses logged under this tag in the 
+                       output file are used as context.
+            turns (Optional[List[Tuple[str, str]]]): Past (prompt, response) pairs, oldest first, to use as context 
+                                                    without reading the output file.
             max_context_length (int): Maximum length of the context to return.
             model_type (Optional[str]): Type of the language model. If 'v1/chat/completions', return a list of dicts 
                                         with 'role' and 'content' keys. If not, return a string. Default is None.
@@ -302,19 +368,18 @@ class UniversalCompletion:
         Returns:
             Union[str, List[Dict[str, str]]]: If `model_type` is 'v1/chat/completions', returns a list of dicts with 
                                               'role' and 'content' keys. If not, returns a string.
+
+        Example usage:
+            >>> g = UniversalCompletion(model='gpt-3.5-turbo')
+            >>> turns = [("What is an abstraction?", "A simplified model of something more complex.")]
+            >>> g.build_context("Give me an example.", turns=turns, model_type='v1/chat/completions')
         """
 
         model_type = model_type if model_type is not None else self.validate_model_type(self.model)
         max_context_length = max_context_length if max_context_length is not None else self.max_context_length
         context_keywords_only = context_keywords_only if context_keywords_only is not None else self.context_keywords_only
 
-        return context.get_context()
+        if turns is None and len(tag) > 0:
+            return context.get_context(tag, max_context_length, self.output_file, self.model, context_keywords_only=context_keywords_only, additional_context=additional_context, model_type=model_type, question=prompt)
 
-        # def get_context(tag: str = "", 
-        #                 max_context_length: int, 
-        #                 output_file: str, 
-        #                 model_name:str, 
-        #                 context_keywords_only: bool = True, 
-        #                 additional_context: str = "",
-        #                 model_type: str = None, 
-        #                 question: str = None)
\ No newline at end of file
+        return context.build_context(prompt, turns, max_context_length, self.model, context_keywords_only=context_keywords_only, additional_context=additional_context, model_type=model_type)
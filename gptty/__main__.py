@@ -18,12 +18,14 @@ import os
 import asyncio
 import pandas as pd
 import nltk
-import socket
-from contextlib import closing
 
 # app specific requirements
 from gptty.config import get_config_data
+from gptty.history import History
 from gptty.gptty import create_chat_room, run_query
+from gptty.usage import aggregate_usage, USAGE_GROUPS
+from gptty.export import export_history, read_export, EXPORT_COLUMNS
+from gptty.search import SearchIndex, SEARCH_COLUMNS
 
 # Define color codes
 CYAN = "\033[1;36m"
@@ -46,31 +48,7 @@ download_nltk_data_if_needed('corpora/brown')
 def return_log_as_df(configs):
     # here we add a pandas df reference object, see 
     # https://github.com/signebedi/gptty/issues/15
-    try:
-        df = pd.read_csv(configs['output_file'], header=None,sep='|').fillna('')
-        df.columns = ['timestamp','tag','question','response']
-    except:
-        df = pd.DataFrame(columns=['timestamp','tag','question','response'])
-    return df
-
-# Check if the system has a valid internet connection
-
-def has_internet_connection(host="google.com", port=443, timeout=3):
-    """Check if the system has a valid internet connection.
-
-    Args:
-        host (str, optional): A well-known website to test the connection. Default is 'www.google.com'.
-        port (int, optional): The port number to use for the connection. Default is 80.
-        timeout (int, optional): The time in seconds to wait for a response before giving up. Default is 3.
-
-    Returns:
-        bool: True if the system has an internet connection, False otherwise.
-    """
-    try:
-        with closing(socket.create_connection((host, port), timeout=timeout)):
-            return True
-    except OSError:
-        return False
+    return History.from_file(configs['output_file']).to_dataframe()
 
 # borrowed version callback from https://click.palletsprojects.com/en/7.x/options/#callbacks-and-eager-options
 def print_version(ctx, param, value, version=__version__):
@@ -119,14 +97,9 @@ async def chat_async_wrapper(config_path:str, verbose:bool):
   # load the app configs
   configs = get_config_data(config_file=config_path)
 
-  # Here, we verify that we have a wifi connection and if not, exit
-  if not has_internet_connection(configs['verify_internet_endpoint']):
-    click.echo(f"{RED}FAILED to verify connection at {configs['verify_internet_endpoint']}. Are you sure you are connected to the internet?")
-    return
+  # the connectivity probe, creating the output file and validating the model run concurrently 
+  # as part of the chat room's startup, see `gptty.prepare_session`
 
-  # create the output file if it doesn't exist
-  with open (configs['output_file'], 'a'): pass
-  
   # Authenticate with OpenAI using your API key
   # click.echo (configs['api_key'])
   if configs['api_key'].rstrip('\n') == "":
@@ -149,15 +122,19 @@ async def chat_async_wrapper(config_path:str, verbose:bool):
 @click.option('--verbose', '-v', is_flag=True, help="Show debug data.")
 @click.option('--json', '-j', is_flag=True, help="Return query as JSON object.")
 @click.option('--quiet', is_flag=True, help="Don't write to stdout.")
-def query(config_path:str, additional_context:str, question:str, tag:str, verbose:bool, json:bool, quiet:bool):
+@click.option('--concurrency', '-n', default=1, type=click.IntRange(min=1), help="Number of questions to send concurrently.")
+@click.option('--context_file', '-f', multiple=True, type=click.Path(exists=True, dir_okay=False), help="Repeatable list of text files to draw additional context from.")
+@click.option('--model', '-m', multiple=True, help="Repeatable list of models to compare, overriding the model in the config file.")
+@click.option('--deadline', '-d', default=None, type=click.FloatRange(min=0), help="Seconds to allow each question, including building its context, overriding the config file.")
+def query(config_path:str, additional_context:str, question:str, tag:str, verbose:bool, json:bool, quiet:bool, concurrency:int, context_file:tuple, model:tuple, deadline:float):
   """
   Submit a gptty query
   """
 
-  asyncio.run(query_async_wrapper(config_path, question, tag, additional_context, verbose, json, quiet))
+  asyncio.run(query_async_wrapper(config_path, question, tag, additional_context, verbose, json, quiet, concurrency, context_file, model, deadline))
 
 
-async def query_async_wrapper(config_path:str, question:str, tag:str, additional_context:str, verbose:bool, json:bool, quiet:bool):
+async def query_async_wrapper(config_path:str, question:str, tag:str, additional_context:str, verbose:bool, json:bool, quiet:bool, concurrency:int=1, context_files:tuple=(), models:tuple=(), deadline:float=None):
 
   if not os.path.exists(config_path):
       click.echo(f"{RED}FAILED to access app config file at {config_path}. Are you sure this is a valid config file? Run `gptty chat --help` for more information.")
@@ -166,13 +143,8 @@ async def query_async_wrapper(config_path:str, question:str, tag:str, additional
   # load the app configs
   configs = get_config_data(config_file=config_path)
 
-  # Here, we verify that we have a wifi connection and if not, exit
-  if not has_internet_connection(configs['verify_internet_endpoint']):
-    click.echo(f"{RED}FAILED to verify connection at {configs['verify_internet_endpoint']}. Are you sure you are connected to the internet?")
-    return
-
-  # create the output file if it doesn't exist
-  with open (configs['output_file'], 'a'): pass
+  # the connectivity probe, creating the output file and validating the model run concurrently 
+  # as part of the query's startup, see `gptty.prepare_session`
 
   # Authenticate with OpenAI using your API key
   # click.echo (configs['api_key'])
@@ -184,12 +156,19 @@ async def query_async_wrapper(config_path:str, question:str, tag:str, additional
       click.echo(f"{RED}FAILED to query ChatGPT. Did you forget to ask a question? Run `gptty chat --help` for more information.")
       return
 
-  await run_query(questions=question, tag=tag, configs=configs, additional_context=additional_context, config_path=config_path, verbose=verbose, return_json=json, quiet=quiet)
+  await run_query(questions=question, tag=tag, configs=configs, additional_context=additional_context, config_path=config_path, verbose=verbose, return_json=json, quiet=quiet, concurrency=concurrency, context_files=context_files, models=models, deadline=deadline)
 
 
 @click.command()
 @click.option('--config_path', '-c', default=os.path.join(os.getcwd(),'gptty.ini'), help="Path to config file.")
-def log(config_path):
+@click.option('--export', '-e', 'export_path', default=None, help="Export the log to a parquet dataset at this path.")
+@click.option('--append', is_flag=True, help="Only export questions logged since the last export.")
+@click.option('--parquet', '-p', 'parquet_path', default=None, help="Read the log from a parquet dataset at this path.")
+@click.option('--tag', '-t', multiple=True, help="Repeatable list of tags to show.")
+@click.option('--since', default=None, help="Only show questions logged on or after this date (YYYY-MM-DD).")
+@click.option('--until', default=None, help="Only show questions logged on or before this date (YYYY-MM-DD).")
+@click.option('--column', multiple=True, type=click.Choice(EXPORT_COLUMNS), help="Repeatable list of columns to show.")
+def log(config_path, export_path, append, parquet_path, tag, since, until, column):
   """
   Get log of past queries
   """
@@ -203,16 +182,90 @@ def log(config_path):
       click.echo(f"{RED}FAILED to access app config file at {config_path}. Are you sure this is a valid config file? Run `gptty chat --help` for more information.")
       return
 
+  try:
+    if export_path is not None:
+      rows = export_history(configs['output_file'], export_path, append=append)
+      click.echo(f"Exported {rows} questions to {export_path}")
+      return
+
+    if parquet_path is not None:
+      click.echo(read_export(parquet_path, columns=list(column) or None, tags=list(tag) or None, since=since, until=until))
+      return
+
+  except ImportError as e:
+    click.echo(f"{RED}FAILED to access parquet dataset. {e}{RESET}")
+    return
 
   df = return_log_as_df(configs)
 
+  # the text log has to be read in full, so filters are applied afterwards
+  if len(tag) > 0:
+    df = df[df['tag'].isin(tag)]
+  if since is not None:
+    df = df[df['timestamp'].str[:10] >= since]
+  if until is not None:
+    df = df[df['timestamp'].str[:10] <= until]
+  if len(column) > 0:
+    df = df.assign(date=df['timestamp'].str[:10])[list(column)]
+
+  click.echo(df)
+
+
+
+@click.command()
+@click.option('--config_path', '-c', default=os.path.join(os.getcwd(),'gptty.ini'), help="Path to config file.")
+@click.option('--by', '-b', type=click.Choice(USAGE_GROUPS), default='day', help="Group usage by tag, model or day.")
+def usage(config_path, by):
+  """
+  Get token usage and estimated cost
+  """
+
+  if not os.path.exists(config_path):
+      click.echo(f"{RED}FAILED to access app config file at {config_path}. Are you sure this is a valid config file? Run `gptty chat --help` for more information.")
+      return
+
+  # load the app configs
+  configs = get_config_data(config_file=config_path)
+
+  totals = aggregate_usage(configs['usage_file'], by=by)
+
+  df = pd.DataFrame.from_dict(totals, orient='index', columns=['requests','prompt_tokens','completion_tokens','latency','cost'])
+  df.index.name = by
+
   click.echo(df)
 
 
 
+@click.command()
+@click.argument('query')
+@click.option('--config_path', '-c', default=os.path.join(os.getcwd(),'gptty.ini'), help="Path to config file.")
+@click.option('--tag', '-t', default=None, help="Only search questions with this tag.")
+@click.option('--limit', '-n', default=10, type=click.IntRange(min=1), help="Maximum number of results.")
+def search(query, config_path, tag, limit):
+  """
+  Search past questions and responses
+  """
+
+  if not os.path.exists(config_path):
+      click.echo(f"{RED}FAILED to access app config file at {config_path}. Are you sure this is a valid config file? Run `gptty chat --help` for more information.")
+      return
+
+  # load the app configs
+  configs = get_config_data(config_file=config_path)
+
+  index = SearchIndex.for_output_file(configs['output_file'])
+  hits = index.search(configs['output_file'], query, tag=tag, limit=limit)
+  index.close()
+
+  click.echo(pd.DataFrame(hits, columns=SEARCH_COLUMNS))
+
+
+
 main.add_command(chat)
 main.add_command(query)
 main.add_command(log)
+main.add_command(usage)
+main.add_command(search)
 
 if __name__ == "__main__":
   main()
@@ -0,0 +1,91 @@
+__name__ = "gptty.coalescing"
+__author__ = "Sig Janoska-Bedi"
+__credits__ = ["Sig Janoska-Bedi"]
+__version__ = "0.2.8"
+__license__ = "MIT"
+__maintainer__ = "Sig Janoska-Bedi"
+__email__ = "signe@atreeus.com"
+
+import json
+import asyncio
+
+
+def request_key(model_engine:str, model_type:str, prompt, temperature:float, max_tokens:int) -> str:
+
+    """
+    Returns a key that is identical for requests that would produce the same upstream API call.
+
+    Parameters:
+    - model_engine (str): The engine ID to use for the API request.
+    - model_type (str): The API endpoint to use for the API request.
+    - prompt (Union[str, List[Dict[str, str]]]): The fully contextualized prompt.
+    - temperature (float): The temperature to use for the API request.
+    - max_tokens (int): The maximum number of tokens to generate in the response.
+
+    Returns:
+    - str: The request key.
+    """
+
+    return json.dumps([model_engine, model_type, prompt, temperature, max_tokens], sort_keys=True)
+
+
+class SingleFlight:
+
+    """
+    Coalesces identical in-flight requests. The first caller for a given key (the leader) makes the request, and any
+    caller with the same key that arrives before it completes (a follower) awaits the leader's result instead of
+    making its own. The request is only cancelled once every caller waiting on it has been cancelled.
+    """
+
+    def __init__(self):
+        self.in_flight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def stats(self) -> dict:
+        """
+        Returns counters on how many upstream calls were made and how many were saved by coalescing.
+        """
+        return {
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+            'in_flight': len(self.in_flight),
+        }
+
+    async def do(self, key:str, make_call):
+        """
+        Awaits the in-flight request for `key`, starting it with `make_call()` if there is none.
+
+        Parameters:
+        - key (str): The request key, see `request_key`.
+        - make_call (callable): A function with no arguments that returns a new awaitable request.
+
+        Returns:
+        - The result of the request, shared by every caller with the same key.
+        """
+        flight = self.in_flight.get(key)
+
+        # a request that has completed, or been cancelled, is only removed by its done callback once the event loop 
+        # gets to it, so it is joined only while it is still running
+        if flight is not None and not flight['future'].done():
+            self.coalesced += 1
+        else:
+            self.calls += 1
+            flight = {'future': asyncio.ensure_future(make_call()), 'waiters': 0}
+            self.in_flight[key] = flight
+            flight['future'].add_done_callback(lambda _: self._forget(key, flight))
+
+        flight['waiters'] += 1
+        try:
+            return await asyncio.shield(flight['future'])
+        finally:
+            flight['waiters'] -= 1
+            if flight['waiters'] == 0 and not flight['future'].done():
+                # the request is forgotten before it is cancelled, so that a caller arriving next starts a new one
+                self._forget(key, flight)
+                flight['future'].cancel()
+
+    def _forget(self, key:str, flight:dict) -> None:
+        # a later request for the same key may have replaced this one
+        if self.in_flight.get(key) is flight:
+            del self.in_flight[key]
@@ -28,8 +28,24 @@ def get_config_data(config_file='gptty.ini'):
         max_tokens: The maximum number of tokens to generate in the generated text.
         max_context_length: The maximum number of tokens to use as context when generating text.
         context_keywords_only: A boolean value indicating whether to use only the keywords in the context when generating text.
+        keyword_extractor: The extractor used to find keywords in the context, one of 'textblob', 'ngram' or 'rake'.
+        context_dedupe_threshold: The similarity at which repeated turns are removed from the context, keeping only the most recent; 0 disables this and 1 only removes exact repeats.
+        semantic_context: A boolean value indicating whether to use the past turns of a tag most similar to each question as its context, retrieved from a local vector index.
+        semantic_top_k: The number of past turns retrieved when semantic_context is enabled.
+        embedding_model: The embeddings model used by semantic_context, or 'hash' to use the bundled local hasher.
+        embedding_api_base: The base URL of the embeddings endpoint, if not the OpenAI API.
+        rolling_summaries: A boolean value indicating whether to use a rolling summary of each tag as its context for completions models.
+        keyword_workers: The number of processes used to extract keywords for batch queries spanning several tags; 0 uses one per CPU and 1 disables the process pool.
         preserve_new_lines: A boolean value indicating whether to preserve new lines in the generated text.
-        verify_internet_endpoint: The internet endpoint to use when verifying the internet connection.
+        verify_internet_endpoint: The internet endpoint to use when verifying the internet connection. Leave empty to skip the check.
+        usage_file: The name of the file where token usage, latency and estimated cost are recorded for each request.
+        hedge_requests: A boolean value indicating whether to hedge slow requests with a duplicate request.
+        hedge_percentile: The latency percentile after which a request is hedged.
+        hedge_min_delay: The minimum number of seconds to wait before hedging a request.
+        hedge_max_extra: The maximum number of hedged requests, as a fraction of the requests made by each chat or query.
+        coalesce_requests: A boolean value indicating whether identical concurrent requests share a single API call.
+        scheduler_concurrency: The maximum number of requests in flight at once across the chats and queries running in one process; chat requests are sent before queued query requests.
+        question_deadline: The number of seconds allowed to answer each question, including building its context and any retries; 0 disables the deadline.
 
     Note: This function uses the configparser module to parse configuration files.
     """
@@ -48,8 +64,24 @@ def get_config_data(config_file='gptty.ini'):
         'max_tokens': 250,
         'max_context_length': 150,
         'context_keywords_only': True,
+        'keyword_extractor': 'textblob',
+        'context_dedupe_threshold': 0.0,
+        'semantic_context': False,
+        'semantic_top_k': 5,
+        'embedding_model': 'hash',
+        'embedding_api_base': '',
+        'rolling_summaries': False,
+        'keyword_workers': 0,
         'preserve_new_lines': False,
         'verify_internet_endpoint': 'google.com',
+        'usage_file': 'usage.txt',
+        'hedge_requests': False,
+        'hedge_percentile': 95.0,
+        'hedge_min_delay': 2.0,
+        'hedge_max_extra': 0.1,
+        'coalesce_requests': True,
+        'scheduler_concurrency': 4,
+        'question_deadline': 0.0,
     }
 
     # read the configuration file (if it exists)
@@ -66,8 +98,24 @@ def get_config_data(config_file='gptty.ini'):
         'max_tokens': config.getint('main', 'max_tokens', fallback=25),
         'max_context_length': config.getint('main', 'max_context_length', fallback=150),
         'context_keywords_only': config.getboolean('main', 'context_keywords_only', fallback=True),
+        'keyword_extractor': config.get('main', 'keyword_extractor', fallback='textblob'),
+        'context_dedupe_threshold': config.getfloat('main', 'context_dedupe_threshold', fallback=0.0),
+        'semantic_context': config.getboolean('main', 'semantic_context', fallback=False),
+        'semantic_top_k': config.getint('main', 'semantic_top_k', fallback=5),
+        'embedding_model': config.get('main', 'embedding_model', fallback='hash'),
+        'embedding_api_base': config.get('main', 'embedding_api_base', fallback=''),
+        'rolling_summaries': config.getboolean('main', 'rolling_summaries', fallback=False),
+        'keyword_workers': config.getint('main', 'keyword_workers', fallback=0),
         'preserve_new_lines': config.getboolean('main', 'preserve_new_lines', fallback=False),
         'verify_internet_endpoint': config.get('main', 'verify_internet_endpoint', fallback='google.com'),
+        'usage_file': config.get('main', 'usage_file', fallback='usage.txt'),
+        'hedge_requests': config.getboolean('main', 'hedge_requests', fallback=False),
+        'hedge_percentile': config.getfloat('main', 'hedge_percentile', fallback=95.0),
+        'hedge_min_delay': config.getfloat('main', 'hedge_min_delay', fallback=2.0),
+        'hedge_max_extra': config.getfloat('main', 'hedge_max_extra', fallback=0.1),
+        'coalesce_requests': config.getboolean('main', 'coalesce_requests', fallback=True),
+        'scheduler_concurrency': config.getint('main', 'scheduler_concurrency', fallback=4),
+        'question_deadline': config.getfloat('main', 'question_deadline', fallback=0.0),
 	}
 
    
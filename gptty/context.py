@@ -7,10 +7,16 @@ __maintainer__ = "Sig Janoska-Bedi"
 __email__ = "signe@atreeus.com"
 
 
+import re
 import click
+import mmap
+import functools
+import threading
+import hashlib
 import tiktoken
+import numpy as np
 from textblob import TextBlob
-from collections import Counter, defaultdict
+from collections import Counter, deque
 from nltk.corpus import stopwords
 
 
@@ -36,7 +42,357 @@ def get_token_count(s, model_name):
     num_tokens = len(encoding.encode(s))
     return num_tokens
 
-def return_most_common_phrases(text:str, weight_recent=True) -> list:
+def get_tag_turns(tag: str, output_file: str) -> list:
+
+    """
+    Returns the question / response turns logged under a given tag.
+
+    Args:
+    - tag (str): The tag to filter on.
+    - output_file (str): Path to the file to read the turns from.
+
+    Returns:
+    - list: A list of (question, response) tuples, oldest first. Malformed rows are skipped.
+    """
+
+    turns = []
+    with open(output_file, 'r') as f:
+        for row in f:
+            data = [item.strip() for item in row.split('|')]
+            if len(data) >= 4 and data[1] == tag:
+                turns.append((data[2], data[3]))
+    return turns
+
+def iter_tag_turns_reversed(tag: str, output_file: str):
+
+    """
+    Yields the question / response turns logged under a given tag, newest first. The output file is memory-mapped
+    and scanned backwards one line at a time, so a caller that stops iterating early (eg. once its context budget is
+    filled) only pays for the tail of the file rather than the whole history.
+
+    Args:
+    - tag (str): The tag to filter on.
+    - output_file (str): Path to the file to read the turns from.
+
+    Yields:
+    - tuple: (question, response) for each turn with the tag, newest first. Malformed rows are skipped.
+    """
+
+    with open(output_file, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be memory-mapped
+            return
+
+        with mm:
+            end = len(mm)
+            while end > 0:
+                start = mm.rfind(b'\n', 0, end) + 1
+                row = mm[start:end].decode('utf-8', errors='replace')
+                end = start - 1
+
+                data = [item.strip() for item in row.split('|')]
+                if len(data) >= 4 and data[1] == tag:
+                    yield data[2], data[3]
+
+class ContextWindows:
+
+    """
+    Keeps a sliding window of recent turns for each tag used within a session, so that follow-up questions don't
+    have to re-read the output file to recover turns the session itself just wrote. Each window is seeded from the 
+    output file the first time its tag is used and then kept up to date with `append`.
+
+    Parameters:
+    - output_file (str): Path to the file to seed the windows from.
+    - max_words (int): If passed, each window only keeps as many of the most recent turns as fit within this many 
+                       words, which is all that chat context can use. If None, windows keep every turn of their tag.
+    - dedupe_threshold (float): If set, turns that duplicate a more recent turn, see `compact_turns`, don't count 
+                                towards `max_words`, since they will be removed from the context. Default is 0.0.
+    """
+
+    def __init__(self, output_file: str, max_words: int = None, dedupe_threshold: float = 0.0):
+        self.output_file = output_file
+        self.max_words = max_words
+        self.dedupe_threshold = dedupe_threshold
+        self.windows = {}
+        self.word_counts = {}
+        self.lock = threading.Lock()
+
+    def is_seeded(self, tag: str) -> bool:
+        return tag in self.windows
+
+    def load(self, tag: str) -> list:
+        """
+        Returns the window for a tag as (question, response) turns, oldest first, seeding it on first use.
+        """
+        with self.lock:
+            if tag not in self.windows:
+                self._seed(tag)
+            return [(question, response) for question, response, _, _ in self.windows[tag]]
+
+    def _fingerprint(self, question: str, response: str):
+        # duplicates only need to be found when they would otherwise take up the window's budget
+        if self.max_words is None or self.dedupe_threshold <= 0:
+            return None
+        text = normalize_turn(question, response)
+        return text, get_minhash_signature(text) if self.dedupe_threshold < 1 else None
+
+    def _is_duplicate(self, fingerprint, newer: list) -> bool:
+        # whether a turn duplicates any of a list of more recent turns, in the same way as `compact_turns`
+        if fingerprint is None or len(newer) < 1:
+            return False
+        text, signature = fingerprint
+        if any(text == other for other, _ in newer):
+            return True
+        return signature is not None and (np.array([other for _, other in newer]) == signature).mean(axis=1).max() >= self.dedupe_threshold
+
+    def _seed(self, tag: str) -> None:
+        # each turn is kept with the number of words it counts towards max_words, and its fingerprint if it counts
+        window = deque()
+        word_count = 0
+        counted = []
+
+        if self.max_words is None:
+            turns = get_tag_turns(tag, self.output_file)
+        else:
+            turns = iter_tag_turns_reversed(tag, self.output_file)
+
+        for question, response in turns:
+            words = len(question.split()) + len(response.split())
+            if self.max_words is None:
+                window.append((question, response, words, None))
+                word_count += words
+                continue
+
+            fingerprint = self._fingerprint(question, response)
+            if self._is_duplicate(fingerprint, counted):
+                window.appendleft((question, response, 0, None))
+            elif word_count + words > self.max_words:
+                break
+            else:
+                window.appendleft((question, response, words, fingerprint))
+                word_count += words
+                if fingerprint is not None:
+                    counted.append(fingerprint)
+
+        self.windows[tag] = window
+        self.word_counts[tag] = word_count
+
+    def append(self, tag: str, question: str, response: str) -> None:
+        """
+        Adds a turn that was just written to the output file to its tag's window, if the window has been seeded.
+        """
+        with self.lock:
+            window = self.windows.get(tag)
+            if window is None:
+                # the turn will be read from the output file when the window is seeded
+                return
+
+            # earlier turns that the new turn duplicates no longer count towards the window's budget
+            fingerprint = self._fingerprint(question, response)
+            if fingerprint is not None:
+                for i, (old_question, old_response, old_words, old_fingerprint) in enumerate(window):
+                    if old_fingerprint is not None and self._is_duplicate(old_fingerprint, [fingerprint]):
+                        window[i] = (old_question, old_response, 0, None)
+                        self.word_counts[tag] -= old_words
+
+            words = len(question.split()) + len(response.split())
+            window.append((question, response, words, fingerprint))
+            self.word_counts[tag] += words
+
+            while self.max_words is not None and self.word_counts[tag] > self.max_words and len(window) > 0:
+                self.word_counts[tag] -= window.popleft()[2]
+
+def join_turns(turns: list) -> str:
+
+    """
+    Concatenates (question, response) turns into the flat text used as completions context.
+    """
+
+    return ''.join(' ' + question + ' ' + response for question, response in turns)
+
+# the number of words in each shingle, and the number of hash functions in each MinHash signature, used to find
+# near-duplicate turns, see `compact_turns`
+SHINGLE_SIZE = 3
+MINHASH_PERMUTATIONS = 64
+
+# fixed odd multipliers and offsets for the hash functions, so that signatures are comparable between runs
+_minhash_a, _minhash_b = np.random.RandomState(44).randint(0, 1 << 63, size=(2, MINHASH_PERMUTATIONS), dtype=np.uint64)
+_minhash_a |= np.uint64(1)
+
+def normalize_turn(question: str, response: str) -> str:
+
+    """
+    Returns a turn as a single lowercase string with its whitespace collapsed, so that turns differing only in case
+    or spacing compare equal.
+    """
+
+    return ' '.join((question + ' ' + response).lower().split())
+
+def get_minhash_signature(text: str, shingle_size: int = SHINGLE_SIZE) -> np.ndarray:
+
+    """
+    Returns the MinHash signature of the word shingles in a text. The fraction of positions at which two signatures
+    agree estimates the Jaccard similarity of the texts' shingle sets.
+    """
+
+    words = text.split()
+    shingles = {' '.join(words[i:i + shingle_size]) for i in range(max(1, len(words) - shingle_size + 1))}
+    hashes = np.fromiter((int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little') for shingle in shingles), dtype=np.uint64, count=len(shingles))
+
+    # multiply-add hashing, wrapping around at 2**64
+    with np.errstate(over='ignore'):
+        return (hashes[:, None] * _minhash_a + _minhash_b).min(axis=0)
+
+def compact_turns(turns: list, threshold: float = 0.8) -> tuple:
+
+    """
+    Removes repeated turns, keeping only the most recent of each set of exact or near-duplicates. Turns are
+    near-duplicates if the estimated Jaccard similarity of their word shingles is at least `threshold`.
+
+    Args:
+    - turns (list): The (question, response) turns to compact, oldest first.
+    - threshold (float): The similarity at which turns are treated as duplicates. A threshold of 1 or more only
+                         removes exact duplicates (ignoring case and whitespace). Default is 0.8.
+
+    Returns:
+    - tuple: A list of the turns that were kept and a list of the turns that were removed, both oldest first.
+    """
+
+    kept, dropped, seen = [], [], set()
+    signatures = np.empty((len(turns), MINHASH_PERMUTATIONS), dtype=np.uint64)
+
+    # walk back from the most recent turn so that the representative of each set of duplicates is its newest turn
+    for question, response in reversed(turns):
+        text = normalize_turn(question, response)
+
+        if text in seen:
+            dropped.append((question, response))
+            continue
+
+        if threshold < 1:
+            signature = get_minhash_signature(text)
+            if len(seen) > 0 and (signatures[:len(seen)] == signature).mean(axis=1).max() >= threshold:
+                dropped.append((question, response))
+                continue
+            signatures[len(seen)] = signature
+
+        seen.add(text)
+        kept.append((question, response))
+
+    return kept[::-1], dropped[::-1]
+
+# the keyword extractors that can be passed to `return_most_common_phrases`:
+#   textblob - noun phrases from TextBlob's default (FastNPExtractor) part-of-speech based extractor
+#   ngram    - word n-grams of up to three words between stopwords and punctuation, no part-of-speech tagging
+#   rake     - RAKE-style candidate phrases between stopwords and punctuation, scored by word degree / frequency
+KEYWORD_EXTRACTORS = ['textblob', 'ngram', 'rake']
+
+# splits text into runs of words, breaking on anything that isn't part of a word
+PHRASE_DELIMITERS = re.compile(r"[^\w\s'-]+|\s+-+\s+")
+WORD_PATTERN = re.compile(r"[\w][\w'-]*")
+
+@functools.lru_cache(maxsize=None)
+def get_stop_words() -> frozenset:
+
+    """
+    Returns the set of English stopwords, loaded from the NLTK corpus once per process.
+    """
+
+    return frozenset(stopwords.words('english'))
+
+def get_candidate_phrases(text:str, max_words:int=None, stop_words:frozenset=None) -> list:
+
+    """
+    Splits text into candidate phrases: runs of consecutive words that contain no stopwords or punctuation.
+
+    Args:
+    - text (str): The input text.
+    - max_words (int): If passed, runs longer than this are split into consecutive chunks of at most `max_words` words.
+    - stop_words (frozenset): The stopwords to split on. Defaults to `get_stop_words()`.
+
+    Returns:
+    - list: The candidate phrases in the order they appear in the text, each a list of lowercase words.
+    """
+
+    stop_words = stop_words if stop_words is not None else get_stop_words()
+    phrases = []
+
+    for fragment in PHRASE_DELIMITERS.split(text.lower()):
+        run = []
+        for word in WORD_PATTERN.findall(fragment) + [None]:
+            if word is None or word in stop_words:
+                while run:
+                    phrases.append(run[:max_words] if max_words else run)
+                    run = run[max_words:] if max_words else []
+            else:
+                run.append(word)
+
+    return phrases
+
+def get_rake_scores(phrases:list) -> dict:
+
+    """
+    Scores candidate phrases as in RAKE (Rapid Automatic Keyword Extraction): each word scores its degree (the total
+    length of the phrases it appears in) divided by its frequency, and each phrase scores the sum of its words.
+
+    Args:
+    - phrases (list): Candidate phrases as returned by `get_candidate_phrases`.
+
+    Returns:
+    - dict: Maps each phrase, joined by spaces, to its score.
+    """
+
+    frequency = Counter()
+    degree = Counter()
+    for phrase in phrases:
+        for word in phrase:
+            frequency[word] += 1
+            degree[word] += len(phrase)
+
+    return {' '.join(phrase): sum(degree[word] / frequency[word] for word in phrase) for phrase in phrases}
+
+def extract_phrases(text:str, extractor:str='textblob', stop_words:frozenset=None) -> tuple:
+
+    """
+    Extracts key phrases from text with the given extractor, see KEYWORD_EXTRACTORS.
+
+    Args:
+    - text (str): The input text.
+    - extractor (str): The name of the extractor to use. Default is 'textblob'.
+    - stop_words (frozenset): The stopwords to remove. Defaults to `get_stop_words()`.
+
+    Returns:
+    - tuple: A list of the phrases in the order they appear in the text, and a dict of per-phrase score multipliers
+             (None unless the extractor scores phrases itself).
+
+    Raises:
+    - ValueError: If the extractor is not recognized.
+    """
+
+    stop_words = stop_words if stop_words is not None else get_stop_words()
+
+    if extractor == 'textblob':
+        # Extract noun phrases using TextBlob, and remove stopwords from them
+        filtered_noun_phrases = []
+        for noun_phrase in TextBlob(text).noun_phrases:
+            filtered_words = [word for word in noun_phrase.split() if word not in stop_words]
+            if filtered_words:
+                filtered_noun_phrases.append(' '.join(filtered_words))
+        return filtered_noun_phrases, None
+
+    if extractor == 'ngram':
+        return [' '.join(phrase) for phrase in get_candidate_phrases(text, max_words=3, stop_words=stop_words)], None
+
+    if extractor == 'rake':
+        phrases = get_candidate_phrases(text, max_words=4, stop_words=stop_words)
+        return [' '.join(phrase) for phrase in phrases], get_rake_scores(phrases)
+
+    raise ValueError(f"Keyword extractor '{extractor}' is not recognized, expected one of {KEYWORD_EXTRACTORS}.")
+
+@functools.lru_cache(maxsize=32)
+def return_most_common_phrases(text:str, weight_recent=True, extractor:str='textblob') -> list:
 
     """
     Returns a list of the most common noun phrases in the input text, with an option to weight more recent phrases more heavily.
@@ -44,90 +400,107 @@ def return_most_common_phrases(text:str, weight_recent=True) -> list:
     Args:
     - text (str): The input text.
     - weight_recent (bool): If True, more recent phrases are weighted more heavily.
+    - extractor (str): The keyword extractor to use, see KEYWORD_EXTRACTORS. Default is 'textblob'.
 
     Returns:
     - list: A list of the most common noun phrases in the input text. Each item in the list is a string representing a noun phrase.
     """
 
-    # Extract noun phrases using TextBlob
-    blob = TextBlob(text)
-    noun_phrases = blob.noun_phrases
+    phrases, multipliers = extract_phrases(text, extractor=extractor)
 
-    # Remove stopwords from noun phrases
-    stop_words = set(stopwords.words('english'))
-    filtered_noun_phrases = []
-    for np in noun_phrases:
-        words = np.split()
-        filtered_words = [word for word in words if word not in stop_words]
-        if filtered_words:
-            filtered_noun_phrases.append(' '.join(filtered_words))
+    if len(phrases) < 1:
+        return []
 
-    if not weight_recent:
+    # map each phrase to an id in order of first appearance, so that ties keep that order
+    ids = {}
+    phrase_ids = np.fromiter((ids.setdefault(phrase, len(ids)) for phrase in phrases), dtype=np.int64, count=len(phrases))
 
+    if weight_recent:
+        # Assign a higher weight to phrases that appear later in the text
+        weights = np.arange(1, len(phrases) + 1, dtype=np.float64) / len(phrases)
+        scores = np.bincount(phrase_ids, weights=weights)
+    else:
         # Count the frequency of the noun phrases
-        noun_phrase_counts = Counter(filtered_noun_phrases)
+        scores = np.bincount(phrase_ids).astype(np.float64)
 
-        # Get the most frequent key phrases
-        return [phrase for phrase, count in noun_phrase_counts.most_common()]
+    unique_phrases = list(ids)
+    if multipliers is not None:
+        scores = scores * np.fromiter((multipliers[phrase] for phrase in unique_phrases), dtype=np.float64, count=len(unique_phrases))
 
-    # Count the weighted frequency of the noun phrases
-    noun_phrase_weighted_counts = defaultdict(int)
-    total_phrases = len(filtered_noun_phrases)
+    # Get the most frequent key phrases
+    return [unique_phrases[i] for i in np.argsort(-scores, kind='stable')]
 
-    for i, phrase in enumerate(filtered_noun_phrases):
-        weight = (i + 1) / total_phrases  # Assign a higher weight to phrases that appear later in the text
-        noun_phrase_weighted_counts[phrase] += weight
+def init_keyword_worker(extractor: str = 'textblob') -> None:
 
-    # Get the most frequent key phrases
-    return [phrase for phrase, count in sorted(noun_phrase_weighted_counts.items(), key=lambda x: x[1], reverse=True)]
+    """
+    Initializer for worker processes that extract keywords, see `get_tag_phrases`. Loads the stop words, and the 
+    TextBlob models if they are used, once per process rather than on the first task each worker runs.
+    """
+
+    get_stop_words()
+    if extractor == 'textblob':
+        TextBlob("warm up the noun phrase extractor").noun_phrases
 
-def get_context(tag: str, 
-                max_context_length: int, 
-                output_file: str, 
-                model_name:str, 
-                context_keywords_only: bool = True, 
-                additional_context: str = "",
-                model_type: str = None, 
-                question: str = None, 
-                debug: bool = False):
 
+def get_tag_phrases(tag: str, output_file: str, additional_context: str = "", extractor: str = 'textblob', dedupe_threshold: float = 0.0) -> list:
 
     """
-    Returns a full query context for a given tag, question and additional context.
-    
+    Returns the most common phrases in a tag's history, prepended with `additional_context`, exactly as `get_context`
+    would compute them for 'v1/completions' with `context_keywords_only`. This is a module-level function so that it
+    can be run in a ProcessPoolExecutor, and the result passed to `get_context` as `phrases`.
+    """
+
+    turns = get_tag_turns(tag, output_file)
+    if dedupe_threshold > 0:
+        turns, _ = compact_turns(turns, dedupe_threshold)
+
+    return return_most_common_phrases(additional_context + join_turns(turns), extractor=extractor)
+
+
+def build_context(question: str,
+                  turns: list = None,
+                  max_context_length: int = 150,
+                  model_name: str = None,
+                  context_keywords_only: bool = True,
+                  additional_context: str = "",
+                  model_type: str = None,
+                  debug: bool = False,
+                  keyword_extractor: str = 'textblob',
+                  summary: str = None,
+                  phrases: list = None,
+                  dedupe_threshold: float = 0.0):
+
+    """
+    Returns a full query context for a question from an in-memory list of past turns, without any file I/O. This is 
+    what `get_context` uses once it has read a tag's turns from the output file.
+
     Parameters:
-        tag: str
-            Tag to identify a conversation with a specific topic
-        max_context_length: int
-            Maximum length of the context to return.
-        output_file: str
-            Path to the file to read the context from.
-        model_name: str
-            Name of the language model to use
-        context_keywords_only: bool, optional
-            If True, use only the most common phrases and words from the context and additional context.
-            Default is True.
-        additional_context: str, optional
-            Additional context to add to the context.
-            Default is an empty string.
-        model_type: str, optional
-            Type of the language model. If 'v1/chat/completions', return a list of dicts with 'role' and 'content' keys
-            If not, return a string.
+        question: str
+            Question to add to the context.
+        turns: list, optional
+            The past (question, response) turns to draw context from, oldest first. If None, and neither `summary` 
+            nor `phrases` is passed, the question is treated as untagged and only `additional_context` is added.
             Default is None.
-        question: str, optional
-            Question to add to the context. If None, return only the context.
+        max_context_length: int, optional
+            Maximum length of the context to return, in words.
+            Default is 150.
+        model_name: str, optional
+            Name of the language model to use, only used to count tokens when `debug` is True.
             Default is None.
-        debug: bool, optional
-            If True, print debug information.
-            Default is False.
-    
+        context_keywords_only, additional_context, model_type, debug, keyword_extractor, summary, phrases, 
+        dedupe_threshold:
+            See `get_context`.
+
     Returns:
         If `model_type` is 'v1/chat/completions', returns a list of dicts with 'role' and 'content' keys
         If not, returns a string.
-    """
 
+    Example usage:
+        >>> turns = [('what is the capital of australia?', 'The capital of Australia is Canberra.')]
+        >>> build_context('Who is its mayor?', turns, max_context_length=50, model_type='v1/chat/completions')
+    """
 
-    if len(tag) < 1:
+    if turns is None and summary is None and phrases is None:
         if model_type == 'v1/chat/completions':
 
             context = [{"role": "user", "content": question}]
@@ -162,21 +535,24 @@ def get_context(tag: str,
 
             return question
 
-    with open(output_file, 'r') as f:
-        text = f.read().strip().split('\n')
+    if dedupe_threshold > 0 and turns:
+        turns, dropped = compact_turns(turns, dedupe_threshold)
+
+        if debug and len(dropped) > 0:
+            saved = join_turns(dropped)
+            click.echo(f'{YELLOW}[debug] compacted {len(dropped)} duplicate turns, saving {len(saved.split())} words / {get_token_count(saved, model_name)} tokens{RESET}')
 
     if model_type == 'v1/chat/completions':
         context = []
 
-        for row in reversed(text):
-            data = [item.strip() for item in row.split('|')]
+        # the most recent turns are added until the budget is filled
+        for past_question, past_response in reversed(turns or []):
 
-            if (sum(len(item["content"].split()) for item in context) + len(data[2].split()) + len(data[3].split()) + len(question.split())) > max_context_length:
+            if (sum(len(item["content"].split()) for item in context) + len(past_question.split()) + len(past_response.split()) + len(question.split())) > max_context_length:
                 break
 
-            if data[1] == tag:
-                context = [{"role": "assistant", "content": data[3]}] + context
-                context = [{"role": "user", "content": data[2]}] + context
+            context = [{"role": "assistant", "content": past_response}] + context
+            context = [{"role": "user", "content": past_question}] + context
 
         context.append({"role": "user", "content": question})
         
@@ -194,15 +570,20 @@ def get_context(tag: str,
 
 
     else:
-        context = ""
-        for row in text:
-            data = [item.strip() for item in row.split('|')]
+        if summary is not None:
+            # a rolling summary of the tag's whole history stands in for its raw turns, see `summary.SummaryStore`
+            context = summary
+
+        elif phrases is not None and context_keywords_only:
+            # the phrases were already extracted, eg. in a worker process, so the turns aren't needed
+            context = ""
 
-            if data[1] == tag:
-                context += ' ' + data[2] + ' ' + data[3]
+        else:
+            context = join_turns(turns or [])
 
-        if context_keywords_only:
-            phrases = return_most_common_phrases(additional_context+context) # here we prepend the context with the additional_context string
+        if context_keywords_only and summary is None:
+            if phrases is None:
+                phrases = return_most_common_phrases(additional_context+context, extractor=keyword_extractor) # here we prepend the context with the additional_context string
             context = "" # maybe not the cleanest way to do this, but we are resetting the context here
 
             for phrase in phrases:
@@ -238,4 +619,114 @@ def get_context(tag: str,
             click.echo(f'[debug]\nmodel: {model_name}\ntokens: {get_token_count(context, model_name)}\nwords: {len(context.split())}\ntext: {context}') # debug - print the context to see what it looks like
             click.echo('-' * 25 + RESET)
 
-    return context
\ No newline at end of file
+    return context
+
+
+def get_recent_turns(tag: str, output_file: str, max_words: int, dedupe_threshold: float = 0.0) -> list:
+
+    """
+    Returns the most recent (question, response) turns for a tag that fit within `max_words`, oldest first. The 
+    output file is read backwards, and only as far as needed. If `dedupe_threshold` is set, turns that duplicate a
+    more recent turn don't count towards `max_words`, since `compact_turns` will remove them.
+    """
+
+    recent_turns, word_count, seen = [], 0, set()
+    for question, response in iter_tag_turns_reversed(tag, output_file):
+        if dedupe_threshold > 0:
+            text = normalize_turn(question, response)
+            if text in seen:
+                recent_turns.append((question, response))
+                continue
+            seen.add(text)
+
+        word_count += len(question.split()) + len(response.split())
+        if word_count > max_words:
+            break
+        recent_turns.append((question, response))
+
+    return recent_turns[::-1]
+
+
+def get_context(tag: str, 
+                max_context_length: int, 
+                output_file: str, 
+                model_name:str, 
+                context_keywords_only: bool = True, 
+                additional_context: str = "",
+                model_type: str = None, 
+                question: str = None, 
+                debug: bool = False,
+                turns: list = None,
+                keyword_extractor: str = 'textblob',
+                summary: str = None,
+                phrases: list = None,
+                dedupe_threshold: float = 0.0):
+
+
+    """
+    Returns a full query context for a given tag, question and additional context.
+    
+    Parameters:
+        tag: str
+            Tag to identify a conversation with a specific topic
+        max_context_length: int
+            Maximum length of the context to return.
+        output_file: str
+            Path to the file to read the context from.
+        model_name: str
+            Name of the language model to use
+        context_keywords_only: bool, optional
+            If True, use only the most common phrases and words from the context and additional context.
+            Default is True.
+        additional_context: str, optional
+            Additional context to add to the context.
+            Default is an empty string.
+        model_type: str, optional
+            Type of the language model. If 'v1/chat/completions', return a list of dicts with 'role' and 'content' keys
+            If not, return a string.
+            Default is None.
+        question: str, optional
+            Question to add to the context. If None, return only the context.
+            Default is None.
+        debug: bool, optional
+            If True, print debug information.
+            Default is False.
+        turns: list, optional
+            The (question, response) turns for `tag`, oldest first, as returned by `get_tag_turns`. If None, 
+            they are read from `output_file` (backwards, and only as far as needed, for chat completions).
+            Default is None.
+        keyword_extractor: str, optional
+            The extractor used to find key phrases when `context_keywords_only` is True, see KEYWORD_EXTRACTORS.
+            Default is 'textblob'.
+        summary: str, optional
+            A precomputed summary of the tag's history, as returned by `summary.SummaryStore.get_summary`. If passed,
+            it is used as the context for 'v1/completions' in place of the tag's turns or their keywords.
+            Default is None.
+        phrases: list, optional
+            The most common phrases in the tag's history, as returned by `get_tag_phrases`. If passed, they are used 
+            when `context_keywords_only` is True instead of being extracted here.
+            Default is None.
+        dedupe_threshold: float, optional
+            If greater than 0, repeated turns are removed before the context is built, keeping only the most recent
+            of each set of exact or near-duplicates, see `compact_turns`. With `debug`, the savings are printed.
+            Default is 0.0, which disables compaction.
+    
+    Returns:
+        If `model_type` is 'v1/chat/completions', returns a list of dicts with 'role' and 'content' keys
+        If not, returns a string.
+    """
+
+
+    if len(tag) < 1:
+        turns, summary, phrases = None, None, None
+
+    elif turns is None:
+        if model_type == 'v1/chat/completions':
+            # the most recent turns are read lazily from the end of the output file until the budget is filled
+            turns = get_recent_turns(tag, output_file, max_context_length - len(question.split()), dedupe_threshold=dedupe_threshold)
+        elif summary is None and (phrases is None or not context_keywords_only):
+            turns = get_tag_turns(tag, output_file)
+        else:
+            turns = []
+
+    return build_context(question, turns, max_context_length, model_name, context_keywords_only=context_keywords_only, additional_context=additional_context, model_type=model_type, debug=debug, keyword_extractor=keyword_extractor, summary=summary, phrases=phrases, dedupe_threshold=dedupe_threshold)
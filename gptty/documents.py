@@ -0,0 +1,230 @@
+__name__ = "gptty.documents"
+__author__ = "Sig Janoska-Bedi"
+__credits__ = ["Sig Janoska-Bedi"]
+__version__ = "0.2.8"
+__license__ = "MIT"
+__maintainer__ = "Sig Janoska-Bedi"
+__email__ = "signe@atreeus.com"
+
+import os
+import re
+import json
+import math
+import mmap
+import hashlib
+from collections import Counter, defaultdict
+
+# the number of words in each chunk of a context file
+CHUNK_WORDS = 100
+
+# BM25 term frequency saturation and length normalization, see `DocumentIndex.rank`
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# bump this when the cached index format changes, so that stale caches are rebuilt
+INDEX_VERSION = 1
+
+WORD_PATTERN = re.compile(rb'\S+')
+TERM_PATTERN = re.compile(r'\w+')
+
+
+def get_terms(text:str) -> list:
+
+    """
+    Returns the lowercase terms in a text that chunks are ranked on.
+    """
+
+    return TERM_PATTERN.findall(text.lower())
+
+
+class DocumentIndex:
+
+    """
+    An index of the chunks of a large text file, used to pass only the parts of the file most relevant to a question
+    as context. The file is memory-mapped and split once into chunks of CHUNK_WORDS words, and each chunk is stored
+    as its byte offsets together with an inverted index of its terms, so that neither ranking nor reading the chunks
+    that are selected requires loading the whole file.
+
+    Indexes are cached as JSON, keyed by the path of the file, and rebuilt when the file's size or modification
+    time changes.
+
+    Parameters:
+    - path (str): Path to the indexed file.
+    - size (int): The size of the file when it was indexed.
+    - mtime (int): The modification time of the file, in nanoseconds, when it was indexed.
+    - chunks (list): The (start, end, words) byte offsets and number of words of each chunk.
+    - lengths (list): The number of terms in each chunk.
+    - postings (dict): Maps each term to a list of (chunk, count) pairs.
+
+    Example usage:
+        >>> index = DocumentIndex.load('handbook.txt', cache_dir='output.txt.chunks')
+        >>> select_document_context([index], 'How do I rotate the keys?', max_words=120)
+    """
+
+    def __init__(self, path:str, size:int, mtime:int, chunks:list, lengths:list, postings:dict):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.chunks = chunks
+        self.lengths = lengths
+        self.postings = postings
+
+    def __len__(self):
+        return len(self.chunks)
+
+    @classmethod
+    def build(cls, path:str, chunk_words:int=CHUNK_WORDS):
+        """
+        Splits a file into chunks of `chunk_words` words and indexes their terms.
+        """
+        stat = os.stat(path)
+        chunks, lengths, postings = [], [], defaultdict(list)
+
+        with open(path, 'rb') as f:
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty files cannot be memory-mapped
+                return cls(path, stat.st_size, stat.st_mtime_ns, chunks, lengths, {})
+
+            with mm:
+                words = 0
+                start = end = None
+                for match in WORD_PATTERN.finditer(mm):
+                    if start is None:
+                        start = match.start()
+                    end = match.end()
+                    words += 1
+
+                    if words == chunk_words:
+                        cls._add_chunk(mm, start, end, words, chunks, lengths, postings)
+                        words, start = 0, None
+
+                if start is not None:
+                    cls._add_chunk(mm, start, end, words, chunks, lengths, postings)
+
+        return cls(path, stat.st_size, stat.st_mtime_ns, chunks, lengths, dict(postings))
+
+    @staticmethod
+    def _add_chunk(mm, start, end, words, chunks, lengths, postings):
+        terms = Counter(get_terms(mm[start:end].decode('utf-8', errors='replace')))
+        for term, count in terms.items():
+            postings[term].append((len(chunks), count))
+        chunks.append((start, end, words))
+        lengths.append(sum(terms.values()))
+
+    @staticmethod
+    def cache_path(path:str, cache_dir:str) -> str:
+        """
+        Returns the path that the index of a file is cached at.
+        """
+        key = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+        return os.path.join(cache_dir, f"{key}.json")
+
+    @classmethod
+    def load(cls, path:str, cache_dir:str=None, chunk_words:int=CHUNK_WORDS):
+        """
+        Returns the index of a file, from the cache in `cache_dir` if it is current, or else by building it and
+        writing it to the cache. If `cache_dir` is None, the index is always built.
+        """
+        if cache_dir is None:
+            return cls.build(path, chunk_words=chunk_words)
+
+        stat = os.stat(path)
+        cache_path = cls.cache_path(path, cache_dir)
+
+        try:
+            with open(cache_path, 'r') as f:
+                data = json.load(f)
+            if (data['version'], data['size'], data['mtime'], data['chunk_words']) == (INDEX_VERSION, stat.st_size, stat.st_mtime_ns, chunk_words):
+                return cls(path, data['size'], data['mtime'], data['chunks'], data['lengths'], data['postings'])
+        except (OSError, ValueError, KeyError):
+            pass
+
+        index = cls.build(path, chunk_words=chunk_words)
+
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_path, 'w') as f:
+            json.dump({
+                'version': INDEX_VERSION,
+                'size': index.size,
+                'mtime': index.mtime,
+                'chunk_words': chunk_words,
+                'chunks': index.chunks,
+                'lengths': index.lengths,
+                'postings': index.postings,
+            }, f)
+
+        return index
+
+    def rank(self, question:str) -> list:
+        """
+        Scores every chunk against a question with BM25.
+
+        Returns:
+        - list: The score of each chunk, in document order.
+        """
+        scores = [0.0] * len(self.chunks)
+        if len(self.chunks) < 1:
+            return scores
+
+        average_length = sum(self.lengths) / len(self.lengths) or 1
+
+        for term in set(get_terms(question)):
+            postings = self.postings.get(term, [])
+            if len(postings) < 1:
+                continue
+
+            idf = math.log(1 + (len(self.chunks) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk, count in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[chunk] / average_length)
+                scores[chunk] += idf * count * (BM25_K1 + 1) / (count + norm)
+
+        return scores
+
+    def read_chunk(self, chunk:int) -> str:
+        """
+        Reads a single chunk from the indexed file.
+        """
+        start, end, _ = self.chunks[chunk]
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            return f.read(end - start).decode('utf-8', errors='replace')
+
+
+def select_document_context(indexes:list, question:str, max_words:int) -> str:
+
+    """
+    Returns the chunks of one or more indexed files that are most relevant to a question and fit within `max_words`,
+    in the order they appear in their files. Only the selected chunks are read. If no chunk shares a term with the
+    question, the first chunks of the files are used instead.
+
+    Parameters:
+    - indexes (list): The DocumentIndex of each context file.
+    - question (str): The question to rank the chunks against.
+    - max_words (int): The maximum number of words to return.
+
+    Returns:
+    - str: The selected chunks, joined by spaces.
+    """
+
+    candidates = []
+    for i, index in enumerate(indexes):
+        for chunk, score in enumerate(index.rank(question)):
+            candidates.append((score, i, chunk))
+
+    if any(score > 0 for score, _, _ in candidates):
+        candidates = [candidate for candidate in candidates if candidate[0] > 0]
+
+    # the highest scoring chunks first, breaking ties in document order
+    candidates.sort(key=lambda candidate: (-candidate[0], candidate[1], candidate[2]))
+
+    selected, word_count = [], 0
+    for _, i, chunk in candidates:
+        words = indexes[i].chunks[chunk][2]
+        if word_count + words > max_words:
+            continue
+        selected.append((i, chunk))
+        word_count += words
+
+    return ' '.join(indexes[i].read_chunk(chunk) for i, chunk in sorted(selected))
@@ -0,0 +1,201 @@
+__name__ = "gptty.export"
+__author__ = "Sig Janoska-Bedi"
+__credits__ = ["Sig Janoska-Bedi"]
+__version__ = "0.2.8"
+__license__ = "MIT"
+__maintainer__ = "Sig Janoska-Bedi"
+__email__ = "signe@atreeus.com"
+
+import os
+import json
+import numpy as np
+
+from gptty.history import History, HISTORY_COLUMNS
+
+# the columns of an exported dataset, in order; `date` and `tag` are also its hive partitions
+EXPORT_COLUMNS = HISTORY_COLUMNS + ['date']
+EXPORT_PARTITIONS = ['date', 'tag']
+
+# tracks how much of the output file has been exported, see `export_history`
+EXPORT_STATE_FILE = '_gptty_export.json'
+
+
+def import_pyarrow():
+
+    """
+    Imports pyarrow, which is an optional dependency installed with `pip install gptty[parquet]`.
+
+    Raises:
+    - ImportError: If pyarrow is not installed.
+    """
+
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.dataset
+    except ImportError:
+        raise ImportError("Parquet export requires pyarrow, which you can install with `pip install gptty[parquet]`.")
+    return pyarrow
+
+
+def read_history_rows(output_file:str, offset:int=0):
+
+    """
+    Reads the complete rows of the output file from a byte offset into a new History, skipping malformed rows.
+
+    Returns:
+    - tuple: The History and the byte offset just past the last complete row read.
+    """
+
+    history = History()
+    try:
+        with open(output_file, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return history, 0
+
+    # only read complete rows, leaving any partially written row for the next export
+    complete = data[:data.rfind(b'\n') + 1]
+    for row in complete.decode('utf-8', errors='replace').split('\n'):
+        fields = [item.strip() for item in row.split('|')]
+        if len(fields) >= 4:
+            history.append(fields[0], fields[1], fields[2], fields[3])
+
+    return history, offset + len(complete)
+
+
+def history_to_table(history):
+
+    """
+    Converts a History to a pyarrow Table with the columns in `EXPORT_COLUMNS`. Timestamps are converted straight
+    from the History's int64 column and text is decoded once per turn, without going through pandas.
+    """
+
+    pa = import_pyarrow()
+
+    timestamps = pa.array(np.frombuffer(history.timestamps, dtype=np.int64) if len(history) else [], type=pa.int64()).cast(pa.timestamp('s'))
+    return pa.table({
+        'timestamp': timestamps,
+        'tag': pa.array([history.tag(i) for i in range(len(history))], type=pa.string()),
+        'question': pa.array([history.question(i) for i in range(len(history))], type=pa.string()),
+        'response': pa.array([history.response(i) for i in range(len(history))], type=pa.string()),
+        'date': pa.compute.strftime(timestamps, format='%Y-%m-%d'),
+    })
+
+
+def export_partitioning():
+
+    """
+    Returns the hive partitioning of an exported dataset, eg. `date=2023-03-29/tag=shakespeare/`.
+    """
+
+    pa = import_pyarrow()
+    return pa.dataset.partitioning(pa.schema([('date', pa.string()), ('tag', pa.string())]), flavor='hive')
+
+
+def prune_partitions(path:str, keep:set) -> None:
+
+    """
+    Removes the parquet files of a dataset that aren't in `keep`, and then any partition directories left empty.
+    """
+
+    for directory, _, files in os.walk(path, topdown=False):
+        for name in files:
+            if name.endswith('.parquet') and os.path.abspath(os.path.join(directory, name)) not in keep:
+                os.remove(os.path.join(directory, name))
+        if directory != path and len(os.listdir(directory)) < 1:
+            os.rmdir(directory)
+
+
+def export_history(output_file:str, path:str, append:bool=False) -> int:
+
+    """
+    Exports the output file to a parquet dataset partitioned by date and tag. The byte offset of the output file
+    that has been exported is stored in the dataset, so that in append mode only the rows logged since the last
+    export are read and written, as new files alongside the existing ones.
+
+    Parameters:
+    - output_file (str): Path to the output file.
+    - path (str): Path to the dataset directory.
+    - append (bool): Whether to only export the rows logged since the last export. If False, or if the output file has
+                     shrunk since, the dataset is rewritten. Default is False.
+
+    Returns:
+    - int: The number of rows written.
+    """
+
+    pa = import_pyarrow()
+
+    state_file = os.path.join(path, EXPORT_STATE_FILE)
+    offset = 0
+    if append and os.path.exists(state_file):
+        with open(state_file, 'r') as f:
+            offset = json.load(f)['offset']
+        if os.path.exists(output_file) and os.path.getsize(output_file) < offset:
+            append, offset = False, 0
+
+    history, new_offset = read_history_rows(output_file, offset)
+    table = history_to_table(history)
+
+    written = set()
+    if len(table) > 0 or not append:
+        pa.dataset.write_dataset(
+            table,
+            path,
+            format='parquet',
+            partitioning=export_partitioning(),
+            # files are named after the offset they start at, so appends never overwrite earlier files
+            basename_template=f"part-{offset}-{{i}}.parquet",
+            existing_data_behavior='overwrite_or_ignore' if append else 'delete_matching',
+            file_visitor=lambda written_file: written.add(os.path.abspath(written_file.path)),
+        )
+
+    # rewriting only replaces the partitions that are written to, so those whose rows are gone are removed
+    if not append:
+        prune_partitions(path, written)
+
+    os.makedirs(path, exist_ok=True)
+    with open(state_file, 'w') as f:
+        json.dump({'offset': new_offset}, f)
+
+    return len(table)
+
+
+def read_export(path:str, columns:list=None, tags:list=None, since:str=None, until:str=None):
+
+    """
+    Reads an exported dataset into a pandas df. Tag and date filters are pushed down to the partitions, so only
+    the matching files are read, and only the requested columns are decoded.
+
+    Parameters:
+    - path (str): Path to the dataset directory.
+    - columns (list): The columns to read, from `EXPORT_COLUMNS`. Defaults to timestamp, tag, question and response.
+    - tags (list): Only read these tags.
+    - since (str): Only read turns logged on or after this date, as 'YYYY-MM-DD'.
+    - until (str): Only read turns logged on or before this date, as 'YYYY-MM-DD'.
+
+    Returns:
+    - pd.DataFrame: The selected turns, sorted by timestamp if it is among the columns.
+    """
+
+    pa = import_pyarrow()
+    ds = pa.dataset
+
+    dataset = ds.dataset(path, format='parquet', partitioning=export_partitioning(), exclude_invalid_files=True)
+
+    expression = None
+    for condition in [
+        ds.field('tag').isin(tags) if tags else None,
+        ds.field('date') >= since if since else None,
+        ds.field('date') <= until if until else None,
+    ]:
+        if condition is not None:
+            expression = condition if expression is None else expression & condition
+
+    df = dataset.to_table(columns=columns or HISTORY_COLUMNS, filter=expression).to_pandas()
+
+    if 'timestamp' in df.columns:
+        df = df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+        df['timestamp'] = df['timestamp'].dt.strftime("%Y-%m-%d %H:%M:%S")
+    return df
@@ -11,18 +11,31 @@ import openai
 import pandas as pd
 from aioconsole import ainput
 from datetime import datetime
-import os, time, sys, asyncio, json
+import os, time, sys, asyncio, json, functools, socket, signal, threading, weakref
+from contextlib import closing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 
 # prompt toolkit requirements
 from prompt_toolkit import PromptSession
 from prompt_toolkit.formatted_text import ANSI
 from prompt_toolkit.styles import Style
 from prompt_toolkit.patch_stdout import patch_stdout
+from prompt_toolkit.completion import Completer, Completion
 
 # app specific requirements
-from gptty.tagging import get_tag_from_text
-from gptty.context import get_context
+from gptty.tagging import get_tag_from_text, parse_tag_selectors, is_plain_tag, TagTrie
+from gptty.context import get_context, get_tag_phrases, init_keyword_worker, join_turns, compact_turns, return_most_common_phrases, ContextWindows
 from gptty.config import get_config_data
+from gptty.history import History
+from gptty.summary import SummaryStore
+from gptty.search import SearchIndex, SEARCH_COLUMNS
+from gptty.documents import DocumentIndex, select_document_context
+from gptty.vectors import VectorIndex
+from gptty.usage import format_usage_row, get_usage_from_response
+from gptty.hedging import hedge_policy_from_configs
+from gptty.coalescing import SingleFlight, request_key
+from gptty.scheduling import FairScheduler
 
 # Define color codes
 CYAN = "\033[1;36m"
@@ -33,6 +46,13 @@ GREY = "\033[90m"
 ERASE_LINE = "\033[K"
 MOVE_CURSOR_UP = "\033[F"
 
+# number of seconds cached usage stats are shown before being refreshed in verbose mode
+USAGE_STATS_TTL = 30
+
+# log rows are written in batches of up to this many rows, or after this many seconds, see `LogWriter`
+LOG_BATCH_SIZE = 64
+LOG_FLUSH_INTERVAL = 1.0
+
 HELP = """
                         [Commands]
 :h[elp]                                     -   see help
@@ -40,24 +60,25 @@ HELP = """
 :l[og]                                      -   show history log
 :c[onfigs]                                  -   show configs
 
+:s[earch] QUERY                             -   search past questions and responses
+
                         [Questions]
 `why is the sky blue`                       -   send a question to ChatGPT
 `[shakespeare] who is william shakespeare`  -   share context across conversations
-`[a:b] what is the meaning of life`         -   pass context positionally
+`[infra,db] why is the build failing`       -   share context across several tags
+`[infra:-5:] what changed`                  -   pass context positionally, eg. the last 5 turns
+`[infra@24h] what did we decide`            -   pass context from a time window (s, m, h, d, w)
 """
 
 
-def usage_stats_today():
+def parse_usage_stats(resp_object):
 
-    try:
-        r = openai.api_requestor.APIRequestor()
-        resp = r.request("GET", f'/usage?date={datetime.now().strftime("%Y-%m-%d")}')
-        resp_object = resp[0].data
-    except:
-        return None
-    # requests_today = resp_object['data'][0]['n_requests'] # num requests
-    # query_tokens_today = resp_object['data'][0]['n_context_tokens_total'] # query tokens
-    # response_tokens_today = resp_object['data'][0]['n_generated_tokens_total'] # response tokens
+    """
+    Totals the day's usage from a response of the usage endpoint.
+
+    Returns:
+    - Tuple: (requests_today, query_tokens_today, response_tokens_today).
+    """
 
     requests_today = sum(item["n_requests"] for item in resp_object['data'])
     query_tokens_today = sum(item["n_context_tokens_total"] for item in resp_object['data'])
@@ -65,18 +86,410 @@ def usage_stats_today():
 
     return requests_today, query_tokens_today, response_tokens_today
 
+async def a_usage_stats_today():
+
+    """
+    Asynchronously retrieves the usage statistics for the current day, without blocking the event loop while the 
+    request is in flight.
+
+    Returns:
+    - Tuple: (requests_today, query_tokens_today, response_tokens_today), or None if the request fails.
+    """
+
+    try:
+        r = openai.api_requestor.APIRequestor()
+        resp = await r.arequest("GET", f'/usage?date={datetime.now().strftime("%Y-%m-%d")}')
+        return parse_usage_stats(resp[0].data)
+    except:
+        return None
+
+
+class UsageStatsCache:
+
+    """
+    Holds the most recent daily usage statistics and refreshes them in the background once they are older than `ttl` 
+    seconds. Reading the cache never waits on the network, so it is safe to call from the chat input path.
+
+    Parameters:
+    - ttl (float): The number of seconds a fetched value is considered fresh. Default is USAGE_STATS_TTL.
+    """
+
+    def __init__(self, ttl:float=None):
+        self.ttl = ttl if ttl is not None else USAGE_STATS_TTL
+        self.value = None
+        self.fetched_at = None
+        self._task = None
+
+    def is_stale(self):
+        return self.fetched_at is None or (time.monotonic() - self.fetched_at) > self.ttl
+
+    def refresh(self):
+        """
+        Schedules a background refresh if the cached value is stale and no refresh is already running. Must be called
+        from within a running event loop.
+        """
+        if not self.is_stale() or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._fetch())
+
+    async def _fetch(self):
+        self.value = await a_usage_stats_today()
+        self.fetched_at = time.monotonic()
+
+    def get(self):
+        """
+        Returns the cached usage stats as a display string (empty until the first fetch completes), scheduling a 
+        refresh in the background if the cached value is stale.
+        """
+        self.refresh()
+        return '' if self.fetched_at is None else f"{self.value}"
+
+    def cancel(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+# run blocking file I/O and CPU-bound work (context building, log writes, connectivity probes) in the
+# default thread pool so that the event loop, and the wait graphic, stay responsive
+async def run_blocking(func, *args, **kwargs):
+
+    """
+    Runs a blocking callable in the event loop's default executor and awaits its result.
+
+    Parameters:
+    - func (callable): The blocking function to run.
+    - *args, **kwargs: Arguments passed through to `func`.
+
+    Returns:
+    - The return value of `func`.
+    """
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+
+def format_log_entry(timestamp, tag, question, response):
+
+    """
+    Returns a single question / response turn as a row of the output file, including its trailing newline.
+    """
+
+    return f"{timestamp}|{tag}|{question.replace('|','')}|{response.replace('|','')}\n"
+
+
+class LogWriter:
+
+    """
+    Writes rows to the output file and usage ledger from a background task, so that logging a turn never holds up
+    the next question. Rows are queued with `write` and appended in batches, opening each file once per batch, 
+    whenever `batch_size` rows have been queued or `flush_interval` seconds have passed since the first row of the
+    batch. `flush` and `close` write out everything queued so far.
+
+    Parameters:
+    - batch_size (int): The maximum number of rows written per batch.
+    - flush_interval (float): The maximum number of seconds a row waits before it is written.
+
+    Example usage:
+        >>> log_writer = LogWriter()
+        >>> log_writer.start()
+        >>> log_writer.write('output.txt', format_log_entry(timestamp, tag, question, response))
+        >>> await log_writer.close()
+    """
+
+    # queued to end the current batch early, see `flush`
+    FLUSH = object()
+
+    def __init__(self, batch_size=LOG_BATCH_SIZE, flush_interval=LOG_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = None
+        self.task = None
+        self.rows = 0
+        self.batches = 0
+
+    def start(self):
+        """
+        Starts the writer task; must be called from within the event loop.
+        """
+        self.queue = asyncio.Queue()
+        self.task = asyncio.ensure_future(self._run())
+
+    def write(self, path, row):
+        """
+        Queues a row, including its trailing newline, to be appended to the file at `path`.
+        """
+        self.queue.put_nowait((path, row))
+
+    async def flush(self):
+        """
+        Waits until every row queued so far has been written. Returns right away if the writer task isn't running,
+        since nothing would drain the queue.
+        """
+        if self.task is None or self.task.done():
+            return
+        self.queue.put_nowait(self.FLUSH)
+        await self.queue.join()
+
+    async def close(self):
+        """
+        Writes any queued rows and stops the writer task.
+        """
+        if self.task is None or self.task.done():
+            return
+        self.queue.put_nowait(None)
+        await asyncio.shield(self.task)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.flush_interval
+
+            # keep collecting rows until the batch is full, the interval is up, or a flush or close is requested
+            while batch[-1] is not None and batch[-1] is not self.FLUSH and len(batch) < self.batch_size:
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), max(0, deadline - loop.time())))
+                except asyncio.TimeoutError:
+                    break
+
+            rows = [item for item in batch if item is not None and item is not self.FLUSH]
+            try:
+                if len(rows) > 0:
+                    await run_blocking(self._write_rows, rows)
+                    self.rows += len(rows)
+                    self.batches += 1
+            except Exception as e:
+                # a batch that can't be written is reported and dropped, so the writer keeps serving later rows
+                click.echo(f"{RED}FAILED to write {len(rows)} log rows: {e}{RESET}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+            if batch[-1] is None:
+                return
+
+    @staticmethod
+    def _write_rows(rows):
+        files = {}
+        for path, row in rows:
+            files.setdefault(path, []).append(row)
+
+        for path, file_rows in files.items():
+            with open(path, 'a') as f:
+                f.write(''.join(file_rows))
+
+    def stats(self):
+        """
+        Returns counters on how many rows were written in how many batches.
+        """
+        return {
+            'rows': self.rows,
+            'batches': self.batches,
+            'queued': self.queue.qsize() if self.queue is not None else 0,
+        }
+
+
+class TagCompleter(Completer):
+
+    """
+    Completes the `[tag]` prefix of a question in the chat prompt from the tags in the log. When several tags are
+    selected, eg. `[infra,d`, the tag being typed is completed.
+
+    Parameters:
+    - trie (TagTrie): The tags to complete from, which the chat room keeps up to date as new tags are logged.
+    """
+
+    def __init__(self, trie):
+        self.trie = trie
+
+    def get_completions(self, document, complete_event):
+        text = document.text_before_cursor.lstrip()
+        if not text.startswith('[') or ']' in text:
+            return
+
+        # slices and time windows follow the tag name, so there's nothing left to complete once they start
+        prefix = text[1:].split(',')[-1].lstrip().replace(' ', '-')
+        if ':' in prefix or '@' in prefix:
+            return
+
+        for tag in self.trie.complete(prefix):
+            if tag != prefix:
+                yield Completion(tag, start_position=-len(prefix))
+
+
+class ContextPrefetcher:
+
+    """
+    Speculatively loads a tag's history while the user is still typing in the chat prompt. Once the prompt buffer 
+    starts with a complete `[tag]` prefix, the tag's context window is seeded from the output file in the background
+    (and, for keyword context, its most common phrases are computed and cached) so that submitting the question 
+    doesn't have to wait on it.
+
+    Parameters:
+    - windows (ContextWindows): The session's per-tag context windows.
+    - context_keywords_only (bool): Whether the context is built from keywords, in which case phrases are precomputed.
+    - model_type (str): The API endpoint in use; keywords are only used for 'v1/completions'.
+    - keyword_extractor (str): The keyword extractor in use, see `context.KEYWORD_EXTRACTORS`.
+    - dedupe_threshold (float): The context compaction threshold in use, see `context.compact_turns`.
+    """
+
+    def __init__(self, windows, context_keywords_only=True, model_type=None, keyword_extractor='textblob', dedupe_threshold=0.0):
+        self.windows = windows
+        self.keyword_extractor = keyword_extractor
+        self.dedupe_threshold = dedupe_threshold
+        self.warm_phrases = context_keywords_only and model_type != 'v1/chat/completions'
+        self.tag = None
+        self.task = None
+
+    def on_text_changed(self, buffer):
+        """
+        Handler for the prompt_toolkit buffer's `on_text_changed` event.
+        """
+        text = buffer.text.lstrip()
+        if not text.startswith('[') or ']' not in text:
+            return
+
+        tag, _ = get_tag_from_text(text)
+        if len(tag) > 0 and tag != self.tag and is_plain_tag(parse_tag_selectors(tag)):
+            self.prefetch(tag)
+
+    def prefetch(self, tag):
+        """
+        Starts loading the context for `tag` in the background.
+        """
+        self.tag = tag
+        if not self.windows.is_seeded(tag) or self.warm_phrases:
+            self.task = asyncio.ensure_future(run_blocking(self._load, tag))
+
+    def _load(self, tag):
+        turns = self.windows.load(tag)
+        if self.warm_phrases and len(turns) > 0:
+            # the phrases are cached on the same text that `get_context` will extract them from
+            compacted = compact_turns(turns, self.dedupe_threshold)[0] if self.dedupe_threshold > 0 else turns
+            return_most_common_phrases(join_turns(compacted), extractor=self.keyword_extractor)
+        return turns
+
+    async def get(self, tag):
+        """
+        Returns the context window for `tag`, waiting on any prefetch for it and only going to the output file if 
+        the window has not been seeded yet.
+        """
+        if tag == self.tag and self.task is not None:
+            try:
+                await self.task
+            except Exception:
+                pass
+
+        self.tag = None
+        self.task = None
+
+        if self.windows.is_seeded(tag):
+            return self.windows.load(tag)
+        return await run_blocking(self.windows.load, tag)
+
+
+def has_internet_connection(host="google.com", port=443, timeout=3):
+    """Check if the system has a valid internet connection.
+
+    Args:
+        host (str, optional): A well-known website to test the connection. Default is 'www.google.com'.
+        port (int, optional): The port number to use for the connection. Default is 80.
+        timeout (int, optional): The time in seconds to wait for a response before giving up. Default is 3.
+
+    Returns:
+        bool: True if the system has an internet connection, False otherwise.
+    """
+    try:
+        with closing(socket.create_connection((host, port), timeout=timeout)):
+            return True
+    except OSError:
+        return False
+
+
+def create_output_file(output_file):
+
+    """
+    Creates the output file if it doesn't exist.
+    """
+
+    with open (output_file, 'a'): pass
+
+
+async def prepare_session(configs, load_history=False, models=None):
+
+    """
+    Runs the independent startup steps of a chat or query concurrently: probing the internet connection, creating 
+    the output file, validating the model (which calls the API), seeding the hedge policy from the usage ledger and,
+    optionally, loading the history. The first step to fail ends startup without waiting on the others.
+
+    The connectivity probe is skipped if `verify_internet_endpoint` is empty, in which case a missing connection is
+    reported by the model validation instead. The OpenAI API key must already be set.
+
+    Parameters:
+    - configs (dict): The app configs.
+    - load_history (bool): Whether to read the output file into a History. Default is False.
+    - models (list): The models to validate. Default is None, which validates the model in the configs.
+
+    Returns:
+    - tuple: (model_types, history, hedge_policy), where model_types maps each model to its API endpoint and history 
+             is None unless `load_history` is True, or None if startup failed, in which case the reason has been 
+             printed.
+    """
+
+    models = models or [configs['model'].rstrip('\n')]
+    endpoint = configs['verify_internet_endpoint']
+
+    async def probe():
+        if len(endpoint) > 0 and not await run_blocking(has_internet_connection, endpoint):
+            raise ConnectionError(f"FAILED to verify connection at {endpoint}. Are you sure you are connected to the internet?")
+
+    async def validate(model_engine):
+        try:
+            return await run_blocking(validate_model_type, model_engine)
+        except openai.error.APIConnectionError:
+            raise ConnectionError("FAILED to connect to the OpenAI API. Are you sure you are connected to the internet?")
+        except Exception:
+            raise ValueError(f"FAILED to validate the model name '{model_engine}'. Are you sure this is a valid OpenAI model? Check the available models at <https://platform.openai.com/docs/models/overview> and try again.")
+
+    async def load():
+        return await run_blocking(History.from_file, configs['output_file']) if load_history else None
+
+    try:
+        model_types, history, hedge_policy, _, _ = await asyncio.gather(
+            asyncio.gather(*[validate(model_engine) for model_engine in models]),
+            load(),
+            # slow requests are hedged with a duplicate request if enabled in the configs
+            run_blocking(hedge_policy_from_configs, configs),
+            run_blocking(create_output_file, configs['output_file']),
+            probe(),
+        )
+    except (ConnectionError, ValueError) as e:
+        click.echo(f"{RED}{e}{RESET}")
+        return None
+
+    return dict(zip(models, model_types)), history, hedge_policy
+
+
 ## VALIDATE MODELS - these functions are use to validate the model passed by the user and raises an exception if 
 ## the model does not exist.
+_available_models = None
+_available_models_lock = threading.Lock()
+
 def get_available_models():
 
     """    
     Returns:
         - List: list of available OpenAI model IDs.
 
+    The list is fetched once per process and cached, so validating several models only calls the API once.
     """
 
-    response = openai.Model.list()
-    return [model.id for model in response['data']]
+    global _available_models
+
+    with _available_models_lock:
+        if _available_models is None:
+            response = openai.Model.list()
+            _available_models = [model.id for model in response['data']]
+        return list(_available_models)
 
 def is_valid_model(model_name):
     """
@@ -113,8 +526,30 @@ def validate_model_type(model_name):
         return 'v1/chat/completions'
     raise Exception()
 
+# the scheduler shared by the chats and queries running in each event loop, see `shared_scheduler`
+_schedulers = weakref.WeakKeyDictionary()
+
+def shared_scheduler(concurrency:int=4):
+
+    """
+    Returns the FairScheduler shared by every chat and query running in the current event loop, creating it with 
+    `concurrency` the first time. Chats submit their requests as interactive and queries as batch, keyed by tag, so
+    that a large batch of queries can't hold up a chat running alongside it in the same process.
+
+    Parameters:
+    - concurrency (int): The maximum number of requests in flight at once, if the scheduler is created. Default is 4.
+
+    Returns:
+    - FairScheduler: The event loop's scheduler.
+    """
+
+    loop = asyncio.get_running_loop()
+    if loop not in _schedulers:
+        _schedulers[loop] = FairScheduler(concurrency=concurrency)
+    return _schedulers[loop]
+
 # here we define the async call to the openai API that is used when running queries
-async def fetch_response(prompt, model_engine, max_tokens, temperature, model_type):
+async def fetch_response(prompt, model_engine, max_tokens, temperature, model_type, hedge_policy=None, singleflight=None, scheduler=None, priority='batch', key='', deadline=None):
 
     """
     This module provides a function to fetch a response from the OpenAI API based on the given prompt and model specifications.
@@ -125,6 +560,14 @@ async def fetch_response(prompt, model_engine, max_tokens, temperature, model_ty
     - max_tokens (int): The maximum number of tokens to generate in the response.
     - temperature (float): The temperature to use for the API request.
     - model_type (str): The API endpoint to use for the API request.
+    - hedge_policy (HedgePolicy): If passed, slow requests are hedged with a duplicate request. Default is None.
+    - singleflight (SingleFlight): If passed, identical in-flight requests are coalesced into one. Default is None.
+    - scheduler (FairScheduler): If passed, each call to the API waits its turn in the scheduler. Default is None.
+    - priority (str): The scheduler priority class of the request, see `scheduling.PRIORITY_CLASSES`. Default is 'batch'.
+    - key (str): The key the request is queued fairly under in the scheduler, eg. its tag. Default is ''.
+    - deadline (float): The `time.monotonic()` time by which the response is needed. Each call to the API, including
+                        hedged duplicates and retries while the model warms up, is only given the time remaining, so
+                        no call outlives the question it answers. Default is None.
 
     Returns:
     - OpenAICompletion: The completion response object from the OpenAI API.
@@ -133,34 +576,53 @@ async def fetch_response(prompt, model_engine, max_tokens, temperature, model_ty
     - Exception: If the model type is not recognized or supported.
     """
 
+    def timeouts():
+        if deadline is None:
+            return {'timeout': 15}
+        remaining = max(deadline - time.monotonic(), 0.001)
+        return {'timeout': min(15, remaining), 'request_timeout': remaining}
+
     if model_type == 'v1/completions':
 
-        return await openai.Completion.acreate(
+        make_call = lambda: openai.Completion.acreate(
             engine=model_engine,
             prompt=prompt,
             max_tokens=max_tokens,
             temperature=temperature,
             n=1,
             stop=None,
-            timeout=15,
+            **timeouts(),
         )
 
-    if model_type == 'v1/chat/completions':
+    elif model_type == 'v1/chat/completions':
         # click.echo(f"\n{CYAN}SUCCESS validating model type 'v1/chat/completions'. Feature still under development. See <https://github.com/signebedi/gptty/issues/31> for more info.{RESET}\n")
         # return None
 
-        return await openai.ChatCompletion.acreate( 
+        make_call = lambda: openai.ChatCompletion.acreate( 
             model = model_engine,
             messages = prompt,
             max_tokens=max_tokens,
             temperature=temperature,
             n=1,
             stop=None,
-            timeout=15,
+            **timeouts(),
         )
 
-    click.echo(f"\n{RED}FAILED to validate the model type '{model_type}'. Are you sure this is a valid OpenAI model endpoint? Check the available model endpoints at <https://platform.openai.com/docs/models/model-endpoint-compatibility>. If you believe this is a bug, submit a bug request at <https://github.com/signebedi/gptty/issues>.{RESET}\n")
-    return None
+    else:
+        click.echo(f"\n{RED}FAILED to validate the model type '{model_type}'. Are you sure this is a valid OpenAI model endpoint? Check the available model endpoints at <https://platform.openai.com/docs/models/model-endpoint-compatibility>. If you believe this is a bug, submit a bug request at <https://github.com/signebedi/gptty/issues>.{RESET}\n")
+        return None
+
+    # a hedged duplicate is a call to the API like any other, so it is scheduled too
+    if scheduler is not None:
+        make_call = functools.partial(scheduler.run, make_call, priority=priority, key=key)
+
+    if hedge_policy is not None:
+        make_call = functools.partial(hedge_policy.run, make_call)
+
+    if singleflight is not None:
+        return await singleflight.do(request_key(model_engine, model_type, prompt, temperature, max_tokens), make_call)
+
+    return await make_call()
 
 
 # here we design the wait graphic that is called while awaiting responses
@@ -186,6 +648,59 @@ async def wait_graphic():
             print("\b" * 10, end="", flush=True)
 
 
+class RequestCancelled(Exception):
+    """
+    Raised when a question is abandoned before it is answered, because Ctrl-C was pressed or its deadline passed.
+    """
+
+
+async def run_cancellable(coro, deadline=None):
+
+    """
+    Awaits a coroutine as a task that is cancelled if Ctrl-C is pressed or the deadline passes, which in turn cancels
+    any requests to the API it is awaiting. Ctrl-C is only caught while the coroutine runs, and only where the event
+    loop can handle signals, ie. in the main thread on Unix.
+
+    Parameters:
+    - coro (coroutine): The coroutine to await.
+    - deadline (float): The `time.monotonic()` time by which the coroutine must complete. Default is None.
+
+    Returns:
+    - The result of the coroutine.
+
+    Raises:
+    - RequestCancelled: If Ctrl-C is pressed or the deadline passes before the coroutine completes.
+    """
+
+    loop = asyncio.get_running_loop()
+    task = asyncio.ensure_future(coro)
+    interrupted = False
+
+    def interrupt():
+        nonlocal interrupted
+        interrupted = True
+        task.cancel()
+
+    previous = signal.getsignal(signal.SIGINT)
+    try:
+        loop.add_signal_handler(signal.SIGINT, interrupt)
+        installed = True
+    except (NotImplementedError, RuntimeError, ValueError):
+        installed = False
+
+    try:
+        return await asyncio.wait_for(task, None if deadline is None else max(deadline - time.monotonic(), 0))
+    except asyncio.TimeoutError:
+        raise RequestCancelled("past its deadline")
+    except asyncio.CancelledError:
+        if interrupted:
+            raise RequestCancelled("interrupted")
+        raise
+    finally:
+        if installed:
+            loop.remove_signal_handler(signal.SIGINT)
+            signal.signal(signal.SIGINT, previous)
+
 
 # this is used when we run the `chat` command
 async def create_chat_room(configs=get_config_data(), log_responses:bool=True, config_path=None, verbose:bool=False):
@@ -207,13 +722,7 @@ async def create_chat_room(configs=get_config_data(), log_responses:bool=True, c
     """
 
 
-    # here we add a pandas df reference object, see 
-    # https://github.com/signebedi/gptty/issues/15
-    try:
-        df = pd.read_csv(configs['output_file'], header=None,sep='|').fillna('')
-        df.columns = ['timestamp','tag','question','response']
-    except:
-        df = pd.DataFrame(columns=['timestamp','tag','question','response'])
+    start_time = time.monotonic()
 
     try:
         openai.organization = configs['org_id'].rstrip('\n')
@@ -227,97 +736,190 @@ async def create_chat_room(configs=get_config_data(), log_responses:bool=True, c
     temperature = configs['temperature'] # controls the creativity of the response
     max_tokens = configs['max_tokens']  # the maximum length of the generated response
 
-
-    try:
-        model_type = validate_model_type(model_engine)
-    except:
-        click.echo(f"{RED}FAILED to validate the model name '{model_engine}'. Are you sure this is a valid OpenAI model? Check the available models at <https://platform.openai.com/docs/models/overview> and try again.{RESET}")
+    # here we add a columnar history reference object, see 
+    # https://github.com/signebedi/gptty/issues/15
+    prepared = await prepare_session(configs, load_history=True)
+    if prepared is None:
         return
+    model_types, history, hedge_policy = prepared
+    model_type = model_types[model_engine]
 
-    session = PromptSession()
+    # tags are completed as they are typed, from the tags already logged plus any logged during the session
+    tag_trie = TagTrie(history.tags)
+    session = PromptSession(completer=TagCompleter(tag_trie), complete_while_typing=True)
 
-    # Continuously send and receive messages
-    while True:
+    # for completions models, a rolling summary of each tag can stand in for its full history
+    summaries = await run_blocking(SummaryStore.for_output_file, configs['output_file']) if configs['rolling_summaries'] and model_type == 'v1/completions' else None
 
-        # Get user input
-        try:
+    # otherwise, a tag's past turns can be retrieved by their similarity to the question from a vector index
+    vectors = await run_blocking(VectorIndex.for_output_file, configs['output_file'], configs['embedding_model'], configs['embedding_api_base']) if configs['semantic_context'] and summaries is None else None
 
+    # recent turns are kept in memory per tag, so follow-up questions don't re-read the output file. Chat 
+    # context only ever uses as many recent turns as fit in max_context_length, while completions context
+    # uses the tag's whole history.
+    windows = ContextWindows(configs['output_file'], max_words=configs['max_context_length'] if model_type == 'v1/chat/completions' else None, dedupe_threshold=configs['context_dedupe_threshold'])
 
-            with patch_stdout():
-                i = await session.prompt_async(ANSI(f"{CYAN}{usage_stats_today() if verbose else ''}> "), style=Style.from_dict({'': 'ansicyan'}))
-            print(f"{ERASE_LINE}{MOVE_CURSOR_UP}{GREY}{usage_stats_today() if verbose else ''}> {i}\n", end="")
+    # start assembling a tag's context as soon as the user has typed its `[tag]` prefix
+    prefetcher = ContextPrefetcher(windows, context_keywords_only=configs['context_keywords_only'] and summaries is None, model_type=model_type, keyword_extractor=configs['keyword_extractor'], dedupe_threshold=configs['context_dedupe_threshold'])
+    if summaries is None and vectors is None:
+        session.default_buffer.on_text_changed += prefetcher.on_text_changed
 
-            # i = await ainput(f"{CYAN}> ")
-            tag,question = get_tag_from_text(i)
-            prompt_length = len(question)
+    # in verbose mode, usage stats are fetched in the background and read from the cache so that
+    # the input path never blocks on the network
+    usage_stats = UsageStatsCache()
+    if verbose:
+        usage_stats.refresh()
 
-        # handle keyboard interrupt
-        except KeyboardInterrupt:
-            i = False
+    search_index = None
 
-        if i == False:
-            continue
-        elif i.strip() in [':help',':h']:
-            click.echo(HELP)
-            continue
-        elif i.strip() in [':quit',':q']:
-            click.echo ('\nGoodbye ... \n')
-            break
-        elif i.strip() in [':configs',':c']:
-            c = f'config_path: {config_path}|model_type: {model_type}|{"|".join(f"{key}: {value}" for key, value in configs.items())}'.replace('|','\n')
-            click.echo (f'\n{c}\n')
-            continue
-        elif i.strip() in [':log',':l']:
-            # c = f'{"|".join(f"{row[]}" for index,row in df.iterrows())}'.replace('|','\n')
-            click.echo (f'\n{df}\n')
-            continue
-        elif i.strip().startswith(':') or prompt_length < 1:
-            click.echo('\nPlease provide a valid command or prompt.\n')
-            continue
+    # chat requests are sent ahead of any queries running in the same process
+    scheduler = shared_scheduler(configs['scheduler_concurrency'])
 
-        # click.echo the question in color
-        print(f"\n{CYAN}[{configs['your_name']}] {question}{RESET} \n", end="", flush=True)
+    # turns are logged from a background task, and anything still queued is written when the chat ends
+    log_writer = LogWriter()
+    log_writer.start()
 
-        # we create the callable wait_graphic task
-        wait_task = asyncio.create_task(wait_graphic())
+    if verbose:
+        click.echo(f"{YELLOW}[debug] startup: {time.monotonic() - start_time:.3f}s{RESET}\n")
 
-        fully_contextualized_question = get_context(tag, configs['max_context_length'], configs['output_file'], model_engine, context_keywords_only=configs['context_keywords_only'], model_type=model_type, question=question, debug=verbose)
+    # Continuously send and receive messages
+    try:
+        while True:
+
+            # Get user input
+            try:
+
+
+                usage = usage_stats.get() if verbose else ''
+
+                with patch_stdout():
+                    i = await session.prompt_async(ANSI(f"{CYAN}{usage}> "), style=Style.from_dict({'': 'ansicyan'}))
+                print(f"{ERASE_LINE}{MOVE_CURSOR_UP}{GREY}{usage}> {i}\n", end="")
+
+                # i = await ainput(f"{CYAN}> ")
+                tag,question = get_tag_from_text(i)
+                prompt_length = len(question)
+
+            # handle keyboard interrupt
+            except KeyboardInterrupt:
+                i = False
+
+            if i == False:
+                continue
+            elif i.strip() in [':help',':h']:
+                click.echo(HELP)
+                continue
+            elif i.strip() in [':quit',':q']:
+                if verbose and hedge_policy is not None:
+                    click.echo(f"\n{YELLOW}[debug] hedging: {hedge_policy.stats()}{RESET}")
+                if verbose:
+                    click.echo(f"{YELLOW}[debug] scheduling: {scheduler.stats()}{RESET}")
+                if verbose:
+                    click.echo(f"{YELLOW}[debug] log writer: {log_writer.stats()}{RESET}")
+                click.echo ('\nGoodbye ... \n')
+                usage_stats.cancel()
+                break
+            elif i.strip() in [':configs',':c']:
+                c = f'config_path: {config_path}|model_type: {model_type}|{"|".join(f"{key}: {value}" for key, value in configs.items())}'.replace('|','\n')
+                click.echo (f'\n{c}\n')
+                continue
+            elif i.strip() in [':log',':l']:
+                # c = f'{"|".join(f"{row[]}" for index,row in df.iterrows())}'.replace('|','\n')
+                click.echo (f'\n{history.to_dataframe()}\n')
+                continue
+            elif i.strip().split(' ')[0] in [':search',':s']:
+                # the search index is only opened the first time it is used in a session
+                if search_index is None:
+                    search_index = await run_blocking(SearchIndex.for_output_file, configs['output_file'])
+                await log_writer.flush()
+                hits = await run_blocking(search_index.search, configs['output_file'], i.strip().split(' ', 1)[1] if ' ' in i.strip() else '')
+                click.echo (f'\n{pd.DataFrame(hits, columns=SEARCH_COLUMNS)}\n')
+                continue
+            elif i.strip().startswith(':') or prompt_length < 1:
+                click.echo('\nPlease provide a valid command or prompt.\n')
+                continue
 
-        response_task = asyncio.create_task(fetch_response(fully_contextualized_question, model_engine, max_tokens, temperature, model_type))
+            # click.echo the question in color
+            print(f"\n{CYAN}[{configs['your_name']}] {question}{RESET} \n", end="", flush=True)
 
-        # Wait for the response to be completed
-        response = await response_task
+            # we create the callable wait_graphic task
+            wait_task = asyncio.create_task(wait_graphic())
 
-        # Cancel the wait graphic task
-        wait_task.cancel()
-        print("\b" * 10 , end="", flush=True)
+            async def answer(tag, deadline):
+
+                # multiple tags, slices and time windows are resolved through the history index, and the turn
+                # is logged under the first tag selected
+                selectors = parse_tag_selectors(tag)
+                if len(tag) > 0 and vectors is not None and is_plain_tag(selectors):
+                    # the vector index catches up from the output file, so any queued turns are written first
+                    await log_writer.flush()
+                    turns = await run_blocking(vectors.search, configs['output_file'], tag, question, configs['semantic_top_k'])
+                    summary = None
+                elif is_plain_tag(selectors) or len(selectors) < 1:
+                    turns = await prefetcher.get(tag) if len(tag) > 0 and summaries is None else None
+                    summary = await run_blocking(summaries.summarize, configs['output_file'], tag, configs['max_context_length']) if len(tag) > 0 and summaries is not None else None
+                else:
+                    turns = history.select_turns(selectors)
+                    summary = None
+                    tag = selectors[0].tag
+                fully_contextualized_question = await run_blocking(get_context, tag, configs['max_context_length'], configs['output_file'], model_engine, context_keywords_only=configs['context_keywords_only'], keyword_extractor=configs['keyword_extractor'], model_type=model_type, question=question, debug=verbose, turns=turns, summary=summary, dedupe_threshold=configs['context_dedupe_threshold'])
+
+                # Wait for the response to be completed
+                start_time = time.monotonic()
+                response = await fetch_response(fully_contextualized_question, model_engine, max_tokens, temperature, model_type, hedge_policy=hedge_policy, scheduler=scheduler, priority='interactive', key=tag, deadline=deadline)
+                return tag, response, time.monotonic() - start_time
+
+            # the deadline covers building the context as well as every call to the API, and Ctrl-C abandons the
+            # question, cancelling its request, rather than leaving the prompt waiting on it
+            deadline = time.monotonic() + configs['question_deadline'] if configs['question_deadline'] > 0 else None
+            try:
+                tag, response, latency = await run_cancellable(answer(tag, deadline), deadline)
+            except RequestCancelled as e:
+                wait_task.cancel()
+                print("\b" * 10 , end="", flush=True)
+                click.echo(f"\b{RED}FAILED to answer the question, it was {e}.{RESET}\n")
+                continue
 
-        if not response:
-            continue
+            # Cancel the wait graphic task
+            wait_task.cancel()
+            print("\b" * 10 , end="", flush=True)
 
-        response_text = response.choices[0].text.strip() if model_type == 'v1/completions' else response.choices[0]['message']['content'].strip()
-        deformatted_response_text = response.choices[0].text.strip().replace("\n", " ") if model_type == 'v1/completions' else response.choices[0]['message']['content'].strip().replace("\n", " ")
+            if not response:
+                continue
 
-        if configs['preserve_new_lines']:
-            click.echo(f"\b{RED}[{configs['gpt_name']}] {response_text}{RESET}\n")
-        else:
-            # click.echo the response in color
-            click.echo(f"\b{RED}[{configs['gpt_name']}] {deformatted_response_text}{RESET}\n")
+            response_text = response.choices[0].text.strip() if model_type == 'v1/completions' else response.choices[0]['message']['content'].strip()
+            deformatted_response_text = response.choices[0].text.strip().replace("\n", " ") if model_type == 'v1/completions' else response.choices[0]['message']['content'].strip().replace("\n", " ")
+
+            if configs['preserve_new_lines']:
+                click.echo(f"\b{RED}[{configs['gpt_name']}] {response_text}{RESET}\n")
+            else:
+                # click.echo the response in color
+                click.echo(f"\b{RED}[{configs['gpt_name']}] {deformatted_response_text}{RESET}\n")
+
+            if log_responses:
+                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                log_writer.write(configs['output_file'], format_log_entry(timestamp, tag, question, deformatted_response_text))
+                windows.append(tag, question.replace('|','').strip(), deformatted_response_text.replace('|','').strip())
+                tag_trie.add(tag)
 
-        if log_responses:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            with open (configs['output_file'], 'a') as f:
-                f.write(f"{timestamp}|{tag}|{question.replace('|','')}|{deformatted_response_text.replace('|','')}\n")
+                # turns for tags without a window are read back from the output file, so they are written right away
+                if len(tag) > 0 and not windows.is_seeded(tag):
+                    await log_writer.flush()
 
-            # here we update the pandas reference object, see 
-            # https://github.com/signebedi/gptty/issues/15
-            df = pd.concat([df, pd.DataFrame({"timestamp":[timestamp],"tag":[tag],"question":[question],"response":[deformatted_response_text],})], ignore_index=True)
+                prompt_tokens, completion_tokens = get_usage_from_response(response)
+                log_writer.write(configs['usage_file'], format_usage_row(timestamp, tag, model_engine, prompt_tokens, completion_tokens, latency))
 
+                # here we update the history reference object, see 
+                # https://github.com/signebedi/gptty/issues/15
+                history.append(timestamp, tag, question.replace('|',''), deformatted_response_text.replace('|',''))
+
+    finally:
+        await log_writer.close()
 
 
 
 # this is used when we run the `query` command
-async def run_query(questions:list, tag:str, configs=get_config_data(), additional_context:str="", log_responses:bool=True, config_path=None, verbose:bool=False, return_json:bool=False, quiet:bool=False):
+async def run_query(questions:list, tag:str, configs=get_config_data(), additional_context:str="", log_responses:bool=True, config_path=None, verbose:bool=False, return_json:bool=False, quiet:bool=False, concurrency:int=1, context_files:list=(), models:list=(), deadline:float=None):
 
     """
     This function is used to run a query command using OpenAI. 
@@ -327,8 +929,8 @@ async def run_query(questions:list, tag:str, configs=get_config_data(), addition
     the function logs the questions and responses in a pandas dataframe if specified in the configuration file.
 
     Parameters:
-        questions (list): a list of questions to ask the GPT-3 model
-        tag (str): a tag to associate with the questions and responses
+        questions (list): a list of questions to ask the GPT-3 model, each optionally prefixed with its own `[tag]`
+        tag (str): a tag to associate with the questions and responses that don't have their own
         configs (dict): a dictionary containing configuration options (default: get_config_data())
         additional_context (str): additional context to provide to the GPT-3 model (default: "")
         log_responses (bool): whether to log the questions and responses in a pandas dataframe (default: True)
@@ -336,6 +938,10 @@ async def run_query(questions:list, tag:str, configs=get_config_data(), addition
         verbose (bool): whether to enable debug mode (default: False)
         return_json (bool): whether to return the responses in a JSON format (default: False)
         quiet (bool): whether to suppress console output (default: False)
+        concurrency (int): the maximum number of questions to send concurrently; responses are still printed in order (default: 1)
+        context_files (list): paths to text files whose chunks most relevant to each question are added to its additional context (default: ())
+        models (list): models to send each question to concurrently, to compare their responses side by side; if empty, the model in the configs is used (default: ())
+        deadline (float): the number of seconds allowed to answer each question, including building its context and any retries, after which it is abandoned; if None, question_deadline in the configs is used (default: None)
 
     Returns:
         None if the function fails to authenticate with OpenAI or if there are no questions to ask
@@ -346,13 +952,7 @@ async def run_query(questions:list, tag:str, configs=get_config_data(), addition
     """
 
 
-    # here we add a pandas df reference object, see 
-    # https://github.com/signebedi/gptty/issues/15
-    try:
-        df = pd.read_csv(configs['output_file'], header=None,sep='|').fillna('')
-        df.columns = ['timestamp','tag','question','response']
-    except:
-        df = pd.DataFrame(columns=['timestamp','tag','question','response'])
+    start_time = time.monotonic()
 
     try:
         openai.api_key = configs['api_key'].rstrip('\n')
@@ -368,61 +968,291 @@ async def run_query(questions:list, tag:str, configs=get_config_data(), addition
     temperature = configs['temperature'] # controls the creativity of the response
     max_tokens = configs['max_tokens']  # the maximum length of the generated response
 
+    # several models can be compared side by side, in which case each response is logged under its model as well 
+    # as its tag, eg. `infra/gpt-4`, so that the tag's own history isn't mixed up with the comparison
+    model_engines = list(dict.fromkeys(model.strip() for model in models)) or [model_engine]
+    compare = len(model_engines) > 1
+
+    # a deadline of 0 means questions are given as long as they need
+    deadline = configs['question_deadline'] if deadline is None else deadline
+
+    prepared = await prepare_session(configs, models=model_engines)
+    if prepared is None:
+        return
+    model_types, _, hedge_policy = prepared
+    endpoints = set(model_types.values())
+
+    # the latencies of different models aren't comparable, so comparisons aren't hedged
+    if compare:
+        hedge_policy = None
+
+    # context files are split into chunks and indexed once, and the indexes cached alongside the output file
     try:
-        model_type = validate_model_type(model_engine)
-    except:
-        click.echo(f"{RED}FAILED to validate the model name '{model_engine}'. Are you sure this is a valid OpenAI model? Check the available models at <https://platform.openai.com/docs/models/overview> and try again.{RESET}")
+        documents = await asyncio.gather(*[run_blocking(DocumentIndex.load, path, f"{configs['output_file']}.chunks") for path in context_files])
+    except OSError as e:
+        click.echo(f"{RED}FAILED to read context file. {e}{RESET}")
         return
 
-    # Continuously send and receive messages
-    for question in questions:
-        if len(question) < 1:
-            continue
+    # identical questions sent concurrently are coalesced into a single request if enabled in the configs
+    singleflight = SingleFlight() if configs['coalesce_requests'] else None
 
-        if not return_json and not quiet:
-            # click.echo the question in color
-            print(f"{CYAN}[{configs['your_name']}] {question}{RESET} \n", end="", flush=True)
+    # query requests wait behind any chat running in the same process, and are shared fairly between tags
+    scheduler = shared_scheduler(configs['scheduler_concurrency'])
 
-            # we create the callable wait_graphic task
-            wait_task = asyncio.create_task(wait_graphic())
+    # for completions models, a rolling summary of each tag can stand in for its full history
+    summaries = await run_blocking(SummaryStore.for_output_file, configs['output_file']) if configs['rolling_summaries'] and endpoints == {'v1/completions'} else None
 
-        fully_contextualized_question = get_context(tag, configs['max_context_length'], configs['output_file'], model_engine, additional_context=additional_context, context_keywords_only=configs['context_keywords_only'], model_type=model_type, question=question, debug=verbose)
+    # otherwise, a tag's past turns can be retrieved by their similarity to the question from a vector index
+    vectors = await run_blocking(VectorIndex.for_output_file, configs['output_file'], configs['embedding_model'], configs['embedding_api_base']) if configs['semantic_context'] and summaries is None else None
 
-        response_task = asyncio.create_task(fetch_response(fully_contextualized_question, model_engine, max_tokens, temperature, model_type))
+    # each question can carry its own `[tag]` prefix, which takes precedence over the `tag` passed
+    tagged_questions = []
+    for question in questions:
+        if len(question) > 0:
+            question_tag, question_text = get_tag_from_text(question)
+            tagged_questions.append((question_tag or tag, question_text))
+
+    # multiple tags, slices and time windows are resolved through the history index, and the questions
+    # are logged under the first tag selected
+    resolved_tags = {}
+    history = None
+    for question_tag in dict.fromkeys(question_tag for question_tag, _ in tagged_questions):
+        selectors = parse_tag_selectors(question_tag)
+        if not is_plain_tag(selectors) and len(selectors) > 0:
+            if history is None:
+                history = await run_blocking(History.from_file, configs['output_file'])
+            resolved_tags[question_tag] = (selectors[0].tag, history.select_turns(selectors))
+        else:
+            resolved_tags[question_tag] = (question_tag, None)
+
+    # keyword extraction is CPU bound, so when a batch spans several tags their keywords are extracted up front
+    # across a pool of worker processes rather than one tag at a time in this one, unless context files make the 
+    # additional context differ from question to question. Only tags asked about once in the batch are extracted
+    # up front, since a tag's later questions must see the answers logged to it earlier in the batch.
+    phrases = {}
+    logged_tags = Counter(resolved_tags[question_tag][0] for question_tag, _ in tagged_questions)
+    keyword_tags = [question_tag for question_tag, (_, turns) in resolved_tags.items() if len(question_tag) > 0 and turns is None and logged_tags[question_tag] == 1]
+    keyword_workers = configs['keyword_workers'] or os.cpu_count() or 1
+    if endpoints == {'v1/completions'} and configs['context_keywords_only'] and summaries is None and vectors is None and len(documents) < 1 and len(keyword_tags) > 1 and keyword_workers > 1:
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(max_workers=min(keyword_workers, len(keyword_tags)), initializer=init_keyword_worker, initargs=(configs['keyword_extractor'],)) as pool:
+            results = await asyncio.gather(*[loop.run_in_executor(pool, get_tag_phrases, question_tag, configs['output_file'], additional_context, configs['keyword_extractor'], configs['context_dedupe_threshold']) for question_tag in keyword_tags])
+        phrases = dict(zip(keyword_tags, results))
+
+    # recent turns are kept in memory per tag, so later questions see earlier answers without waiting on the
+    # output file, which is written from a background task
+    windows = ContextWindows(configs['output_file'], max_words=configs['max_context_length'] if endpoints == {'v1/chat/completions'} else None, dedupe_threshold=configs['context_dedupe_threshold'])
+    log_writer = LogWriter()
+    log_writer.start()
+
+    if verbose:
+        click.echo(f"{YELLOW}[debug] startup: {time.monotonic() - start_time:.3f}s{RESET}")
+
+    # bounds the number of questions in flight at any one time
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    recorded_responses = {}
+
+    async def answer(question_tag, question, deadline_at):
+
+        tag, turns = resolved_tags[question_tag]
+
+        if summaries is not None:
+            # summaries are caught up from the output file, so any queued turns are written first
+            await log_writer.flush()
+        summary = await run_blocking(summaries.summarize, configs['output_file'], tag, configs['max_context_length']) if len(tag) > 0 and summaries is not None and turns is None else None
+
+        if turns is None and len(tag) > 0 and vectors is not None:
+            # the vector index catches up from the output file, so any queued turns are written first
+            await log_writer.flush()
+            turns = await run_blocking(vectors.search, configs['output_file'], tag, question, configs['semantic_top_k'])
+
+        if turns is None and len(tag) > 0 and summaries is None and question_tag not in phrases:
+            turns = windows.load(tag) if windows.is_seeded(tag) else await run_blocking(windows.load, tag)
+
+        # the chunks of the context files most relevant to the question fill whatever budget is left after it
+        question_context = additional_context
+        if len(documents) > 0:
+            document_context = await run_blocking(select_document_context, documents, question, configs['max_context_length'] - len(question.split()) - len(additional_context.split()))
+            question_context = (additional_context + ' ' + document_context).strip()
+
+        # each endpoint takes its own shape of context, which is built once and shared by the models using it
+        contexts = {}
+        for model_type in dict.fromkeys(model_types[model] for model in model_engines):
+            contexts[model_type] = await run_blocking(get_context, tag, configs['max_context_length'], configs['output_file'], model_engines[0], additional_context=question_context, context_keywords_only=configs['context_keywords_only'], keyword_extractor=configs['keyword_extractor'], model_type=model_type, question=question, debug=verbose, turns=turns, summary=summary, dedupe_threshold=configs['context_dedupe_threshold'], phrases=phrases.get(question_tag))
+
+        async def fetch(model):
+            start_time = time.monotonic()
+            response = await fetch_response(contexts[model_types[model]], model, max_tokens, temperature, model_types[model], hedge_policy=hedge_policy, singleflight=singleflight, scheduler=scheduler, priority='batch', key=tag, deadline=deadline_at)
+            return response, time.monotonic() - start_time
+
+        # the models are sent the question concurrently, and when comparing them, one model failing doesn't lose the
+        # others' responses
+        results = await asyncio.gather(*[fetch(model) for model in model_engines], return_exceptions=compare)
+
+        answers = []
+        for model, result in zip(model_engines, results):
+            if isinstance(result, BaseException) or result[0] is None:
+                error = f"{type(result).__name__}: {result}" if isinstance(result, BaseException) else "no response"
+                answers.append({'model': model, 'error': error})
+                continue
+
+            response, latency = result
+            response_text = response.choices[0].text.strip() if model_types[model] == 'v1/completions' else response.choices[0]['message']['content'].strip()
+            deformatted_response_text = response_text.replace("\n", " ")
+            prompt_tokens, completion_tokens = get_usage_from_response(response)
+
+            if log_responses:
+                log_tag = (f"{tag}/{model}" if len(tag) > 0 else model) if compare else tag
+                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                log_writer.write(configs['output_file'], format_log_entry(timestamp, log_tag, question, deformatted_response_text))
+                windows.append(log_tag, question.replace('|','').strip(), deformatted_response_text.replace('|','').strip())
+
+                # a response shared by coalesced questions only consumed tokens once
+                recorded_tokens = (prompt_tokens, completion_tokens) if id(response) not in recorded_responses else (0, 0)
+                recorded_responses[id(response)] = response
+                log_writer.write(configs['usage_file'], format_usage_row(timestamp, log_tag, model, *recorded_tokens, latency))
+
+            answers.append({
+                'model': model,
+                'response': response_text,
+                'deformatted_response': deformatted_response_text,
+                'latency': latency,
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+            })
 
-        # Wait for the response to be completed
-        response = await response_task
+        return answers
 
-        if not return_json and not quiet:
-            # Cancel the wait graphic task
-            wait_task.cancel()
-            print("\b" * 10 , end="", flush=True)
+    async def ask(question_tag, question):
 
-        response_text = response.choices[0].text.strip() if model_type == 'v1/completions' else response.choices[0]['message']['content'].strip()
-        deformatted_response_text = response.choices[0].text.strip().replace("\n", " ") if model_type == 'v1/completions' else response.choices[0]['message']['content'].strip().replace("\n", " ")
+        async with semaphore:
+            # the deadline covers building the question's context as well as every call to the API for it, but not
+            # the time spent waiting for a turn to run
+            deadline_at = time.monotonic() + deadline if deadline else None
+            try:
+                return await asyncio.wait_for(answer(question_tag, question, deadline_at), deadline or None)
+            except asyncio.TimeoutError:
+                return None
 
-        if configs['preserve_new_lines']:
-            response_text_to_print = f"\b{RED}[{configs['gpt_name']}] {response_text}{RESET}\n"
-        else:
-            # click.echo the response in color
-            response_text_to_print = f"\b{RED}[{configs['gpt_name']}] {deformatted_response_text}{RESET}\n"
+    def emit(question, answers):
 
-        if log_responses:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            with open (configs['output_file'], 'a') as f:
-                f.write(f"{timestamp}|{tag}|{question.replace('|','')}|{deformatted_response_text.replace('|','')}\n")
+        if answers is None:
+            error = f"no response within the {deadline:g}s deadline"
+            if return_json or quiet:
+                json_output.append({'question': question, 'response': None, 'error': error})
+            else:
+                click.echo(f"\b{RED}FAILED to answer the question, {error}.{RESET}\n")
 
-        if return_json or quiet:
+        elif compare and (return_json or quiet):
             json_output.append({
                 'question': question,
-                'response': deformatted_response_text
+                'responses': [{
+                    'model': answer['model'],
+                    'response': None,
+                    'error': answer['error'],
+                } if 'error' in answer else {
+                    'model': answer['model'],
+                    'response': answer['deformatted_response'],
+                    'latency': round(answer['latency'], 3),
+                    'prompt_tokens': answer['prompt_tokens'],
+                    'completion_tokens': answer['completion_tokens'],
+                } for answer in answers]
+            })
+        elif return_json or quiet:
+            json_output.append({
+                'question': question,
+                'response': answers[0]['deformatted_response']
             })
         else:
-            click.echo(response_text_to_print)
+            for answer in answers:
+                if 'error' in answer:
+                    click.echo(f"\b{RED}[{configs['gpt_name']} {answer['model']}] FAILED to answer the question, {answer['error']}{RESET}\n")
+                    continue
+
+                response_text = answer['response'] if configs['preserve_new_lines'] else answer['deformatted_response']
+                if compare:
+                    # click.echo each model's response in color, followed by its latency and token usage
+                    click.echo(f"\b{RED}[{configs['gpt_name']} {answer['model']}] {response_text}{RESET}")
+                    click.echo(f"{YELLOW}({answer['latency']:.2f}s, {answer['prompt_tokens']} prompt tokens, {answer['completion_tokens']} completion tokens){RESET}\n")
+                else:
+                    # click.echo the response in color
+                    click.echo(f"\b{RED}[{configs['gpt_name']}] {response_text}{RESET}\n")
+
+    async def run_questions():
+
+        wait_task = None
+        try:
+            if concurrency > 1:
+
+                if not return_json and not quiet:
+                    # we create the callable wait_graphic task
+                    wait_task = asyncio.create_task(wait_graphic())
+
+                # questions are answered concurrently, but printed in the order they were asked
+                results = await asyncio.gather(*[ask(question_tag, question) for question_tag, question in tagged_questions])
+
+                if not return_json and not quiet:
+                    # Cancel the wait graphic task
+                    wait_task.cancel()
+                    print("\b" * 10 , end="", flush=True)
+
+                for (_, question), answers in zip(tagged_questions, results):
+                    if not return_json and not quiet:
+                        print(f"{CYAN}[{configs['your_name']}] {question}{RESET} \n", end="", flush=True)
+                    emit(question, answers)
+
+            else:
+
+                # Continuously send and receive messages
+                for question_tag, question in tagged_questions:
+
+                    if not return_json and not quiet:
+                        # click.echo the question in color
+                        print(f"{CYAN}[{configs['your_name']}] {question}{RESET} \n", end="", flush=True)
+
+                        # we create the callable wait_graphic task
+                        wait_task = asyncio.create_task(wait_graphic())
+
+                    answers = await ask(question_tag, question)
+
+                    if not return_json and not quiet:
+                        # Cancel the wait graphic task
+                        wait_task.cancel()
+                        print("\b" * 10 , end="", flush=True)
+
+                    emit(question, answers)
+
+        finally:
+            # the wait graphic is stopped even if the batch is cancelled partway through
+            if wait_task is not None:
+                wait_task.cancel()
+
+    try:
+        # Ctrl-C cancels the questions in flight, and their requests to the API, rather than leaving them running
+        await run_cancellable(run_questions())
+
+    except RequestCancelled as e:
+        click.echo(f"\n{RED}FAILED to answer the remaining questions, the batch was {e}.{RESET}")
+
+    finally:
+        # anything still queued is written even if the batch is interrupted
+        await log_writer.close()
+
+    if verbose and hedge_policy is not None:
+        click.echo(f"{YELLOW}[debug] hedging: {hedge_policy.stats()}{RESET}")
+
+    if verbose and singleflight is not None:
+        click.echo(f"{YELLOW}[debug] coalescing: {singleflight.stats()}{RESET}")
+
+    if verbose:
+        click.echo(f"{YELLOW}[debug] scheduling: {scheduler.stats()}{RESET}")
+
+    if verbose:
+        click.echo(f"{YELLOW}[debug] log writer: {log_writer.stats()}{RESET}")
 
     # Add this line before the final return statement
     if return_json and not quiet:
         json_response = json.dumps(json_output)
         click.echo(json_response)
         # return json_response
-        return
\ No newline at end of file
+        return
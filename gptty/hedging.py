@@ -0,0 +1,143 @@
+__name__ = "gptty.hedging"
+__author__ = "Sig Janoska-Bedi"
+__credits__ = ["Sig Janoska-Bedi"]
+__version__ = "0.2.8"
+__license__ = "MIT"
+__maintainer__ = "Sig Janoska-Bedi"
+__email__ = "signe@atreeus.com"
+
+import time
+import math
+import asyncio
+from collections import deque
+
+from gptty.usage import recent_latencies
+
+
+class HedgePolicy:
+
+    """
+    Hedges slow requests to cut tail latency. If a request hasn't completed within a delay derived from a percentile
+    of recently observed latencies, a duplicate request is issued and whichever finishes first is used, cancelling
+    the other. The number of hedges is capped at a fraction of the requests the policy has made, so that extra 
+    spend stays bounded.
+
+    Parameters:
+    - percentile (float): The latency percentile, between 0 and 100, after which a request is hedged. Default is 95.
+    - min_delay (float): The minimum number of seconds to wait before hedging; also used until enough latencies have
+                         been observed. Default is 2.0.
+    - max_extra (float): The maximum number of hedges as a fraction of all requests. Default is 0.1.
+    - window (int): The number of recent latencies to compute the percentile over. Default is 100.
+    - min_samples (int): The number of latencies needed before the percentile is used. Default is 10.
+    """
+
+    def __init__(self, percentile:float=95.0, min_delay:float=2.0, max_extra:float=0.1, window:int=100, min_samples:int=10):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_extra = max_extra
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=window)
+
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def seed(self, latencies:list) -> None:
+        """
+        Adds latencies observed in earlier runs to the window, so that the delay is known from the first request.
+        Seeded latencies don't count towards the hedge budget, which only grows with the requests this policy makes.
+        """
+        self.latencies.extend(latencies)
+
+    def delay(self) -> float:
+        """
+        Returns the number of seconds to wait on a request before hedging it.
+        """
+        if len(self.latencies) < self.min_samples:
+            return self.min_delay
+
+        ordered = sorted(self.latencies)
+        index = max(0, math.ceil(self.percentile / 100 * len(ordered)) - 1)
+        return max(self.min_delay, ordered[index])
+
+    def can_hedge(self) -> bool:
+        """
+        Returns True if issuing another hedge would stay within the `max_extra` budget.
+        """
+        return self.hedges + 1 <= self.max_extra * self.requests
+
+    def stats(self) -> dict:
+        """
+        Returns counters on how many requests were made, how many were hedged and how often the hedge won.
+        """
+        return {
+            'requests': self.requests,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'hedge_win_rate': self.hedge_wins / self.hedges if self.hedges else 0.0,
+            'delay': self.delay(),
+        }
+
+    async def run(self, make_call):
+        """
+        Awaits `make_call()`, hedging it with a second `make_call()` if it is slower than `delay()`.
+
+        Parameters:
+        - make_call (callable): A function with no arguments that returns a new awaitable request each time it is called.
+
+        Returns:
+        - The result of whichever request completes successfully first. If both fail, the primary's exception is raised.
+        """
+        self.requests += 1
+        start_time = time.monotonic()
+
+        primary = asyncio.ensure_future(make_call())
+        tasks = [primary]
+
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.delay())
+
+            if primary not in done and self.can_hedge():
+                self.hedges += 1
+                tasks.append(asyncio.ensure_future(make_call()))
+
+            # wait for the first task to succeed, falling back to the remaining one if a task fails
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winners = [task for task in done if not task.cancelled() and task.exception() is None]
+                if winners:
+                    winner = winners[0]
+                    if winner is not primary:
+                        self.hedge_wins += 1
+                    self.latencies.append(time.monotonic() - start_time)
+                    return winner.result()
+
+            return primary.result()
+
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+
+def hedge_policy_from_configs(configs:dict):
+
+    """
+    Returns a HedgePolicy built from the app configs, or None if `hedge_requests` is disabled. The policy's latency
+    window is seeded with the most recent latencies recorded in the usage ledger.
+    """
+
+    if not configs.get('hedge_requests', False):
+        return None
+
+    policy = HedgePolicy(
+        percentile=configs['hedge_percentile'],
+        min_delay=configs['hedge_min_delay'],
+        max_extra=configs['hedge_max_extra'],
+    )
+
+    # seed the latency window from the usage ledger so the percentile carries over between runs
+    policy.seed(recent_latencies(configs['usage_file'], n=policy.latencies.maxlen))
+
+    return policy
@@ -0,0 +1,176 @@
+__name__ = "gptty.history"
+__author__ = "Sig Janoska-Bedi"
+__credits__ = ["Sig Janoska-Bedi"]
+__version__ = "0.2.8"
+__license__ = "MIT"
+__maintainer__ = "Sig Janoska-Bedi"
+__email__ = "signe@atreeus.com"
+
+import calendar
+import pandas as pd
+from array import array
+from datetime import datetime, timezone
+
+# the columns of the output file, in order
+HISTORY_COLUMNS = ['timestamp','tag','question','response']
+
+
+def parse_timestamp(timestamp:str) -> int:
+
+    """
+    Converts a '%Y-%m-%d %H:%M:%S' timestamp, as written to the output file, to an integer number of seconds. The
+    timestamp is treated as UTC so that `format_timestamp` returns the original string. Returns 0 if it is malformed.
+    """
+
+    try:
+        return calendar.timegm((int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]), int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19]), 0, 0, 0))
+    except ValueError:
+        return 0
+
+
+def format_timestamp(seconds:int) -> str:
+
+    """
+    Converts an integer number of seconds back to a '%Y-%m-%d %H:%M:%S' timestamp, see `parse_timestamp`.
+    """
+
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class History:
+
+    """
+    A compact, columnar in-memory representation of the output file. Instead of keeping each turn as a handful of
+    Python strings, tags are dictionary-encoded to small integers, timestamps are stored as an int64 array, and
+    questions and responses share one contiguous UTF-8 buffer addressed through an array of offsets. The turns of
+    each tag are also indexed by position, so a tag's history is a direct lookup rather than a scan.
+
+    Example usage:
+        >>> history = History.from_file('output.txt')
+        >>> context = get_context('shakespeare', 150, 'output.txt', 'gpt-3.5-turbo', question='who is he?', turns=history.turns('shakespeare'))
+        >>> history.to_dataframe()
+    """
+
+    def __init__(self):
+        self.tags = []                  # tag code -> tag
+        self.tag_codes = {}             # tag -> tag code
+        self.tag_column = array('I')    # tag code of each turn
+        self.timestamps = array('q')    # timestamp of each turn, see `parse_timestamp`
+        self.text = bytearray()         # questions and responses, UTF-8 encoded and concatenated
+        self.offsets = array('Q', [0])  # turn i has its question at offsets[2i]:offsets[2i+1] and response at offsets[2i+1]:offsets[2i+2]
+        self.positions = {}             # tag code -> positions of the turns with that tag
+
+    @classmethod
+    def from_file(cls, output_file:str):
+        """
+        Reads the output file into a new History. Malformed rows are skipped, and a missing file yields an empty History.
+        """
+        history = cls()
+        try:
+            f = open(output_file, 'r')
+        except FileNotFoundError:
+            return history
+
+        with f:
+            for row in f:
+                data = [item.strip() for item in row.split('|')]
+                if len(data) >= 4:
+                    history.append(data[0], data[1], data[2], data[3])
+        return history
+
+    def __len__(self):
+        return len(self.tag_column)
+
+    def append(self, timestamp:str, tag:str, question:str, response:str) -> None:
+        """
+        Appends a single turn.
+        """
+        code = self.tag_codes.get(tag)
+        if code is None:
+            code = len(self.tags)
+            self.tag_codes[tag] = code
+            self.tags.append(tag)
+            self.positions[code] = array('I')
+
+        self.positions[code].append(len(self.tag_column))
+        self.tag_column.append(code)
+        self.timestamps.append(parse_timestamp(timestamp))
+
+        self.text += question.encode('utf-8')
+        self.offsets.append(len(self.text))
+        self.text += response.encode('utf-8')
+        self.offsets.append(len(self.text))
+
+    def tag(self, i:int) -> str:
+        return self.tags[self.tag_column[i]]
+
+    def timestamp(self, i:int) -> str:
+        return format_timestamp(self.timestamps[i])
+
+    def question(self, i:int) -> str:
+        return self.text[self.offsets[2*i]:self.offsets[2*i+1]].decode('utf-8')
+
+    def response(self, i:int) -> str:
+        return self.text[self.offsets[2*i+1]:self.offsets[2*i+2]].decode('utf-8')
+
+    def tag_positions(self, tag:str) -> array:
+        """
+        Returns the positions of the turns logged under `tag`, oldest first.
+        """
+        code = self.tag_codes.get(tag)
+        return self.positions[code] if code is not None else array('I')
+
+    def turns(self, tag:str) -> list:
+        """
+        Returns the (question, response) turns logged under `tag`, oldest first, like `context.get_tag_turns`.
+        """
+        return [(self.question(i), self.response(i)) for i in self.tag_positions(tag)]
+
+    def select(self, selector, now:int=None) -> array:
+        """
+        Returns the positions of the turns picked out by a single `tagging.TagSelector`, oldest first. The time window,
+        if any, is applied before the positional slice, and is measured back from `now` (see `parse_timestamp`), which
+        defaults to the current time.
+        """
+        positions = self.tag_positions(selector.tag)
+
+        if selector.window is not None:
+            if now is None:
+                now = parse_timestamp(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            cutoff = now - selector.window
+
+            # turns are appended in time order, so walk back from the most recent until one falls outside the window
+            first = len(positions)
+            while first > 0 and self.timestamps[positions[first-1]] >= cutoff:
+                first -= 1
+            positions = positions[first:]
+
+        return positions[selector.start:selector.stop]
+
+    def select_turns(self, selectors:list, now:int=None) -> list:
+        """
+        Returns the (question, response) turns picked out by any of the selectors, as returned by 
+        `tagging.parse_tag_selectors`, oldest first and without duplicates.
+        """
+        positions = set()
+        for selector in selectors:
+            positions.update(self.select(selector, now=now))
+        return [(self.question(i), self.response(i)) for i in sorted(positions)]
+
+    def nbytes(self) -> int:
+        """
+        Returns the approximate number of bytes held by the columns, excluding the (small) tag dictionary.
+        """
+        columns = [self.tag_column, self.timestamps, self.offsets] + list(self.positions.values())
+        return len(self.text) + sum(column.itemsize * len(column) for column in columns)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Returns the history as a pandas df with the columns timestamp, tag, question and response.
+        """
+        return pd.DataFrame({
+            'timestamp': [self.timestamp(i) for i in range(len(self))],
+            'tag': [self.tag(i) for i in range(len(self))],
+            'question': [self.question(i) for i in range(len(self))],
+            'response': [self.response(i) for i in range(len(self))],
+        }, columns=HISTORY_COLUMNS)
@@ -0,0 +1,147 @@
+__name__ = "gptty.scheduling"
+__author__ = "Sig Janoska-Bedi"
+__credits__ = ["Sig Janoska-Bedi"]
+__version__ = "0.2.8"
+__license__ = "MIT"
+__maintainer__ = "Sig Janoska-Bedi"
+__email__ = "signe@atreeus.com"
+
+import time
+import heapq
+import asyncio
+import itertools
+
+# requests in a lower ranked class are always dispatched before those in a higher ranked one
+PRIORITY_CLASSES = {'interactive': 0, 'batch': 1}
+
+
+class QueueFullError(Exception):
+    """
+    Raised when a request is submitted to a FairScheduler whose queue for its priority class is full.
+    """
+
+
+class FairScheduler:
+
+    """
+    Schedules API requests from several callers that share one API key. At most `concurrency` requests run at once,
+    and the rest wait in a queue. Interactive requests are always dispatched before batch requests. Within a class,
+    requests are dispatched by weighted fair queuing across keys (eg. tags or callers). Each key is served in
+    proportion to its weight however many requests it has queued, so one large batch can't starve the others.
+
+    Parameters:
+    - concurrency (int): The maximum number of requests in flight at once. Default is 4.
+    - max_queue (int): The maximum number of requests waiting in each priority class, past which new requests are
+                       rejected with QueueFullError. Default is 256.
+
+    Example usage:
+        >>> scheduler = FairScheduler(concurrency=2)
+        >>> response = await scheduler.run(make_call, priority='interactive', key='alice')
+        >>> scheduler.stats()
+    """
+
+    def __init__(self, concurrency:int=4, max_queue:int=256):
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max_queue
+        self.active = 0
+        self.heap = []
+        self.sequence = itertools.count()
+
+        # the virtual time of the request dispatched last, and the virtual finish time of each key's last request
+        self.virtual_time = 0.0
+        self.finish_times = {}
+
+        self.queued = {priority: 0 for priority in PRIORITY_CLASSES}
+        self.metrics = {priority: {'requests': 0, 'rejected': 0, 'wait': 0.0, 'max_wait': 0.0} for priority in PRIORITY_CLASSES}
+
+    def stats(self) -> dict:
+        """
+        Returns, for each priority class, the number of requests dispatched and rejected, the number queued now, and
+        the mean and maximum seconds spent waiting in the queue.
+        """
+        return {
+            priority: {
+                'requests': metrics['requests'],
+                'rejected': metrics['rejected'],
+                'queued': self.queued[priority],
+                'mean_wait': metrics['wait'] / metrics['requests'] if metrics['requests'] else 0.0,
+                'max_wait': metrics['max_wait'],
+            } for priority, metrics in self.metrics.items()
+        }
+
+    def _record(self, priority:str, wait:float) -> None:
+        metrics = self.metrics[priority]
+        metrics['requests'] += 1
+        metrics['wait'] += wait
+        metrics['max_wait'] = max(metrics['max_wait'], wait)
+
+    def _dispatch(self) -> None:
+        while self.active < self.concurrency and self.heap:
+            _, _, _, start, future, priority, enqueued = heapq.heappop(self.heap)
+            if future.done():
+                # the caller was cancelled while it waited
+                continue
+
+            self.queued[priority] -= 1
+            self.virtual_time = max(self.virtual_time, start)
+            self.active += 1
+            self._record(priority, time.monotonic() - enqueued)
+            future.set_result(None)
+
+    def _release(self) -> None:
+        self.active -= 1
+        self._dispatch()
+
+    async def run(self, make_call, priority:str='batch', key:str='', weight:float=1.0):
+        """
+        Awaits a request once the scheduler dispatches it.
+
+        Parameters:
+        - make_call (callable): A function with no arguments that returns a new awaitable request.
+        - priority (str): The priority class of the request, see PRIORITY_CLASSES. Default is 'batch'.
+        - key (str): The key the request is queued fairly under, eg. a tag or caller. Default is ''.
+        - weight (float): The key's share of its class, relative to other keys. Default is 1.0.
+
+        Returns:
+        - The result of the request.
+
+        Raises:
+        - ValueError: If the priority class is not recognized.
+        - QueueFullError: If the queue for the priority class is full.
+        """
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Priority class '{priority}' is not recognized, expected one of {list(PRIORITY_CLASSES)}.")
+
+        if self.active < self.concurrency and not self.heap:
+            self.active += 1
+            self._record(priority, 0.0)
+
+        else:
+            if self.queued[priority] >= self.max_queue:
+                self.metrics[priority]['rejected'] += 1
+                raise QueueFullError(f"The {priority} queue is full ({self.max_queue} requests).")
+
+            # each request finishes 1 / weight after the later of now and its key's previous request, in virtual time
+            start = max(self.virtual_time, self.finish_times.get((priority, key), 0.0))
+            finish = start + 1.0 / weight
+            self.finish_times[(priority, key)] = finish
+
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self.heap, (PRIORITY_CLASSES[priority], finish, next(self.sequence), start, future, priority, time.monotonic()))
+            self.queued[priority] += 1
+
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # the request was dispatched just as the caller was cancelled, so its slot is handed on
+                    self._release()
+                else:
+                    future.cancel()
+                    self.queued[priority] -= 1
+                raise
+
+        try:
+            return await make_call()
+        finally:
+            self._release()
@@ -0,0 +1,141 @@
+__name__ = "gptty.search"
+__author__ = "Sig Janoska-Bedi"
+__credits__ = ["Sig Janoska-Bedi"]
+__version__ = "0.2.8"
+__license__ = "MIT"
+__maintainer__ = "Sig Janoska-Bedi"
+__email__ = "signe@atreeus.com"
+
+import os
+import sqlite3
+import threading
+
+# the columns of a search hit, in order
+SEARCH_COLUMNS = ['timestamp','tag','question','response']
+
+
+def to_match_expression(query:str) -> str:
+
+    """
+    Converts free text into an FTS5 match expression that matches turns containing every word of the query, quoting
+    each word so that punctuation like `what's` or `c++` isn't parsed as query syntax.
+    """
+
+    return ' '.join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+
+class SearchIndex:
+
+    """
+    A persistent full-text index over the questions and responses in the output file, backed by an SQLite FTS5
+    table. Like `summary.SummaryStore`, the index stores the byte offset of the output file it has indexed up to and
+    catches up with any rows appended since before each search, so it stays current without rescanning the log.
+
+    Parameters:
+    - path (str): Path to the SQLite database the index is kept in.
+
+    Example usage:
+        >>> index = SearchIndex.for_output_file('output.txt')
+        >>> index.search('output.txt', 'capital australia', tag='geography')
+    """
+
+    def __init__(self, path:str):
+        self.path = path
+        self.lock = threading.Lock()
+
+        # searches run in a worker thread, see `gptty.run_blocking`
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS turns USING fts5(timestamp UNINDEXED, tag UNINDEXED, question, response)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value INTEGER)")
+        self.connection.commit()
+
+    @classmethod
+    def for_output_file(cls, output_file:str):
+        """
+        Returns the index kept alongside a given output file.
+        """
+        return cls(f"{output_file}.search.sqlite")
+
+    @property
+    def offset(self) -> int:
+        row = self.connection.execute("SELECT value FROM state WHERE key = 'offset'").fetchone()
+        return row[0] if row else 0
+
+    def __len__(self):
+        return self.connection.execute("SELECT count(*) FROM turns").fetchone()[0]
+
+    def update(self, output_file:str) -> int:
+        """
+        Indexes any complete rows appended to the output file since the last update, rebuilding the index if the
+        output file has shrunk.
+
+        Returns:
+        - int: The number of rows indexed.
+        """
+        with self.lock:
+            try:
+                size = os.path.getsize(output_file)
+            except OSError:
+                return 0
+
+            # the write lock is taken before the offset is read, so that another process catching up at the same time
+            # waits for this one and then finds the rows already indexed, rather than indexing them again
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                offset = self.offset
+                if size < offset:
+                    self.connection.execute("DELETE FROM turns")
+                    offset = 0
+
+                rows = []
+                if size > offset:
+                    with open(output_file, 'rb') as f:
+                        f.seek(offset)
+                        data = f.read(size - offset)
+
+                    # only index complete rows, leaving any partially written row for the next update
+                    complete = data[:data.rfind(b'\n') + 1]
+                    for row in complete.decode('utf-8', errors='replace').split('\n'):
+                        fields = [item.strip() for item in row.split('|')]
+                        if len(fields) >= 4:
+                            rows.append(fields[:4])
+
+                    self.connection.executemany("INSERT INTO turns (timestamp, tag, question, response) VALUES (?, ?, ?, ?)", rows)
+                    self.connection.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('offset', ?)", (offset + len(complete),))
+
+                self.connection.commit()
+            except BaseException:
+                self.connection.rollback()
+                raise
+
+            return len(rows)
+
+    def query(self, query:str, tag:str=None, limit:int=10) -> list:
+        """
+        Returns up to `limit` turns containing every word of `query`, optionally only those logged under `tag`,
+        ranked by relevance (bm25) as (timestamp, tag, question, response) tuples.
+        """
+        expression = to_match_expression(query)
+        if len(expression) < 1:
+            return []
+
+        sql = "SELECT timestamp, tag, question, response FROM turns WHERE turns MATCH ?"
+        parameters = [expression]
+        if tag:
+            sql += " AND tag = ?"
+            parameters.append(tag)
+        sql += " ORDER BY rank LIMIT ?"
+        parameters.append(limit)
+
+        with self.lock:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def search(self, output_file:str, query:str, tag:str=None, limit:int=10) -> list:
+        """
+        Catches up with the output file and searches it, see `update` and `query`.
+        """
+        self.update(output_file)
+        return self.query(query, tag=tag, limit=limit)
+
+    def close(self) -> None:
+        self.connection.close()
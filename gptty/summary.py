@@ -0,0 +1,214 @@
+__name__ = "gptty.summary"
+__author__ = "Sig Janoska-Bedi"
+__credits__ = ["Sig Janoska-Bedi"]
+__version__ = "0.2.8"
+__license__ = "MIT"
+__maintainer__ = "Sig Janoska-Bedi"
+__email__ = "signe@atreeus.com"
+
+import os
+import re
+import json
+import hashlib
+import threading
+
+from gptty.context import get_stop_words
+
+# splits text into sentences on terminal punctuation
+SENTENCE_PATTERN = re.compile(r'(?<=[.!?])\s+')
+WORD_PATTERN = re.compile(r"[\w][\w'-]*")
+
+
+def split_sentences(text:str) -> list:
+
+    """
+    Splits text into sentences on terminal punctuation, dropping empty sentences.
+    """
+
+    return [sentence.strip() for sentence in SENTENCE_PATTERN.split(text) if sentence.strip()]
+
+
+class SummaryStore:
+
+    """
+    Maintains a rolling extractive summary for each tag in the output file, without any API calls. For each tag, the
+    store keeps the frequency of every content word seen so far and a bounded pool of the highest scoring sentences,
+    where a sentence scores the mean frequency of its content words across the tag's whole history, with a mild
+    boost for recency. New turns are folded in incrementally, so looking up the summary of a tag with thousands of
+    turns only costs as much as the turns appended since the last lookup.
+
+    The store is persisted to a directory next to the output file, with one JSON file per tag, so that folding in a
+    turn only rewrites the file of its own tag, and a tag's file is only read once it is needed. The byte offset of
+    the output file that the store has processed up to is kept alongside, so it can catch up with turns written by
+    other gptty processes. Each tag's file also records the offset it is current to, so that rows are never folded
+    into a tag twice if gptty stops between saving a tag and saving the offset. Files are written to a temporary 
+    file and then moved into place, so an interrupted write never leaves a corrupt file.
+
+    Parameters:
+    - path (str): Path to the directory the store is persisted to.
+    - max_sentences (int): The number of sentences kept in each tag's pool. Default is 50.
+    - stop_words (frozenset): Words that are ignored when scoring sentences. Defaults to `context.get_stop_words()`.
+
+    Example usage:
+        >>> store = SummaryStore.for_output_file('output.txt')
+        >>> store.summarize('output.txt', 'shakespeare', max_words=150)
+    """
+
+    def __init__(self, path:str, max_sentences:int=50, stop_words:frozenset=None):
+        self.path = path
+        self.max_sentences = max_sentences
+        self._stop_words = stop_words
+        self.offset = 0
+        self.tags = {}
+        self.lock = threading.Lock()
+
+        os.makedirs(path, exist_ok=True)
+        try:
+            with open(self._file('state.json'), 'r') as f:
+                self.offset = json.load(f)['offset']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    @classmethod
+    def for_output_file(cls, output_file:str, **kwargs):
+        """
+        Returns the store kept alongside a given output file.
+        """
+        return cls(f"{output_file}.summaries", **kwargs)
+
+    def _file(self, name:str) -> str:
+        return os.path.join(self.path, name)
+
+    def _tag_file(self, tag:str) -> str:
+        return self._file(hashlib.sha1(tag.encode('utf-8')).hexdigest() + '.json')
+
+    def _write(self, path:str, data:dict) -> None:
+        with open(path + '.tmp', 'w') as f:
+            json.dump(data, f)
+        os.replace(path + '.tmp', path)
+
+    def get_state(self, tag:str) -> dict:
+        """
+        Returns the summary state of a tag, reading it from disk the first time it is needed, or None for an unknown tag.
+        """
+        if tag not in self.tags:
+            try:
+                with open(self._tag_file(tag), 'r') as f:
+                    self.tags[tag] = json.load(f)
+            except (OSError, ValueError):
+                return None
+        return self.tags[tag]
+
+    @property
+    def stop_words(self) -> frozenset:
+        if self._stop_words is None:
+            self._stop_words = get_stop_words()
+        return self._stop_words
+
+    def content_words(self, sentence:str) -> list:
+        return [word for word in WORD_PATTERN.findall(sentence.lower()) if word not in self.stop_words]
+
+    def score(self, state:dict, position:int, sentence:str) -> float:
+        """
+        Scores a sentence as the mean frequency of its content words in the tag, boosted by up to 2x for recency.
+        """
+        words = self.content_words(sentence)
+        if len(words) < 1:
+            return 0.0
+        relevance = sum(state['terms'].get(word, 0) for word in words) / len(words)
+        return relevance * (1 + (position + 1) / state['turns'])
+
+    def add_turn(self, tag:str, question:str, response:str) -> None:
+        """
+        Folds a single turn into the summary of its tag.
+        """
+        state = self.get_state(tag)
+        if state is None:
+            state = self.tags[tag] = {'offset': 0, 'turns': 0, 'terms': {}, 'sentences': []}
+        position = state['turns']
+        state['turns'] += 1
+
+        new_sentences = split_sentences(question) + split_sentences(response)
+        terms = state['terms']
+        for sentence in new_sentences:
+            for word in self.content_words(sentence):
+                terms[word] = terms.get(word, 0) + 1
+
+        # rescore the pool along with the new sentences and keep the best, as [position, index in turn, sentence]
+        pool = state['sentences'] + [[position, index, sentence] for index, sentence in enumerate(new_sentences)]
+        pool.sort(key=lambda item: self.score(state, item[0], item[2]), reverse=True)
+        state['sentences'] = pool[:self.max_sentences]
+
+    def update(self, output_file:str) -> bool:
+        """
+        Folds in any complete rows appended to the output file since the last update, rebuilding from scratch if
+        the output file has shrunk. Saves the tags that changed.
+
+        Returns:
+        - bool: True if any rows were added.
+        """
+        with self.lock:
+            try:
+                size = os.path.getsize(output_file)
+            except OSError:
+                return False
+
+            if size < self.offset:
+                self.offset = 0
+                self.tags = {}
+                for name in os.listdir(self.path):
+                    os.remove(self._file(name))
+
+            if size == self.offset:
+                return False
+
+            with open(output_file, 'rb') as f:
+                f.seek(self.offset)
+                data = f.read(size - self.offset)
+
+            # only process complete rows, leaving any partially written row for the next update
+            complete = data[:data.rfind(b'\n') + 1]
+            changed, start = set(), self.offset
+            for row in complete.split(b'\n')[:-1]:
+                fields = [item.strip() for item in row.decode('utf-8', errors='replace').split('|')]
+                if len(fields) >= 4:
+                    # skip rows that were folded into the tag before the offset was last saved
+                    state = self.get_state(fields[1])
+                    if state is None or start >= state['offset']:
+                        self.add_turn(fields[1], fields[2], fields[3])
+                        changed.add(fields[1])
+                start += len(row) + 1
+
+            self.offset += len(complete)
+            for tag in changed:
+                self.tags[tag]['offset'] = self.offset
+                self._write(self._tag_file(tag), self.tags[tag])
+            self._write(self._file('state.json'), {'offset': self.offset})
+
+            return len(complete) > 0
+
+    def get_summary(self, tag:str, max_words:int) -> str:
+        """
+        Returns the summary of a tag: its best scoring sentences that fit within `max_words`, in chronological order.
+        Returns an empty string for an unknown tag.
+        """
+        state = self.get_state(tag)
+        if state is None:
+            return ""
+
+        selected, word_count = [], 0
+        for position, index, sentence in state['sentences']:
+            length = len(sentence.split())
+            if word_count + length > max_words:
+                continue
+            selected.append((position, index, sentence))
+            word_count += length
+
+        return ' '.join(sentence for _, _, sentence in sorted(selected))
+
+    def summarize(self, output_file:str, tag:str, max_words:int) -> str:
+        """
+        Catches up with the output file and returns the summary of a tag, see `update` and `get_summary`.
+        """
+        self.update(output_file)
+        return self.get_summary(tag, max_words)
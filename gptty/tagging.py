@@ -7,6 +7,9 @@ __license__ = "MIT"
 __maintainer__ = "Sig Janoska-Bedi"
 __email__ = "signe@atreeus.com"
 
+import re
+from collections import namedtuple
+
 # def old_get_tag_from_text(user_input, replacement_string='-'):
 
 #     # Initialize the tag and remaining text variables
@@ -97,4 +100,139 @@ def get_tag_from_text(user_input, replacement_string='-'):
     if tag is not None:
         return tag, remaining_text
     else:
-        return '', remaining_text
\ No newline at end of file
+        return '', remaining_text
+
+# a single term of a tag selector, eg. `infra`, `infra:-5:` or `infra@24h`
+SELECTOR_PATTERN = re.compile(r'^(?P<tag>[^:@]+?)(?::(?P<start>(?:-?\d+)?)(?::(?P<stop>(?:-?\d+)?))?)?(?:@(?P<window>\d+)(?P<unit>[smhdw]))?$')
+
+# the number of seconds in each unit of a time window
+WINDOW_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+TagSelector = namedtuple('TagSelector', ['tag', 'start', 'stop', 'window'])
+
+
+def parse_tag_selectors(tag):
+
+    """
+    This function parses a tag, as returned by `get_tag_from_text`, into the selectors that pick out the turns used as context. A tag is a comma separated list of terms, and each term is a tag name optionally followed by a positional slice over that tag's turns and / or a time window:
+
+        infra               -   every turn logged under infra
+        infra,db            -   every turn logged under infra or db
+        infra:-5:           -   the last five turns logged under infra, like the python slice [-5:]
+        infra:2:4           -   the third and fourth turns logged under infra
+        infra@24h           -   turns logged under infra in the last 24 hours; units are s, m, h, d and w
+        infra:-5:@7d        -   the last five turns logged under infra in the last week
+
+    Terms that don't follow this grammar, eg. `a:b`, are treated as a literal tag name.
+
+    Parameters:
+
+        tag (str): The tag to parse.
+
+    Returns:
+
+        List: A list of TagSelector(tag, start, stop, window) tuples, where start and stop are ints or None and window is a number of seconds or None. Empty if the tag is empty.
+    """
+
+    selectors = []
+    for term in re.split(r'-*,-*', tag):
+        if len(term) < 1:
+            continue
+
+        match = SELECTOR_PATTERN.match(term)
+        if match is None:
+            selectors.append(TagSelector(term, None, None, None))
+            continue
+
+        start, stop = match.group('start'), match.group('stop')
+        window = int(match.group('window')) * WINDOW_UNITS[match.group('unit')] if match.group('window') else None
+        selectors.append(TagSelector(match.group('tag'), int(start) if start else None, int(stop) if stop else None, window))
+
+    return selectors
+
+
+def is_plain_tag(selectors):
+
+    """
+    This function returns True if the selectors, as returned by `parse_tag_selectors`, select every turn of a single tag, ie. the tag can be used as-is.
+    """
+
+    return len(selectors) == 1 and selectors[0].start is None and selectors[0].stop is None and selectors[0].window is None
+
+
+class TagTrie:
+
+    """
+    This class is a prefix tree over tag names, used to complete `[tag]` prefixes as they are typed. Looking up the tags that start with a prefix only walks the prefix and the tags below it, so it costs the same however many questions have been logged. Tags are added once, eg. from `History.tags`, and then as they are first written.
+
+    Example usage:
+
+        >>> trie = TagTrie(['infra', 'ingest', 'db'])
+        >>> trie.complete('in')
+        ['infra', 'ingest']
+    """
+
+    # marks the node at the end of a tag name; no tag contains an empty character, and it sorts first
+    END = ''
+
+    def __init__(self, tags=()):
+        self.root = {}
+        self.size = 0
+        for tag in tags:
+            self.add(tag)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, tag):
+        node = self._find(tag)
+        return node is not None and self.END in node
+
+    def _find(self, prefix):
+        node = self.root
+        for character in prefix:
+            node = node.get(character)
+            if node is None:
+                return None
+        return node
+
+    def add(self, tag):
+
+        """
+        Adds a tag, returning True if it wasn't already in the trie. Empty tags are ignored.
+        """
+
+        if len(tag) < 1:
+            return False
+
+        node = self.root
+        for character in tag:
+            node = node.setdefault(character, {})
+
+        if self.END in node:
+            return False
+
+        node[self.END] = {}
+        self.size += 1
+        return True
+
+    def complete(self, prefix, limit=20):
+
+        """
+        Returns up to `limit` tags that start with `prefix`, in alphabetical order.
+        """
+
+        node = self._find(prefix)
+        if node is None:
+            return []
+
+        completions = []
+        stack = [(prefix, node)]
+        while stack and len(completions) < limit:
+            tag, node = stack.pop()
+            if self.END in node:
+                completions.append(tag)
+            # children are pushed in reverse so they are popped in alphabetical order
+            stack.extend((tag + character, child) for character, child in sorted(node.items(), reverse=True) if character != self.END)
+
+        return completions
@@ -0,0 +1,146 @@
+__name__ = "gptty.usage"
+__author__ = "Sig Janoska-Bedi"
+__credits__ = ["Sig Janoska-Bedi"]
+__version__ = "0.2.8"
+__license__ = "MIT"
+__maintainer__ = "Sig Janoska-Bedi"
+__email__ = "signe@atreeus.com"
+
+from collections import defaultdict, deque
+
+# estimated prices in USD per 1,000 tokens as (prompt, completion), see <https://openai.com/pricing>. Models
+# are matched on the longest prefix, so more specific entries take priority over their model family.
+MODEL_PRICING = {
+    'text-davinci': (0.02, 0.02),
+    'text-curie': (0.002, 0.002),
+    'davinci': (0.02, 0.02),
+    'curie': (0.002, 0.002),
+    'gpt-3.5-turbo': (0.0015, 0.002),
+    'gpt-3.5-turbo-16k': (0.003, 0.004),
+    'gpt-4': (0.03, 0.06),
+    'gpt-4-32k': (0.06, 0.12),
+    'gpt-4-1106': (0.01, 0.03),
+    'gpt-4-turbo': (0.01, 0.03),
+}
+
+# the columns written to the usage ledger, in order
+USAGE_COLUMNS = ['timestamp','tag','model','prompt_tokens','completion_tokens','latency','cost']
+
+# the keys that `aggregate_usage` can group by
+USAGE_GROUPS = ['tag','model','day']
+
+
+def estimate_cost(model_name:str, prompt_tokens:int, completion_tokens:int) -> float:
+
+    """
+    Estimates the cost in USD of a single request based on the MODEL_PRICING table.
+
+    Parameters:
+    - model_name (str): The name of the model that served the request.
+    - prompt_tokens (int): The number of tokens in the prompt.
+    - completion_tokens (int): The number of tokens in the completion.
+
+    Returns:
+    - float: The estimated cost, or 0.0 if the model is not in the pricing table.
+    """
+
+    matches = [prefix for prefix in MODEL_PRICING if model_name.startswith(prefix)]
+    if not matches:
+        return 0.0
+
+    prompt_price, completion_price = MODEL_PRICING[max(matches, key=len)]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+def get_usage_from_response(response) -> tuple:
+
+    """
+    Returns the (prompt_tokens, completion_tokens) reported in the `usage` field of a Completion or ChatCompletion
+    response, defaulting to zero for any value that is missing.
+    """
+
+    try:
+        usage = response['usage']
+    except (KeyError, TypeError):
+        return 0, 0
+
+    return int(usage.get('prompt_tokens', 0)), int(usage.get('completion_tokens', 0))
+
+
+def format_usage_row(timestamp:str, tag:str, model_name:str, prompt_tokens:int, completion_tokens:int, latency:float, cost:float=None) -> str:
+
+    """
+    Returns a single row of the usage ledger, in the same pipe-delimited format as the output file, including its 
+    trailing newline. The cost is estimated if it isn't passed.
+    """
+
+    if cost is None:
+        cost = estimate_cost(model_name, prompt_tokens, completion_tokens)
+
+    return f"{timestamp}|{tag}|{model_name}|{prompt_tokens}|{completion_tokens}|{latency:.3f}|{cost:.6f}\n"
+
+
+def aggregate_usage(usage_file:str, by:str='day') -> dict:
+
+    """
+    Aggregates the usage ledger in a single streaming pass, without loading the file into memory.
+
+    Parameters:
+    - usage_file (str): Path to the usage ledger.
+    - by (str): The key to group by, one of 'tag', 'model' or 'day'. Default is 'day'.
+
+    Returns:
+    - dict: Maps each group to a dict with the keys 'requests', 'prompt_tokens', 'completion_tokens', 'latency'
+            (mean seconds per request) and 'cost'. Groups are sorted by key.
+
+    Raises:
+    - ValueError: If `by` is not a valid grouping.
+    """
+
+    if by not in USAGE_GROUPS:
+        raise ValueError(f"Cannot group usage by '{by}', expected one of {USAGE_GROUPS}.")
+
+    totals = defaultdict(lambda: {'requests': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'latency': 0.0, 'cost': 0.0})
+
+    try:
+        f = open(usage_file, 'r')
+    except FileNotFoundError:
+        return {}
+
+    with f:
+        for row in f:
+            data = row.rstrip('\n').split('|')
+            if len(data) != len(USAGE_COLUMNS):
+                continue
+
+            timestamp, tag, model_name, prompt_tokens, completion_tokens, latency, cost = data
+            key = {'tag': tag, 'model': model_name, 'day': timestamp[:10]}[by]
+
+            group = totals[key]
+            group['requests'] += 1
+            group['prompt_tokens'] += int(prompt_tokens)
+            group['completion_tokens'] += int(completion_tokens)
+            group['latency'] += float(latency)
+            group['cost'] += float(cost)
+
+    for group in totals.values():
+        group['latency'] = group['latency'] / group['requests']
+
+    return dict(sorted(totals.items()))
+
+
+def recent_latencies(usage_file:str, n:int=100) -> list:
+
+    """
+    Returns the latencies, in seconds, of the last `n` requests in the usage ledger, oldest first.
+    """
+
+    try:
+        f = open(usage_file, 'r')
+    except FileNotFoundError:
+        return []
+
+    with f:
+        rows = deque((row.rstrip('\n').split('|') for row in f), maxlen=n)
+
+    return [float(data[5]) for data in rows if len(data) == len(USAGE_COLUMNS)]
@@ -0,0 +1,296 @@
+__name__ = "gptty.vectors"
+__author__ = "Sig Janoska-Bedi"
+__credits__ = ["Sig Janoska-Bedi"]
+__version__ = "0.2.8"
+__license__ = "MIT"
+__maintainer__ = "Sig Janoska-Bedi"
+__email__ = "signe@atreeus.com"
+
+import os
+import re
+import json
+import hashlib
+import threading
+from contextlib import contextmanager
+import numpy as np
+import openai
+
+try:
+    import fcntl
+except ImportError:
+    # file locks are only taken where they are available, ie. on Unix
+    fcntl = None
+
+# the name of the bundled embedder, which hashes words and word pairs into a fixed number of dimensions
+HASH_EMBEDDER = 'hash'
+HASH_DIMENSIONS = 256
+
+# the number of turns embedded per request to the embeddings endpoint
+EMBEDDING_BATCH_SIZE = 64
+
+# the files each row of the index is appended to, and the size of a row in each, given the number of dimensions
+ROW_FILES = (('embeddings.f32', lambda dimensions: dimensions * 4), ('turns.i64', lambda dimensions: 16), ('tags.i32', lambda dimensions: 4))
+
+TERM_PATTERN = re.compile(r'\w+')
+
+
+def normalize_rows(matrix:np.ndarray) -> np.ndarray:
+
+    """
+    Scales each row of a matrix to unit length, so that dot products between rows are cosine similarities.
+    """
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1)
+
+
+def hash_embeddings(texts:list, dimensions:int=HASH_DIMENSIONS) -> np.ndarray:
+
+    """
+    Embeds texts without a model by hashing their words and word pairs into `dimensions` signed buckets. Texts that
+    share vocabulary end up close together, which is a reasonable stand-in for semantic similarity on short turns.
+
+    Returns:
+    - np.ndarray: A (len(texts), dimensions) float32 matrix with unit length rows.
+    """
+
+    matrix = np.zeros((len(texts), dimensions), dtype=np.float32)
+
+    for i, text in enumerate(texts):
+        words = TERM_PATTERN.findall(text.lower())
+        for feature in words + [a + ' ' + b for a, b in zip(words, words[1:])]:
+            digest = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+            matrix[i, digest % dimensions] += 1.0 if digest >> 63 else -1.0
+
+    return normalize_rows(matrix)
+
+
+def endpoint_embeddings(texts:list, model:str, api_base:str=None) -> np.ndarray:
+
+    """
+    Embeds texts with an OpenAI-compatible embeddings endpoint, in batches of EMBEDDING_BATCH_SIZE.
+
+    Parameters:
+    - texts (list): The texts to embed.
+    - model (str): The embeddings model to request.
+    - api_base (str): The base URL of the endpoint, eg. a local server. If empty, the OpenAI API is used.
+
+    Returns:
+    - np.ndarray: A (len(texts), dimensions) float32 matrix with unit length rows.
+    """
+
+    kwargs = {'api_base': api_base} if api_base else {}
+    rows = []
+
+    for i in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+        response = openai.Embedding.create(input=list(texts[i:i + EMBEDDING_BATCH_SIZE]), model=model, **kwargs)
+        rows.extend(item['embedding'] for item in sorted(response['data'], key=lambda item: item['index']))
+
+    return normalize_rows(np.array(rows, dtype=np.float32))
+
+
+class VectorIndex:
+
+    """
+    A local vector index over the turns in the output file, used to retrieve the past turns of a tag that are most
+    relevant to a question. Like `search.SearchIndex`, it stores the byte offset of the output file it has indexed
+    up to and catches up with any rows appended since before each search.
+
+    The index is kept in a directory alongside the output file. Embeddings are appended to a float32 matrix, which
+    is memory-mapped to search it, and each row's tag and location in the output file are appended to smaller
+    arrays, so existing rows are never rewritten. Several processes, eg. a chat and a query, can share an index:
+    each update and search takes a lock on the index and re-reads its state from disk first.
+
+    Parameters:
+    - path (str): Path to the directory the index is kept in.
+    - model (str): The embeddings model, or HASH_EMBEDDER to use the bundled hasher. Default is HASH_EMBEDDER.
+    - api_base (str): The base URL of the embeddings endpoint, see `endpoint_embeddings`. Default is None.
+
+    Example usage:
+        >>> index = VectorIndex.for_output_file('output.txt')
+        >>> index.search('output.txt', 'geography', 'What is the capital of Australia?', k=5)
+    """
+
+    def __init__(self, path:str, model:str=HASH_EMBEDDER, api_base:str=None):
+        self.path = path
+        self.model = model
+        self.api_base = api_base
+        self.lock = threading.Lock()
+
+        os.makedirs(path, exist_ok=True)
+        with self._locked():
+            self._sync()
+
+    @classmethod
+    def for_output_file(cls, output_file:str, model:str=HASH_EMBEDDER, api_base:str=None):
+        """
+        Returns the index kept alongside a given output file.
+        """
+        return cls(f"{output_file}.vectors", model=model, api_base=api_base)
+
+    def _file(self, name:str) -> str:
+        return os.path.join(self.path, name)
+
+    def _read_state(self) -> dict:
+        try:
+            with open(self._file('state.json'), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'model': None, 'dimensions': None, 'offset': 0, 'rows': 0, 'tags': []}
+
+    def _write_state(self) -> None:
+        with open(self._file('state.json.tmp'), 'w') as f:
+            json.dump(self.state, f)
+        os.replace(self._file('state.json.tmp'), self._file('state.json'))
+
+    @contextmanager
+    def _locked(self):
+        # the thread lock serializes this process's readers and writers, and the file lock other processes'
+        with self.lock, open(self._file('index.lock'), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _sync(self) -> None:
+        """
+        Re-reads the index's state from disk, since another process may have updated it, and checks it against the
+        sizes of the row files. Must be called while holding `_locked`.
+        """
+        self.state = self._read_state()
+
+        # an index built with another embedder isn't comparable, so it is started over
+        if self.state['model'] != self.model:
+            self.state = {'model': self.model, 'dimensions': None, 'offset': 0, 'rows': 0, 'tags': []}
+
+        sizes = {name: os.path.getsize(self._file(name)) if os.path.exists(self._file(name)) else 0 for name, _ in ROW_FILES}
+        expected = {name: self.state['rows'] * row_size(self.state['dimensions'] or 0) for name, row_size in ROW_FILES}
+        if sizes == expected:
+            return
+
+        if all(sizes[name] >= expected[name] for name in sizes):
+            # drop anything written after the state was last saved, eg. by an update that was interrupted
+            truncate = expected
+        else:
+            # rows the state counts are missing, so the index is rebuilt from the start of the output file
+            self.state.update({'dimensions': None, 'offset': 0, 'rows': 0, 'tags': []})
+            truncate = {name: 0 for name in sizes}
+
+        for name, size in truncate.items():
+            with open(self._file(name), 'ab') as f:
+                f.truncate(size)
+        self._write_state()
+
+    def __len__(self):
+        return self.state['rows']
+
+    def embed(self, texts:list) -> np.ndarray:
+        """
+        Embeds texts with the index's embedder.
+        """
+        if self.model == HASH_EMBEDDER:
+            return hash_embeddings(texts)
+        return endpoint_embeddings(texts, self.model, api_base=self.api_base)
+
+    def update(self, output_file:str) -> int:
+        """
+        Embeds any complete rows appended to the output file since the last update, rebuilding the index if the
+        output file has shrunk.
+
+        Returns:
+        - int: The number of rows embedded.
+        """
+        with self._locked():
+            self._sync()
+
+            try:
+                size = os.path.getsize(output_file)
+            except OSError:
+                return 0
+
+            if size < self.state['offset']:
+                self.state.update({'dimensions': None, 'offset': 0, 'rows': 0, 'tags': []})
+                for name, _ in ROW_FILES:
+                    open(self._file(name), 'wb').close()
+
+            offset = self.state['offset']
+            if size == offset:
+                return 0
+
+            with open(output_file, 'rb') as f:
+                f.seek(offset)
+                data = f.read(size - offset)
+
+            # only index complete rows, leaving any partially written row for the next update
+            complete = data[:data.rfind(b'\n') + 1]
+            texts, locations, tags = [], [], []
+            start = offset
+            for row in complete.split(b'\n')[:-1]:
+                fields = [item.strip() for item in row.decode('utf-8', errors='replace').split('|')]
+                if len(fields) >= 4:
+                    texts.append(fields[2] + ' ' + fields[3])
+                    locations.append((start, start + len(row)))
+                    tags.append(fields[1])
+                start += len(row) + 1
+
+            if len(texts) > 0:
+                embeddings = self.embed(texts).astype(np.float32)
+                tag_ids = {tag: i for i, tag in enumerate(self.state['tags'])}
+
+                with open(self._file('embeddings.f32'), 'ab') as f:
+                    f.write(embeddings.tobytes())
+                with open(self._file('turns.i64'), 'ab') as f:
+                    f.write(np.array(locations, dtype=np.int64).tobytes())
+                with open(self._file('tags.i32'), 'ab') as f:
+                    f.write(np.array([tag_ids.setdefault(tag, len(tag_ids)) for tag in tags], dtype=np.int32).tobytes())
+
+                self.state['dimensions'] = embeddings.shape[1]
+                self.state['rows'] += len(texts)
+                self.state['tags'] = list(tag_ids)
+
+            self.state['offset'] = offset + len(complete)
+            self._write_state()
+
+            return len(texts)
+
+    def query(self, output_file:str, tag:str, question:str, k:int=5) -> list:
+        """
+        Returns the `k` turns logged under `tag` that are most similar to `question`, as (question, response) tuples
+        in the order they were logged.
+        """
+        with self._locked():
+            self._sync()
+            if tag not in self.state['tags'] or self.state['rows'] < 1 or k < 1:
+                return []
+
+            rows, dimensions = self.state['rows'], self.state['dimensions']
+            tag_ids = np.fromfile(self._file('tags.i32'), dtype=np.int32, count=rows)
+            candidates = np.flatnonzero(tag_ids == self.state['tags'].index(tag))
+
+            embeddings = np.memmap(self._file('embeddings.f32'), dtype=np.float32, mode='r', shape=(rows, dimensions))
+            scores = embeddings[candidates] @ self.embed([question])[0]
+            del embeddings
+
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(-scores, k - 1)[:k]]
+
+            locations = np.fromfile(self._file('turns.i64'), dtype=np.int64, count=rows * 2).reshape(rows, 2)
+
+        turns = []
+        with open(output_file, 'rb') as f:
+            for start, end in locations[np.sort(candidates)]:
+                f.seek(start)
+                fields = [item.strip() for item in f.read(end - start).decode('utf-8', errors='replace').split('|')]
+                turns.append((fields[2], fields[3]))
+
+        return turns
+
+    def search(self, output_file:str, tag:str, question:str, k:int=5) -> list:
+        """
+        Catches up with the output file and retrieves the turns most relevant to a question, see `update` and `query`.
+        """
+        self.update(output_file)
+        return self.query(output_file, tag, question, k=k)
@@ -17,6 +17,9 @@ setup(
     url="https://github.com/signebedi/gptty",
     packages=['gptty'],
     install_requires=REQUIRED,
+    extras_require={
+        'parquet': ['pyarrow'],
+    },
     entry_points={
         'console_scripts': [
             'gptty=gptty.__main__:main',
@@ -0,0 +1,74 @@
+import asyncio
+import unittest
+from gptty.coalescing import SingleFlight, request_key
+
+
+class TestCoalescing(unittest.TestCase):
+
+    def test_request_key(self):
+        prompt = [{"role": "user", "content": "What is an abstraction?"}]
+        self.assertEqual(request_key('gpt-4', 'v1/chat/completions', prompt, 0.0, 250), request_key('gpt-4', 'v1/chat/completions', list(prompt), 0.0, 250))
+        self.assertNotEqual(request_key('gpt-4', 'v1/chat/completions', prompt, 0.0, 250), request_key('gpt-4', 'v1/chat/completions', prompt, 0.5, 250))
+
+    def test_identical_requests_are_coalesced(self):
+        singleflight = SingleFlight()
+        calls = []
+
+        async def make_call():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 'response'
+
+        async def main():
+            return await asyncio.gather(*[singleflight.do('key', make_call) for _ in range(5)])
+
+        results = asyncio.run(main())
+        self.assertEqual(results, ['response'] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(singleflight.stats(), {'calls': 1, 'coalesced': 4, 'in_flight': 0})
+
+    def test_cancelled_leader_does_not_cancel_followers(self):
+        singleflight = SingleFlight()
+
+        async def make_call():
+            await asyncio.sleep(0.02)
+            return 'response'
+
+        async def main():
+            leader = asyncio.ensure_future(singleflight.do('key', make_call))
+            follower = asyncio.ensure_future(singleflight.do('key', make_call))
+            await asyncio.sleep(0.005)
+            leader.cancel()
+            return await follower
+
+        self.assertEqual(asyncio.run(main()), 'response')
+
+    def test_caller_after_cancelled_request_starts_a_new_one(self):
+        singleflight = SingleFlight()
+        calls = []
+
+        async def make_call():
+            calls.append(1)
+            try:
+                await asyncio.sleep(0.02)
+            except asyncio.CancelledError:
+                # a cancelled request takes a moment to wind down, eg. to close its connection
+                await asyncio.sleep(0.01)
+                raise
+            return 'response'
+
+        async def main():
+            leader = asyncio.ensure_future(singleflight.do('key', make_call))
+            await asyncio.sleep(0.005)
+            leader.cancel()
+            await asyncio.gather(leader, return_exceptions=True)
+
+            # the cancelled request is still winding down, but it must not be joined
+            return await singleflight.do('key', make_call)
+
+        self.assertEqual(asyncio.run(main()), 'response')
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(singleflight.stats()['in_flight'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,7 @@
 import unittest
-from gptty.context import return_most_common_phrases, get_context
+import os
+import tempfile
+from gptty.context import return_most_common_phrases, get_context, get_tag_turns, iter_tag_turns_reversed, get_candidate_phrases, get_rake_scores, ContextWindows, build_context, get_recent_turns, compact_turns
 
 
 class TestContext(unittest.TestCase):
@@ -8,6 +10,22 @@ class TestContext(unittest.TestCase):
         result = return_most_common_phrases(text)
         self.assertEqual(result, ['lazy dog', 'quick brown fox jumps'])
 
+    def test_return_most_common_phrases_ngram(self):
+        text = "The quick brown fox jumps over the lazy dog."
+        result = return_most_common_phrases(text, extractor='ngram')
+        self.assertEqual(result, ['lazy dog', 'jumps', 'quick brown fox'])
+
+    def test_get_candidate_phrases(self):
+        stop_words = frozenset(['the', 'over', 'is', 'of'])
+        result = get_candidate_phrases("The quick brown fox jumps over the lazy dog. What is the capital of Australia?", max_words=3, stop_words=stop_words)
+        self.assertEqual(result, [['quick', 'brown', 'fox'], ['jumps'], ['lazy', 'dog'], ['what'], ['capital'], ['australia']])
+
+    def test_get_rake_scores(self):
+        result = get_rake_scores([['quick', 'brown', 'fox'], ['lazy', 'dog'], ['fox']])
+        self.assertEqual(result['lazy dog'], 4.0)
+        self.assertEqual(result['fox'], 2.0)
+        self.assertEqual(result['quick brown fox'], 8.0)
+
     def test_get_context_keywords_only(self):
         result = get_context("Tag1", 50, "tests/test_context_data.txt", "text-davinci-003", context_keywords_only=True, question="Who is its mayor?")
         expected = "australia canberra 's capital city Who is its mayor?"
@@ -15,6 +33,10 @@ class TestContext(unittest.TestCase):
         self.assertLessEqual(len(result.split()), 50)
 
 
+    def test_get_context_with_phrases(self):
+        result = get_context("Tag1", 50, "tests/test_context_data.txt", "text-davinci-003", context_keywords_only=True, question="Who is its mayor?", phrases=['australia', 'canberra'])
+        self.assertEqual(result.strip(), "australia canberra Who is its mayor?")
+
     def test_get_context_no_keywords(self):
         result = get_context("Tag1", 50, "tests/test_context_data.txt", "text-davinci-003", context_keywords_only=False, question="Who is its mayor?")
         expected = "what is the capital of australia? The capital of Australia is Canberra. when was it founded? Canberra was founded in 1913 as the site for Australia's capital city. Who is its mayor?"
@@ -42,6 +64,133 @@ class TestContext(unittest.TestCase):
         self.assertLessEqual(sum(len(item["content"].split()) for item in result), 50)
 
 
+    def test_get_tag_turns(self):
+        result = get_tag_turns('Tag2', 'tests/test_context_data.txt')
+        self.assertEqual(result, [('Can you help me with this?', 'Of course.')])
+
+    def test_iter_tag_turns_reversed(self):
+        result = list(iter_tag_turns_reversed('Tag1', 'tests/test_context_data.txt'))
+        self.assertEqual(result, list(reversed(get_tag_turns('Tag1', 'tests/test_context_data.txt'))))
+
+    def test_iter_tag_turns_reversed_empty_file(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            self.assertEqual(list(iter_tag_turns_reversed('Tag1', path)), [])
+        finally:
+            os.remove(path)
+
+    def test_build_context(self):
+        turns = get_tag_turns('Tag1', 'tests/test_context_data.txt')
+
+        # the in-memory builder gives the same context as reading the tag from the output file
+        self.assertEqual(build_context("Who is its mayor?", turns, 50, context_keywords_only=False), get_context("Tag1", 50, "tests/test_context_data.txt", "text-davinci-003", context_keywords_only=False, question="Who is its mayor?"))
+        self.assertEqual(build_context("Who is its mayor?", turns, 20, model_type='v1/chat/completions'), get_context("Tag1", 20, "tests/test_context_data.txt", "gpt-3.5-turbo", model_type='v1/chat/completions', question="Who is its mayor?"))
+
+        # without turns, only the additional context is added
+        self.assertEqual(build_context("Who is its mayor?", None, 50, additional_context="Canberra"), "Canberra Who is its mayor?")
+
+    def test_get_recent_turns(self):
+        self.assertEqual(get_recent_turns('Tag1', 'tests/test_context_data.txt', 100), get_tag_turns('Tag1', 'tests/test_context_data.txt'))
+        self.assertEqual(len(get_recent_turns('Tag1', 'tests/test_context_data.txt', 20)), 1)
+        self.assertEqual(get_recent_turns('Tag1', 'tests/test_context_data.txt', 5), [])
+
+    def test_compact_turns(self):
+        turns = [
+            ('What is the capital of Australia?', 'Canberra is the capital of Australia.'),
+            ('Who wrote Hamlet?', 'Shakespeare.'),
+            ('what is the capital of  australia?', 'Canberra is the capital of Australia.'),
+            ('What is the capital city of Australia?', 'Canberra is the capital of Australia.'),
+        ]
+
+        # exact repeats, ignoring case and whitespace, keep the most recent
+        kept, dropped = compact_turns(turns, 1)
+        self.assertEqual(kept, turns[1:])
+        self.assertEqual(dropped, turns[:1])
+
+        # near-duplicates are dropped too at a lower threshold
+        kept, dropped = compact_turns(turns, 0.5)
+        self.assertEqual(kept, [turns[1], turns[3]])
+        self.assertEqual(dropped, [turns[0], turns[2]])
+
+        self.assertEqual(compact_turns(turns[:2], 0.5), (turns[:2], []))
+
+    def test_build_context_dedupe(self):
+        turns = [('What is the capital of Australia?', 'Canberra.')] * 3
+        context = build_context("Who is its mayor?", turns, 50, model_type='v1/chat/completions', dedupe_threshold=0.8)
+        self.assertEqual([item['content'] for item in context], ['What is the capital of Australia?', 'Canberra.', 'Who is its mayor?'])
+
+    def test_context_windows(self):
+        windows = ContextWindows('tests/test_context_data.txt')
+        self.assertFalse(windows.is_seeded('Tag1'))
+
+        # appends before the window is seeded are left to the output file
+        windows.append('Tag1', 'ignored?', 'Ignored.')
+        self.assertEqual(windows.load('Tag1'), get_tag_turns('Tag1', 'tests/test_context_data.txt'))
+        self.assertTrue(windows.is_seeded('Tag1'))
+
+        windows.append('Tag1', 'who is its mayor?', 'Canberra has no mayor.')
+        self.assertEqual(windows.load('Tag1')[-1], ('who is its mayor?', 'Canberra has no mayor.'))
+        self.assertEqual(len(windows.load('Tag1')), 3)
+
+    def test_context_windows_max_words(self):
+        windows = ContextWindows('tests/test_context_data.txt', max_words=20)
+
+        # only the most recent turn fits within 20 words
+        self.assertEqual(windows.load('Tag1'), [('when was it founded?', "Canberra was founded in 1913 as the site for Australia's capital city.")])
+
+        windows.append('Tag1', 'who is its mayor?', 'Canberra has no mayor.')
+        self.assertEqual(windows.load('Tag1'), [('who is its mayor?', 'Canberra has no mayor.')])
+
+    def test_context_windows_dedupe(self):
+        founded = ('when was it founded?', "Canberra was founded in 1913 as the site for Australia's capital city.")
+        repeats = [('who is its mayor?', 'Canberra has no mayor.'), ('who is its mayor?', 'Canberra has no mayor.'), ('Who is its mayor?', 'Canberra has no  mayor.')]
+        latest = ('how big is it?', 'About 800 square kilometres.')
+
+        windows = ContextWindows('tests/test_context_data.txt', max_words=40, dedupe_threshold=0.8)
+        windows.load('Tag1')
+        for turn in repeats + [latest]:
+            windows.append('Tag1', *turn)
+
+        # repeats of a turn don't count towards max_words, so an older distinct turn stays in the window
+        turns = windows.load('Tag1')
+        self.assertEqual(turns, [founded] + repeats + [latest])
+        self.assertEqual(compact_turns(turns, 0.8)[0], [founded, repeats[-1], latest])
+        self.assertEqual(windows.word_counts['Tag1'], 32)
+
+        # without dedupe, the repeats crowd it out
+        windows = ContextWindows('tests/test_context_data.txt', max_words=40)
+        windows.load('Tag1')
+        for turn in repeats + [latest]:
+            windows.append('Tag1', *turn)
+        self.assertEqual(windows.load('Tag1'), repeats + [latest])
+
+        # the same applies when the window is seeded from the output file
+        with tempfile.TemporaryDirectory() as directory:
+            output_file = os.path.join(directory, 'output.txt')
+            with open(output_file, 'w') as f:
+                for question, response in [founded] + repeats + [latest]:
+                    f.write(f"2023-03-29 17:00:07|Tag1|{question}|{response}\n")
+            self.assertEqual(ContextWindows(output_file, max_words=40, dedupe_threshold=0.8).load('Tag1'), [founded] + repeats + [latest])
+            self.assertEqual(ContextWindows(output_file, max_words=40).load('Tag1'), repeats + [latest])
+
+    def test_get_context_with_turns(self):
+        question = 'Who is its mayor?'
+        turns = [('what is the capital of australia?', 'The capital of Australia is Canberra.')]
+
+        result = get_context('Tag1', 50, None, 'gpt-3', model_type='v1/chat/completions', question=question, turns=turns)
+        self.assertEqual(result, [
+            {'role': 'user', 'content': 'what is the capital of australia?'},
+            {'role': 'assistant', 'content': 'The capital of Australia is Canberra.'},
+            {'role': 'user', 'content': question},
+        ])
+
+
+    def test_get_context_with_summary(self):
+        result = get_context("Tag1", 10, None, "text-davinci-003", context_keywords_only=True, question="Who is its mayor?", summary="The capital of Australia is Canberra.")
+        self.assertEqual(result, "The capital of Australia is Canberra. Who is its mayor?")
+
+
     def test_get_context_no_tag(self):
         max_context_length = 50
         question = 'What is the population of Australia?'
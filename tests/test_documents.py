@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+from gptty.documents import DocumentIndex, select_document_context
+
+
+class TestDocuments(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'handbook.txt')
+        self.cache_dir = os.path.join(self.dir.name, 'chunks')
+
+        with open(self.path, 'w') as f:
+            f.write(' '.join(f'filler{i}' for i in range(250)))
+            f.write('\nThe API keys are rotated monthly by the operations team. ')
+            f.write(' '.join(f'appendix{i}' for i in range(50)))
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_build(self):
+        index = DocumentIndex.build(self.path, chunk_words=100)
+        self.assertEqual([words for _, _, words in index.chunks], [100, 100, 100, 10])
+        self.assertTrue(index.read_chunk(0).startswith('filler0 filler1'))
+        self.assertTrue(index.read_chunk(3).endswith('appendix49'))
+
+    def test_build_empty_file(self):
+        open(self.path, 'w').close()
+        self.assertEqual(len(DocumentIndex.build(self.path)), 0)
+
+    def test_load_cache(self):
+        index = DocumentIndex.load(self.path, cache_dir=self.cache_dir, chunk_words=100)
+        self.assertTrue(os.path.exists(DocumentIndex.cache_path(self.path, self.cache_dir)))
+
+        cached = DocumentIndex.load(self.path, cache_dir=self.cache_dir, chunk_words=100)
+        self.assertEqual(cached.rank('keys rotated'), index.rank('keys rotated'))
+
+        # the index is rebuilt when the file changes
+        with open(self.path, 'a') as f:
+            f.write(' more words')
+        self.assertEqual(DocumentIndex.load(self.path, cache_dir=self.cache_dir, chunk_words=100).chunks[-1][2], 12)
+
+    def test_select_document_context(self):
+        index = DocumentIndex.load(self.path, cache_dir=self.cache_dir, chunk_words=100)
+
+        context = select_document_context([index], 'How often are the keys rotated?', 100)
+        self.assertIn('The API keys are rotated monthly', context)
+        self.assertEqual(len(context.split()), 100)
+
+        # without any matching terms, the start of the file is used
+        self.assertTrue(select_document_context([index], 'unrelated', 100).startswith('filler0'))
+        self.assertEqual(select_document_context([index], 'keys', 50), '')
@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+from gptty.export import export_history, read_export, read_history_rows, EXPORT_STATE_FILE
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.output_file = os.path.join(self.tmpdir, 'output.txt')
+        self.path = os.path.join(self.tmpdir, 'history.parquet')
+        shutil.copy('tests/test_context_data.txt', self.output_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_read_history_rows(self):
+        history, offset = read_history_rows(self.output_file)
+        self.assertEqual(len(history), 3)
+        self.assertEqual(offset, os.path.getsize(self.output_file))
+
+        history, _ = read_history_rows(self.output_file, offset)
+        self.assertEqual(len(history), 0)
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_export_and_read(self):
+        self.assertEqual(export_history(self.output_file, self.path), 3)
+        self.assertTrue(os.path.isdir(os.path.join(self.path, 'date=2023-03-29', 'tag=Tag1')))
+
+        df = read_export(self.path)
+        self.assertEqual(df['question'].tolist()[0], 'what is the capital of australia?')
+        self.assertEqual(df['timestamp'].tolist(), ['2023-03-29 17:00:07', '2023-03-29 17:00:22', '2023-03-29 17:02:14'])
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_append(self):
+        export_history(self.output_file, self.path)
+        self.assertEqual(export_history(self.output_file, self.path, append=True), 0)
+
+        with open(self.output_file, 'a') as f:
+            f.write("2023-03-30 09:00:00|Tag2|And now?|Sure.\n")
+
+        self.assertEqual(export_history(self.output_file, self.path, append=True), 1)
+        self.assertEqual(len(read_export(self.path)), 4)
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_rewrite_removes_stale_partitions(self):
+        export_history(self.output_file, self.path)
+
+        with open(self.output_file, 'w') as f:
+            f.write("2023-03-30 09:00:00|Tag3|And now?|Sure.\n")
+
+        # partitions whose rows are no longer in the output file are removed, rather than left to be read
+        self.assertEqual(export_history(self.output_file, self.path), 1)
+        self.assertEqual(sorted(os.listdir(self.path)), [EXPORT_STATE_FILE, 'date=2023-03-30'])
+        self.assertEqual(read_export(self.path)['question'].tolist(), ['And now?'])
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_filters(self):
+        export_history(self.output_file, self.path)
+
+        df = read_export(self.path, columns=['question'], tags=['Tag2'])
+        self.assertEqual(list(df.columns), ['question'])
+        self.assertEqual(df['question'].tolist(), ['Can you help me with this?'])
+
+        self.assertEqual(len(read_export(self.path, since='2023-03-30')), 0)
+        self.assertEqual(len(read_export(self.path, until='2023-03-29')), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
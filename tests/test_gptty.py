@@ -0,0 +1,333 @@
+import os
+import json
+import time
+import asyncio
+import tempfile
+import unittest
+import openai
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from prompt_toolkit.document import Document
+from openai.openai_object import OpenAIObject
+from gptty.gptty import LogWriter, format_log_entry, parse_usage_stats, prepare_session, run_query, create_chat_room, run_cancellable, RequestCancelled, TagCompleter
+from gptty import UniversalCompletion
+from gptty.config import get_config_data
+from gptty.tagging import TagTrie
+
+
+class TestLogWriter(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def read(self):
+        with open(self.path, 'r') as f:
+            return f.read()
+
+    def test_format_log_entry(self):
+        self.assertEqual(format_log_entry('2023-03-29 17:00:07', 'Tag1', 'a | b?', 'c.'), '2023-03-29 17:00:07|Tag1|a  b?|c.\n')
+
+    def test_batches_rows(self):
+        async def run():
+            log_writer = LogWriter(batch_size=3, flush_interval=60)
+            log_writer.start()
+            for i in range(5):
+                log_writer.write(self.path, f"row {i}\n")
+            await asyncio.sleep(0.1)
+
+            # the first full batch is written straight away, the rest waits for the interval or close
+            self.assertEqual(self.read(), "row 0\nrow 1\nrow 2\n")
+            await log_writer.close()
+            return log_writer.stats()
+
+        stats = asyncio.run(run())
+        self.assertEqual(self.read(), "".join(f"row {i}\n" for i in range(5)))
+        self.assertEqual(stats, {'rows': 5, 'batches': 2, 'queued': 0})
+
+    def test_flush(self):
+        async def run():
+            log_writer = LogWriter(batch_size=100, flush_interval=60)
+            log_writer.start()
+            log_writer.write(self.path, "row 0\n")
+            await log_writer.flush()
+            self.assertEqual(self.read(), "row 0\n")
+            await log_writer.close()
+
+        asyncio.run(run())
+
+    def test_failed_batch(self):
+        async def run():
+            log_writer = LogWriter(batch_size=100, flush_interval=10)
+            log_writer.start()
+
+            # a row that can't be written is dropped, and the writer carries on with later rows
+            log_writer.write(self.path, None)
+            with mock.patch('click.echo') as echo:
+                await asyncio.wait_for(log_writer.flush(), 1)
+            self.assertIn('FAILED to write 1 log rows', echo.call_args[0][0])
+
+            log_writer.write(self.path, "row 0\n")
+            await asyncio.wait_for(log_writer.close(), 1)
+            self.assertEqual(self.read(), "row 0\n")
+
+            # once the writer has stopped, flushing doesn't wait on it
+            await asyncio.wait_for(log_writer.flush(), 1)
+
+        asyncio.run(run())
+
+    def test_flush_interval(self):
+        async def run():
+            log_writer = LogWriter(batch_size=100, flush_interval=0.05)
+            log_writer.start()
+            log_writer.write(self.path, "row 0\n")
+            await asyncio.sleep(0.2)
+            self.assertEqual(self.read(), "row 0\n")
+            await log_writer.close()
+
+        asyncio.run(run())
+
+
+class TestUsageStats(unittest.TestCase):
+
+    def test_parse_usage_stats(self):
+        resp_object = {'data': [
+            {'n_requests': 2, 'n_context_tokens_total': 100, 'n_generated_tokens_total': 40},
+            {'n_requests': 1, 'n_context_tokens_total': 20, 'n_generated_tokens_total': 5},
+        ]}
+        self.assertEqual(parse_usage_stats(resp_object), (3, 120, 45))
+
+    def test_universal_completion_usage_stats(self):
+        response = mock.Mock(data={'data': [{'n_requests': 1, 'n_context_tokens_total': 10, 'n_generated_tokens_total': 2}]})
+        with mock.patch('openai.api_requestor.APIRequestor.request', return_value=(response, False, 'key')):
+            self.assertEqual(UniversalCompletion(api_key='key').usage_stats_today(), (1, 10, 2))
+
+
+class TestPrepareSession(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.configs = {
+            'model': 'text-davinci-003',
+            'output_file': os.path.join(self.dir.name, 'output.txt'),
+            'usage_file': os.path.join(self.dir.name, 'usage.txt'),
+            'verify_internet_endpoint': '',
+            'hedge_requests': False,
+        }
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_runs_startup_steps(self):
+        with mock.patch('gptty.gptty.validate_model_type', return_value='v1/completions'):
+            model_types, history, hedge_policy = asyncio.run(prepare_session(self.configs, load_history=True))
+
+        self.assertEqual(model_types, {'text-davinci-003': 'v1/completions'})
+        self.assertEqual(len(history), 0)
+        self.assertIsNone(hedge_policy)
+        self.assertTrue(os.path.exists(self.configs['output_file']))
+
+    def test_invalid_model_fails(self):
+        with mock.patch('gptty.gptty.validate_model_type', side_effect=Exception):
+            self.assertIsNone(asyncio.run(prepare_session(self.configs)))
+
+    def test_failed_probe_fails(self):
+        self.configs['verify_internet_endpoint'] = 'example.com'
+        with mock.patch('gptty.gptty.validate_model_type', return_value='v1/completions'), \
+             mock.patch('gptty.gptty.has_internet_connection', return_value=False):
+            self.assertIsNone(asyncio.run(prepare_session(self.configs)))
+
+
+class TestTagCompleter(unittest.TestCase):
+
+    def complete(self, text):
+        completer = TagCompleter(TagTrie(['infra', 'ingest', 'db']))
+        return [(completion.text, completion.start_position) for completion in completer.get_completions(Document(text), None)]
+
+    def test_completes_tag_prefix(self):
+        self.assertEqual(self.complete('[in'), [('infra', -2), ('ingest', -2)])
+        self.assertEqual(self.complete('[infra,d'), [('db', -1)])
+        self.assertEqual(self.complete('['), [('db', 0), ('infra', 0), ('ingest', 0)])
+
+    def test_ignores_other_text(self):
+        self.assertEqual(self.complete('in'), [])
+        self.assertEqual(self.complete('[infra] what'), [])
+        self.assertEqual(self.complete('[infra:-5'), [])
+        self.assertEqual(self.complete('[db'), [])
+
+
+def completion(text):
+    return OpenAIObject.construct_from({'choices': [{'message': {'content': text}}], 'usage': {'prompt_tokens': 10, 'completion_tokens': 3}})
+
+
+class QueryTestCase(unittest.TestCase):
+
+    """
+    Runs `run_query` against a temporary output file, with model validation and `fetch_response` patched out.
+    """
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.configs = get_config_data(config_file=os.path.join(self.dir.name, 'missing.ini'))
+        self.configs.update({
+            'output_file': os.path.join(self.dir.name, 'output.txt'),
+            'usage_file': os.path.join(self.dir.name, 'usage.txt'),
+            'verify_internet_endpoint': '',
+        })
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def query(self, questions, fetch_response, model_type='v1/chat/completions', **kwargs):
+        with mock.patch('gptty.gptty.validate_model_type', return_value=model_type), \
+             mock.patch('gptty.gptty.fetch_response', side_effect=fetch_response) as fetch, \
+             mock.patch('click.echo') as echo:
+            asyncio.run(run_query(questions, '', configs=self.configs, return_json=True, **kwargs))
+
+        return json.loads(echo.call_args[0][0]), fetch
+
+
+class TestCompareModels(QueryTestCase):
+
+    def test_compare_models(self):
+        async def fetch_response(prompt, model_engine, *args, **kwargs):
+            return completion(f'answer from {model_engine}')
+
+        output, fetch = self.query(['[infra] a question'], fetch_response, models=['gpt-3.5-turbo', 'gpt-4'])
+
+        self.assertEqual(fetch.call_count, 2)
+        self.assertEqual([answer['response'] for answer in output[0]['responses']], ['answer from gpt-3.5-turbo', 'answer from gpt-4'])
+        self.assertEqual(output[0]['responses'][1]['prompt_tokens'], 10)
+
+        # each response is logged under its model, so the tag's own history isn't mixed with the comparison
+        with open(self.configs['output_file']) as f:
+            self.assertEqual([row.split('|')[1] for row in f], ['infra/gpt-3.5-turbo', 'infra/gpt-4'])
+        with open(self.configs['usage_file']) as f:
+            self.assertEqual([row.split('|')[2] for row in f], ['gpt-3.5-turbo', 'gpt-4'])
+
+    def test_compare_models_failure(self):
+        async def fetch_response(prompt, model_engine, *args, **kwargs):
+            if model_engine == 'gpt-4':
+                raise openai.error.RateLimitError('Rate limit reached')
+            return completion(f'answer from {model_engine}')
+
+        output, _ = self.query(['[infra] a question', '[infra] another question'], fetch_response, models=['gpt-3.5-turbo', 'gpt-4'])
+
+        # the failing model is reported for each question, while the other model's responses are kept
+        self.assertEqual([answer['response'] for answer in output[1]['responses']], ['answer from gpt-3.5-turbo', None])
+        self.assertEqual(output[0]['responses'][1], {'model': 'gpt-4', 'response': None, 'error': 'RateLimitError: Rate limit reached'})
+
+        with open(self.configs['output_file']) as f:
+            self.assertEqual([row.split('|')[1] for row in f], ['infra/gpt-3.5-turbo', 'infra/gpt-3.5-turbo'])
+
+class TestKeywordBatches(QueryTestCase):
+
+    def test_repeated_tag_sees_earlier_answers(self):
+        async def fetch_response(prompt, model_engine, *args, **kwargs):
+            return OpenAIObject.construct_from({'choices': [{'text': f'answer to {prompt}'}], 'usage': {'prompt_tokens': 10, 'completion_tokens': 3}})
+
+        contexts = []
+        def get_context(tag, *args, question='', turns=None, phrases=None, **kwargs):
+            contexts.append((tag, turns, phrases))
+            return question
+
+        self.configs.update({'context_keywords_only': True, 'keyword_workers': 2})
+
+        # a thread pool stands in for the process pool, so that the patched keyword extraction is used
+        with mock.patch('gptty.gptty.ProcessPoolExecutor', ThreadPoolExecutor), \
+             mock.patch('gptty.gptty.init_keyword_worker'), \
+             mock.patch('gptty.gptty.get_tag_phrases', return_value='phrases') as get_tag_phrases, \
+             mock.patch('gptty.gptty.get_context', side_effect=get_context):
+            self.query(['[a] first', '[b] second', '[a] third', '[c] fourth'], fetch_response, model_type='v1/completions')
+
+        # only the tags asked about once are extracted up front
+        self.assertEqual(sorted(call[0][0] for call in get_tag_phrases.call_args_list), ['b', 'c'])
+        self.assertEqual([(tag, phrases) for tag, _, phrases in contexts], [('a', None), ('b', 'phrases'), ('a', None), ('c', 'phrases')])
+
+        # the tag's second question is given the answer logged for its first
+        self.assertEqual(contexts[2][1], [('first', 'answer to first')])
+
+
+class TestScheduling(QueryTestCase):
+
+    def test_chat_is_sent_ahead_of_queued_queries(self):
+        sent = []
+
+        async def acreate(messages, **kwargs):
+            sent.append(messages[-1]['content'])
+            await asyncio.sleep(0.05)
+            return completion('an answer')
+
+        # the chat's question is typed while the query's requests are queued, and the chat is then closed
+        async def prompt_async(*args, **kwargs):
+            if 'chat question' in sent:
+                return ':q'
+            await asyncio.sleep(0.02)
+            return 'chat question'
+
+        session = mock.MagicMock()
+        session.prompt_async = prompt_async
+        self.configs.update({'api_key': 'key', 'model': 'gpt-3.5-turbo', 'scheduler_concurrency': 1})
+
+        async def run():
+            await asyncio.gather(
+                run_query([f'[batch] question {i}' for i in range(4)], '', configs=self.configs, quiet=True, concurrency=4),
+                create_chat_room(configs=self.configs),
+            )
+
+        with mock.patch('gptty.gptty.validate_model_type', return_value='v1/chat/completions'), \
+             mock.patch('gptty.gptty.PromptSession', return_value=session), \
+             mock.patch('openai.ChatCompletion.acreate', side_effect=acreate), \
+             mock.patch('click.echo'), mock.patch('builtins.print'):
+            asyncio.run(run())
+
+        # one request is in flight at a time, and the chat's goes next even though the queries were queued first
+        self.assertEqual(len(sent), 5)
+        self.assertEqual(sent[1], 'chat question')
+
+
+class TestDeadlines(QueryTestCase):
+
+    def test_run_cancellable_deadline(self):
+        cancelled = []
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def run():
+            with self.assertRaises(RequestCancelled):
+                await run_cancellable(slow(), time.monotonic() + 0.05)
+            self.assertEqual(await run_cancellable(asyncio.sleep(0, result='done'), time.monotonic() + 1), 'done')
+
+        asyncio.run(run())
+
+        # the abandoned work is cancelled rather than left running
+        self.assertEqual(cancelled, [True])
+
+    def test_query_deadline(self):
+        async def fetch_response(prompt, model_engine, *args, deadline=None, **kwargs):
+            # the deadline is passed on, so each call to the API is given only the time remaining
+            self.assertIsNotNone(deadline)
+            if 'slow' in prompt[-1]['content']:
+                await asyncio.sleep(10)
+            return completion('an answer')
+
+        output, _ = self.query(['a slow question', 'a quick question'], fetch_response, concurrency=2, deadline=0.2)
+
+        self.assertEqual(output[0], {'question': 'a slow question', 'response': None, 'error': 'no response within the 0.2s deadline'})
+        self.assertEqual(output[1], {'question': 'a quick question', 'response': 'an answer'})
+
+        # only the answered question is logged
+        with open(self.configs['output_file']) as f:
+            self.assertEqual(len(f.readlines()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import asyncio
+import unittest
+from gptty.hedging import HedgePolicy
+
+
+class TestHedging(unittest.TestCase):
+
+    def test_delay_uses_percentile(self):
+        policy = HedgePolicy(percentile=90, min_delay=0.1, min_samples=10)
+        self.assertEqual(policy.delay(), 0.1)
+
+        policy.seed([float(i) for i in range(1, 11)])
+        self.assertEqual(policy.delay(), 9.0)
+
+    def test_fast_request_is_not_hedged(self):
+        policy = HedgePolicy(min_delay=0.5, max_extra=1.0)
+        calls = []
+
+        async def make_call():
+            calls.append(1)
+            return 'primary'
+
+        result = asyncio.run(policy.run(make_call))
+        self.assertEqual(result, 'primary')
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(policy.stats()['hedges'], 0)
+
+    def test_slow_request_is_hedged(self):
+        policy = HedgePolicy(min_delay=0.01, max_extra=1.0)
+        delays = [1.0, 0.0]
+
+        async def make_call():
+            delay = delays.pop(0)
+            await asyncio.sleep(delay)
+            return delay
+
+        result = asyncio.run(policy.run(make_call))
+        self.assertEqual(result, 0.0)
+        self.assertEqual(policy.stats()['hedges'], 1)
+        self.assertEqual(policy.stats()['hedge_wins'], 1)
+
+    def test_hedges_are_capped(self):
+        policy = HedgePolicy(min_delay=0.01, max_extra=0.5)
+        calls = []
+
+        async def make_call():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'done'
+
+        asyncio.run(policy.run(make_call))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(policy.stats()['hedges'], 0)
+
+    def test_seeded_latencies_do_not_grant_hedges(self):
+        policy = HedgePolicy(min_delay=0.01, max_extra=0.5, min_samples=1)
+        policy.seed([0.01] * 100)
+        calls = []
+
+        async def make_call():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'done'
+
+        # the budget only counts requests made by this policy, so the first slow request isn't hedged
+        asyncio.run(policy.run(make_call))
+        self.assertEqual(len(calls), 1)
+
+        # by the second request, half a hedge per request allows one
+        asyncio.run(policy.run(make_call))
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(policy.stats()['hedges'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
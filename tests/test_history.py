@@ -0,0 +1,52 @@
+import unittest
+from gptty.history import History, parse_timestamp, format_timestamp
+from gptty.tagging import parse_tag_selectors
+
+
+class TestHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.history = History.from_file('tests/test_context_data.txt')
+
+    def test_timestamp_round_trip(self):
+        self.assertEqual(format_timestamp(parse_timestamp('2023-03-29 17:00:07')), '2023-03-29 17:00:07')
+        self.assertEqual(parse_timestamp('not a timestamp'), 0)
+
+    def test_from_file(self):
+        self.assertEqual(len(self.history), 3)
+        self.assertEqual(self.history.tags, ['Tag1', 'Tag2'])
+        self.assertEqual(self.history.timestamp(2), '2023-03-29 17:02:14')
+        self.assertEqual(self.history.question(1), 'when was it founded?')
+        self.assertEqual(self.history.response(2), 'Of course.')
+
+    def test_turns(self):
+        self.assertEqual(list(self.history.tag_positions('Tag1')), [0, 1])
+        self.assertEqual(self.history.turns('Tag2'), [('Can you help me with this?', 'Of course.')])
+        self.assertEqual(self.history.turns('missing'), [])
+
+    def test_append(self):
+        self.history.append('2023-03-30 09:00:00', 'Tag2', 'Über?', 'Ja.')
+        self.assertEqual(self.history.turns('Tag2')[-1], ('Über?', 'Ja.'))
+        self.assertEqual(len(self.history.tags), 2)
+
+    def test_to_dataframe(self):
+        df = self.history.to_dataframe()
+        self.assertEqual(list(df.columns), ['timestamp', 'tag', 'question', 'response'])
+        self.assertEqual(df['tag'].tolist(), ['Tag1', 'Tag1', 'Tag2'])
+
+    def test_select_turns(self):
+        now = parse_timestamp('2023-03-29 17:02:30')
+        self.assertEqual(self.history.select_turns(parse_tag_selectors('Tag1,Tag2'), now=now), self.history.turns('Tag1') + self.history.turns('Tag2'))
+        self.assertEqual(self.history.select_turns(parse_tag_selectors('Tag1:-1:'), now=now), [('when was it founded?', "Canberra was founded in 1913 as the site for Australia's capital city.")])
+        self.assertEqual(self.history.select_turns(parse_tag_selectors('Tag1::1,Tag1:-1:'), now=now), self.history.turns('Tag1'))
+
+        # only the second Tag1 turn and the Tag2 turn were logged within 140 seconds of now
+        self.assertEqual(len(self.history.select_turns(parse_tag_selectors('Tag1@140s,Tag2@140s'), now=now)), 2)
+        self.assertEqual(self.history.select_turns(parse_tag_selectors('Tag1@10s'), now=now), [])
+
+    def test_missing_file(self):
+        self.assertEqual(len(History.from_file('does_not_exist.txt')), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import asyncio
+import unittest
+from gptty.scheduling import FairScheduler, QueueFullError
+
+
+class TestFairScheduler(unittest.TestCase):
+
+    def run_requests(self, scheduler, requests):
+        """
+        Submits (name, priority, key) requests in order, after a first request that holds the only slot, and 
+        returns the order in which they were dispatched.
+        """
+        order = []
+
+        def make_call(name):
+            async def call():
+                order.append(name)
+                await asyncio.sleep(0.001)
+            return call
+
+        async def run():
+            tasks = [asyncio.ensure_future(scheduler.run(make_call('first')))]
+            await asyncio.sleep(0)
+            tasks += [asyncio.ensure_future(scheduler.run(make_call(name), priority=priority, key=key)) for name, priority, key in requests]
+            await asyncio.gather(*tasks)
+
+        asyncio.run(run())
+        return order[1:]
+
+    def test_interactive_first(self):
+        scheduler = FairScheduler(concurrency=1)
+        order = self.run_requests(scheduler, [('b0', 'batch', ''), ('b1', 'batch', ''), ('i0', 'interactive', '')])
+        self.assertEqual(order, ['i0', 'b0', 'b1'])
+
+        stats = scheduler.stats()
+        self.assertEqual(stats['interactive']['requests'], 1)
+        self.assertEqual(stats['batch']['requests'], 3)
+        self.assertGreater(stats['batch']['max_wait'], 0)
+
+    def test_fair_across_keys(self):
+        scheduler = FairScheduler(concurrency=1)
+        order = self.run_requests(scheduler, [(f'a{i}', 'batch', 'a') for i in range(4)] + [(f'b{i}', 'batch', 'b') for i in range(2)])
+        self.assertEqual(order, ['a0', 'b0', 'a1', 'b1', 'a2', 'a3'])
+
+    def test_queue_full(self):
+        scheduler = FairScheduler(concurrency=1, max_queue=1)
+
+        async def run():
+            blocker = asyncio.ensure_future(scheduler.run(lambda: asyncio.sleep(0.01)))
+            await asyncio.sleep(0)
+            queued = asyncio.ensure_future(scheduler.run(lambda: asyncio.sleep(0)))
+            await asyncio.sleep(0)
+            with self.assertRaises(QueueFullError):
+                await scheduler.run(lambda: asyncio.sleep(0))
+            await asyncio.gather(blocker, queued)
+
+        asyncio.run(run())
+        self.assertEqual(scheduler.stats()['batch']['rejected'], 1)
+
+    def test_cancel_while_queued(self):
+        scheduler = FairScheduler(concurrency=1)
+
+        async def run():
+            blocker = asyncio.ensure_future(scheduler.run(lambda: asyncio.sleep(0.01)))
+            await asyncio.sleep(0)
+            queued = asyncio.ensure_future(scheduler.run(lambda: asyncio.sleep(0)))
+            await asyncio.sleep(0)
+            queued.cancel()
+            await blocker
+
+            # the cancelled request doesn't hold a slot, so later requests still run
+            await asyncio.wait_for(scheduler.run(lambda: asyncio.sleep(0)), 1)
+
+        asyncio.run(run())
+        self.assertEqual(scheduler.stats()['batch']['queued'], 0)
+        self.assertEqual(scheduler.active, 0)
+
+    def test_unknown_priority(self):
+        with self.assertRaises(ValueError):
+            asyncio.run(FairScheduler().run(lambda: asyncio.sleep(0), priority='urgent'))
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from gptty.search import SearchIndex, to_match_expression
+
+
+class TestSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.output_file = os.path.join(self.tmpdir, 'output.txt')
+        shutil.copy('tests/test_context_data.txt', self.output_file)
+        self.index = SearchIndex.for_output_file(self.output_file)
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_to_match_expression(self):
+        self.assertEqual(to_match_expression('what\'s "c++"'), '"what\'s" """c++"""')
+        self.assertEqual(to_match_expression('  '), '')
+
+    def test_search(self):
+        hits = self.index.search(self.output_file, 'canberra founded')
+        self.assertEqual(hits, [('2023-03-29 17:00:22', 'Tag1', 'when was it founded?', "Canberra was founded in 1913 as the site for Australia's capital city.")])
+
+        self.assertEqual(len(self.index.search(self.output_file, 'capital')), 2)
+        self.assertEqual(self.index.search(self.output_file, 'capital', tag='Tag2'), [])
+        self.assertEqual(self.index.search(self.output_file, 'help?', tag='Tag2')[0][3], 'Of course.')
+
+    def test_incremental_update(self):
+        self.assertEqual(self.index.update(self.output_file), 3)
+        self.assertEqual(self.index.update(self.output_file), 0)
+
+        with open(self.output_file, 'a') as f:
+            f.write("2023-03-30 09:00:00|Tag3|Who founded Canberra?|Walter Burley Griffin designed it.\n")
+            f.write("2023-03-30 09:00:05|Tag3|partial")
+
+        self.assertEqual(len(self.index.search(self.output_file, 'canberra')), 3)
+        self.assertEqual(len(self.index), 4)
+
+        # the index persists between sessions
+        self.index.close()
+        self.index = SearchIndex.for_output_file(self.output_file)
+        self.assertEqual(self.index.update(self.output_file), 0)
+        self.assertEqual(len(self.index.query('griffin')), 1)
+
+    def test_rebuild_on_shrink(self):
+        self.index.update(self.output_file)
+        with open(self.output_file, 'w') as f:
+            f.write("2023-03-30 09:00:00|Tag3|hello|world\n")
+
+        self.assertEqual(self.index.search(self.output_file, 'capital'), [])
+        self.assertEqual(len(self.index), 1)
+
+    def test_concurrent_update(self):
+        # a second handle on the same database, as when `gptty search` runs alongside a chat session
+        other = SearchIndex.for_output_file(self.output_file)
+        outer = self
+
+        class RacingIndex(SearchIndex):
+            @property
+            def offset(self):
+                offset = SearchIndex.offset.fget(self)
+                # the other handle tries to catch up right after this one has read the offset
+                racer = threading.Thread(target=other.update, args=(outer.output_file,))
+                racer.start()
+                time.sleep(0.2)
+                self.racer = racer
+                return offset
+
+        self.index.close()
+        self.index = RacingIndex.for_output_file(self.output_file)
+        self.assertEqual(self.index.update(self.output_file), 3)
+        self.index.racer.join()
+
+        self.assertEqual(other.update(self.output_file), 0)
+        self.assertEqual(len(self.index), 3)
+        other.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+from gptty.summary import SummaryStore, split_sentences
+
+STOP_WORDS = frozenset(['the', 'of', 'is', 'was', 'in', 'as', 'for', 'what', 'when', 'it', 'can', 'you', 'me', 'with', 'this'])
+
+
+class TestSummary(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output_file = os.path.join(self.directory, 'output.txt')
+        shutil.copy('tests/test_context_data.txt', self.output_file)
+        self.store = SummaryStore.for_output_file(self.output_file, stop_words=STOP_WORDS)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_split_sentences(self):
+        self.assertEqual(split_sentences("It was founded in 1913. Who is its mayor? "), ['It was founded in 1913.', 'Who is its mayor?'])
+
+    def test_summarize(self):
+        summary = self.store.summarize(self.output_file, 'Tag1', max_words=50)
+        self.assertEqual(summary, "what is the capital of australia? The capital of Australia is Canberra. when was it founded? Canberra was founded in 1913 as the site for Australia's capital city.")
+        self.assertEqual(self.store.summarize(self.output_file, 'missing', max_words=50), "")
+
+    def test_summary_respects_budget(self):
+        summary = self.store.summarize(self.output_file, 'Tag1', max_words=10)
+        self.assertLessEqual(len(summary.split()), 10)
+        self.assertIn('capital', summary.lower())
+
+    def test_incremental_update(self):
+        self.store.update(self.output_file)
+        self.assertFalse(self.store.update(self.output_file))
+
+        with open(self.output_file, 'a') as f:
+            f.write("2023-03-29 17:05:00|Tag2|Anything else?|No, that is all.\n")
+
+        # a store loaded from disk only folds in the new row
+        store = SummaryStore.for_output_file(self.output_file, stop_words=STOP_WORDS)
+        self.assertTrue(store.update(self.output_file))
+
+        # only the tag that changed is read and rewritten
+        self.assertEqual(list(store.tags), ['Tag2'])
+        self.assertEqual(store.get_state('Tag2')['turns'], 2)
+        self.assertEqual(store.get_state('Tag1')['turns'], 2)
+
+    def test_interrupted_save(self):
+        self.store.update(self.output_file)
+
+        with open(self.output_file, 'a') as f:
+            f.write("2023-03-29 17:05:00|Tag2|Anything else?|No, that is all.\n")
+        self.store.update(self.output_file)
+
+        # if gptty stopped after saving the tag but before saving the offset, the row isn't folded in twice
+        with open(os.path.join(self.store.path, 'state.json'), 'w') as f:
+            f.write('{"offset": 0}')
+        store = SummaryStore.for_output_file(self.output_file, stop_words=STOP_WORDS)
+        store.update(self.output_file)
+        self.assertEqual(store.get_state('Tag2')['turns'], 2)
+        self.assertEqual(store.get_state('Tag1')['turns'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,5 @@
 import unittest
-from gptty.tagging import get_tag_from_text
+from gptty.tagging import get_tag_from_text, parse_tag_selectors, is_plain_tag, TagSelector, TagTrie
 
 class TestTagging(unittest.TestCase):
 
@@ -23,5 +23,33 @@ class TestTagging(unittest.TestCase):
         result = get_tag_from_text("[Incomplete Tag This is a test.")
         self.assertEqual(result, ('', "[Incomplete Tag This is a test."))
 
+    # Test selectors for multiple tags, slices and time windows
+    def test_parse_tag_selectors(self):
+        tag, _ = get_tag_from_text("[infra, db:-5:@24h] This is a test.")
+        self.assertEqual(parse_tag_selectors(tag), [TagSelector('infra', None, None, None), TagSelector('db', -5, None, 86400)])
+        self.assertEqual(parse_tag_selectors('infra::3'), [TagSelector('infra', None, 3, None)])
+        self.assertEqual(parse_tag_selectors(''), [])
+
+    # Test that tags outside the grammar are left as they are
+    def test_parse_literal_tag(self):
+        self.assertEqual(parse_tag_selectors('a:b'), [TagSelector('a:b', None, None, None)])
+        self.assertTrue(is_plain_tag(parse_tag_selectors('a:b')))
+        self.assertFalse(is_plain_tag(parse_tag_selectors('infra,db')))
+
+    # Test tag completion from the trie
+    def test_tag_trie(self):
+        trie = TagTrie(['infra', 'ingest', 'db', 'in'])
+        self.assertEqual(trie.complete('in'), ['in', 'infra', 'ingest'])
+        self.assertEqual(trie.complete('inf'), ['infra'])
+        self.assertEqual(trie.complete('x'), [])
+        self.assertEqual(trie.complete('', limit=2), ['db', 'in'])
+
+        self.assertFalse(trie.add('db'))
+        self.assertTrue(trie.add('dbt'))
+        self.assertFalse(trie.add(''))
+        self.assertEqual(len(trie), 5)
+        self.assertIn('dbt', trie)
+        self.assertNotIn('d', trie)
+
 if __name__ == '__main__':
     unittest.main()
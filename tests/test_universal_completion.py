@@ -0,0 +1,54 @@
+import asyncio
+import unittest
+from gptty import UniversalCompletion
+
+
+class StubCompletion(UniversalCompletion):
+
+    """
+    Answers each prompt with itself after a delay, so that requests complete out of order.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def a_fetch_response(self, prompt, max_tokens=None, temperature=None, model_type=None, priority='interactive', key=''):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01 * (5 - len(prompt)))
+        self.in_flight -= 1
+        if prompt == 'fail':
+            raise ValueError(prompt)
+        return prompt
+
+
+class TestUniversalCompletion(unittest.TestCase):
+
+    def test_build_context(self):
+        g = UniversalCompletion(model='gpt-3.5-turbo')
+        turns = [("What is an abstraction?", "A simplified model.")]
+        result = g.build_context("Give me an example.", turns=turns, model_type='v1/chat/completions')
+        self.assertEqual(result, [
+            {'role': 'user', 'content': 'What is an abstraction?'},
+            {'role': 'assistant', 'content': 'A simplified model.'},
+            {'role': 'user', 'content': 'Give me an example.'},
+        ])
+
+    def test_a_fetch_many(self):
+        g = StubCompletion()
+        prompts = ['a', 'bb', 'ccc', 'dddd']
+        results = asyncio.run(g.a_fetch_many(prompts, concurrency=2, model_type='v1/completions'))
+        self.assertEqual(results, prompts)
+        self.assertEqual(g.max_in_flight, 2)
+
+    def test_a_fetch_many_return_exceptions(self):
+        g = StubCompletion()
+        results = asyncio.run(g.a_fetch_many(['a', 'fail'], model_type='v1/completions', return_exceptions=True))
+        self.assertEqual(results[0], 'a')
+        self.assertIsInstance(results[1], ValueError)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+from gptty.usage import estimate_cost, get_usage_from_response, format_usage_row, aggregate_usage
+
+
+class TestUsage(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.usage_file = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.usage_file)
+
+    def test_estimate_cost(self):
+        self.assertAlmostEqual(estimate_cost('gpt-3.5-turbo', 1000, 1000), 0.0035)
+        self.assertAlmostEqual(estimate_cost('gpt-4-32k-0613', 1000, 0), 0.06)
+        self.assertEqual(estimate_cost('unknown-model', 1000, 1000), 0.0)
+
+    def test_get_usage_from_response(self):
+        self.assertEqual(get_usage_from_response({'usage': {'prompt_tokens': 12, 'completion_tokens': 34}}), (12, 34))
+        self.assertEqual(get_usage_from_response({}), (0, 0))
+
+    def test_aggregate_usage(self):
+        with open(self.usage_file, 'a') as f:
+            f.write(format_usage_row('2023-03-29 17:00:07', 'Tag1', 'gpt-4', 100, 50, 1.0))
+            f.write(format_usage_row('2023-03-29 17:00:22', 'Tag1', 'gpt-3.5-turbo', 200, 100, 2.0))
+            f.write(format_usage_row('2023-03-30 09:12:00', 'Tag2', 'gpt-4', 10, 10, 3.0))
+
+        by_tag = aggregate_usage(self.usage_file, by='tag')
+        self.assertEqual(list(by_tag), ['Tag1', 'Tag2'])
+        self.assertEqual(by_tag['Tag1']['requests'], 2)
+        self.assertEqual(by_tag['Tag1']['prompt_tokens'], 300)
+        self.assertAlmostEqual(by_tag['Tag1']['latency'], 1.5)
+
+        by_day = aggregate_usage(self.usage_file, by='day')
+        self.assertEqual(list(by_day), ['2023-03-29', '2023-03-30'])
+
+        by_model = aggregate_usage(self.usage_file, by='model')
+        self.assertAlmostEqual(by_model['gpt-4']['cost'], estimate_cost('gpt-4', 110, 60), places=5)
+
+    def test_aggregate_usage_missing_file(self):
+        self.assertEqual(aggregate_usage('does_not_exist.txt'), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from gptty.vectors import VectorIndex, hash_embeddings, endpoint_embeddings
+
+
+class TestVectors(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.output_file = os.path.join(self.dir.name, 'output.txt')
+
+        with open(self.output_file, 'w') as f:
+            f.write("2023-03-29 17:00:01|geo|What is the capital of Australia?|Canberra.\n")
+            f.write("2023-03-29 17:00:02|geo|What is the longest river in Africa?|The Nile.\n")
+            f.write("2023-03-29 17:00:03|lit|Who wrote Hamlet?|Shakespeare.\n")
+            f.write("2023-03-29 17:00:04|geo|How tall is Mount Everest?|About 8,849 metres.\n")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_hash_embeddings(self):
+        embeddings = hash_embeddings(['the capital of australia', 'the capital of australia', 'who wrote hamlet', ''])
+        self.assertEqual(embeddings.shape, (4, 256))
+        self.assertEqual(embeddings.dtype, np.float32)
+        self.assertAlmostEqual(float(embeddings[0] @ embeddings[1]), 1.0, places=5)
+        self.assertLess(float(embeddings[0] @ embeddings[2]), 0.5)
+        self.assertEqual(float(np.abs(embeddings[3]).sum()), 0.0)
+
+    def test_endpoint_embeddings(self):
+        response = {'data': [{'index': 1, 'embedding': [0.0, 2.0]}, {'index': 0, 'embedding': [3.0, 4.0]}]}
+        with mock.patch('openai.Embedding.create', return_value=response) as create:
+            embeddings = endpoint_embeddings(['a', 'b'], 'some-model', api_base='http://localhost:8000/v1')
+
+        create.assert_called_once_with(input=['a', 'b'], model='some-model', api_base='http://localhost:8000/v1')
+        np.testing.assert_allclose(embeddings, [[0.6, 0.8], [0.0, 1.0]])
+
+    def test_search(self):
+        index = VectorIndex.for_output_file(self.output_file)
+        self.assertEqual(index.update(self.output_file), 4)
+
+        # the most relevant turns of the tag are returned in the order they were logged
+        turns = index.query(self.output_file, 'geo', 'What is the capital city of Australia?', k=1)
+        self.assertEqual(turns, [('What is the capital of Australia?', 'Canberra.')])
+        self.assertEqual(len(index.query(self.output_file, 'geo', 'rivers', k=5)), 3)
+        self.assertEqual(index.query(self.output_file, 'missing', 'rivers'), [])
+
+    def test_update_appends(self):
+        index = VectorIndex.for_output_file(self.output_file)
+        index.update(self.output_file)
+
+        with open(self.output_file, 'a') as f:
+            f.write("2023-03-29 17:00:05|lit|Who wrote Ulysses?|James Joyce.\n")
+            f.write("2023-03-29 17:00:06|lit|Partial row")
+
+        # only new complete rows are embedded, and the index is reopened from disk
+        self.assertEqual(index.update(self.output_file), 1)
+        reopened = VectorIndex.for_output_file(self.output_file)
+        self.assertEqual(len(reopened), 5)
+        self.assertEqual(os.path.getsize(os.path.join(reopened.path, 'embeddings.f32')), 5 * 256 * 4)
+        self.assertEqual(reopened.search(self.output_file, 'lit', 'Ulysses author', k=1), [('Who wrote Ulysses?', 'James Joyce.')])
+
+    def test_shared_index(self):
+        # two handles on one index stand in for a chat and a query process sharing it
+        chat = VectorIndex.for_output_file(self.output_file)
+        query = VectorIndex.for_output_file(self.output_file)
+        self.assertEqual(chat.update(self.output_file), 4)
+
+        with open(self.output_file, 'a') as f:
+            f.write("2023-03-29 17:00:05|geo|What is the deepest lake?|Lake Baikal.\n")
+
+        # each handle picks up the rows the other has indexed rather than embedding them again
+        self.assertEqual(query.update(self.output_file), 1)
+        self.assertEqual(chat.update(self.output_file), 0)
+        self.assertEqual(len(chat.query(self.output_file, 'geo', 'lakes', k=5)), 4)
+        self.assertEqual(os.path.getsize(os.path.join(chat.path, 'tags.i32')), 5 * 4)
+
+        # a handle opened later doesn't truncate rows that the state on disk accounts for
+        self.assertEqual(len(VectorIndex.for_output_file(self.output_file)), 5)
+        self.assertEqual(os.path.getsize(os.path.join(chat.path, 'embeddings.f32')), 5 * 256 * 4)